@@ -1,17 +1,29 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, make_response
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
 from flask_migrate import Migrate
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.http import is_resource_modified
 import os
-from datetime import datetime
+import atexit
+from datetime import datetime, timedelta
+import hashlib
 import json
-from functools import wraps
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+from types import SimpleNamespace
+from functools import wraps, lru_cache
 import secrets
+from sqlalchemy.exc import IntegrityError
 
 # Импортируем настройки безопасности
 from security_config import SecurityConfig
 from security_middleware import SecurityMiddleware, require_security_headers, admin_only, rate_limit
+from text_terms import extract_terms
+from survey_schema import CompiledQuestion, CompiledSurvey
+from ip_geo import GEO_FIELDS, network_prefix, load_prefix_database
 
 app = Flask(__name__)
 
@@ -54,8 +66,14 @@ class Survey(db.Model):
     require_auth = db.Column(db.Boolean, default=False)
     require_name = db.Column(db.Boolean, default=False)  # Новый тип опроса - ввод имени
     is_active = db.Column(db.Boolean, default=True)  # Активен ли опрос
+    version = db.Column(db.Integer, nullable=False, default=1)  # Увеличивается при каждом изменении опроса
+    updated_at = db.Column(db.DateTime, nullable=True)  # Время последнего изменения (вместе с version)
+    # Счетчики ответов (обновляются в транзакции store_submissions, пересчет - recount_survey_counters)
+    response_count = db.Column(db.Integer, nullable=False, default=0)
+    answer_count = db.Column(db.Integer, nullable=False, default=0)
+    last_response_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    creator_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     
     questions = db.relationship('Question', backref='survey', lazy=True, cascade='all, delete-orphan')
     responses = db.relationship('SurveyResponse', backref='survey', lazy=True, cascade='all, delete-orphan')
@@ -78,6 +96,21 @@ class Question(db.Model):
     question_order = db.Column(db.Integer, default=0)  # Порядок вопроса
     
     answers = db.relationship('Answer', backref='question', lazy=True, cascade='all, delete-orphan')
+    option_rows = db.relationship('QuestionOption', backref='question', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (db.Index('ix_question_survey_order', 'survey_id', 'question_order'),)
+
+class QuestionOption(db.Model):
+    """Интернированный вариант ответа, строка или столбец сетки вопроса со стабильным id"""
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    kind = db.Column(db.String(10), nullable=False)  # option, other, row, column
+    position = db.Column(db.Integer, nullable=True)  # Порядок в вопросе; NULL - вариант удален из вопроса
+    label = db.Column(db.String(500), nullable=False)
+    # Прежняя подпись переименованного варианта: строка-псевдоним ссылается на вариант, который переименовали
+    alias_of_id = db.Column(db.Integer, db.ForeignKey('question_option.id'), nullable=True)
+    
+    __table_args__ = (db.Index('ix_question_option_question', 'question_id', 'kind', 'position'),)
 
 class SurveyResponse(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -85,11 +118,20 @@ class SurveyResponse(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     respondent_name = db.Column(db.String(200), nullable=True)  # Имя респондента для require_name опросов
     ip_address = db.Column(db.String(45), nullable=False)
+    network_prefix = db.Column(db.String(45), nullable=True)  # Сеть адреса: /24 для IPv4, /48 для IPv6
     user_agent = db.Column(db.Text, nullable=True)  # User Agent браузера
     completion_time = db.Column(db.Integer, nullable=True)  # Время прохождения в секундах
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     answers = db.relationship('Answer', backref='response', lazy=True, cascade='all, delete-orphan')
+    
+    # Результаты опроса (по дате), ответы пользователя и выборки за период
+    __table_args__ = (
+        db.Index('ix_survey_response_survey_created', 'survey_id', 'created_at'),
+        db.Index('ix_survey_response_user_created', 'user_id', 'created_at'),
+        db.Index('ix_survey_response_created_at', 'created_at'),
+        db.Index('ix_survey_response_survey_network', 'survey_id', 'network_prefix'),
+    )
 
 class Answer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -97,6 +139,116 @@ class Answer(db.Model):
     response_id = db.Column(db.Integer, db.ForeignKey('survey_response.id'), nullable=False)
     value = db.Column(db.Text, nullable=False)
     is_other = db.Column(db.Boolean, default=False)  # Является ли ответ "Другим вариантом"
+    # Типизированные копии value для агрегатов в SQL (заполняются при сохранении ответа)
+    value_num = db.Column(db.Integer, nullable=True)  # Оценка rating/scale; для time - минуты от полуночи
+    value_date = db.Column(db.Date, nullable=True)  # Дата для вопросов date
+    
+    selections = db.relationship('AnswerSelection', backref='answer', lazy=True, cascade='all, delete-orphan')
+    grid_cells = db.relationship('AnswerGridCell', backref='answer', lazy=True, cascade='all, delete-orphan')
+    
+    # Ответы на вопрос (аналитика) и ответы внутри одной отправки (детали ответа)
+    __table_args__ = (
+        db.Index('ix_answer_question_response', 'question_id', 'response_id'),
+        db.Index('ix_answer_response_question', 'response_id', 'question_id'),
+    )
+
+class AnswerSelection(db.Model):
+    """Выбранный вариант ответа (по строке на каждый выбор в вопросах с вариантами)"""
+    id = db.Column(db.Integer, primary_key=True)
+    answer_id = db.Column(db.Integer, db.ForeignKey('answer.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    option_id = db.Column(db.Integer, db.ForeignKey('question_option.id'), nullable=False)
+    
+    # Подсчет выборов по вопросу (GROUP BY option_id) и выборы конкретного ответа
+    __table_args__ = (
+        db.Index('ix_answer_selection_question_option', 'question_id', 'option_id'),
+        db.Index('ix_answer_selection_answer', 'answer_id'),
+    )
+
+class AnswerGridCell(db.Model):
+    """Выбранная ячейка сетки (по строке на каждую ячейку в вопросах grid/checkbox_grid)"""
+    id = db.Column(db.Integer, primary_key=True)
+    answer_id = db.Column(db.Integer, db.ForeignKey('answer.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    row_id = db.Column(db.Integer, db.ForeignKey('question_option.id'), nullable=False)
+    col_id = db.Column(db.Integer, db.ForeignKey('question_option.id'), nullable=False)
+    
+    # Тепловая карта сетки (GROUP BY row_id, col_id) и ячейки конкретного ответа
+    __table_args__ = (
+        db.Index('ix_answer_grid_cell_question_cell', 'question_id', 'row_id', 'col_id'),
+        db.Index('ix_answer_grid_cell_answer', 'answer_id'),
+    )
+
+# Агрегаты по вопросам (обновляются в транзакции submit_survey)
+class QuestionStats(db.Model):
+    """Сводные счетчики по вопросу"""
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), primary_key=True)
+    answer_count = db.Column(db.Integer, nullable=False, default=0)  # Всего ответов
+    text_count = db.Column(db.Integer, nullable=False, default=0)  # Непустых текстовых ответов
+    text_length_total = db.Column(db.Integer, nullable=False, default=0)  # Суммарная длина текстов
+    text_length_min = db.Column(db.Integer, nullable=True)
+    text_length_max = db.Column(db.Integer, nullable=True)
+    selection_answer_count = db.Column(db.Integer, nullable=False, default=0)  # Ответов со списком выборов
+    selection_total = db.Column(db.Integer, nullable=False, default=0)  # Всего выбранных вариантов
+    grid_answer_count = db.Column(db.Integer, nullable=False, default=0)  # Ответов с ячейками сетки
+    rating_count = db.Column(db.Integer, nullable=False, default=0)
+    rating_sum = db.Column(db.Integer, nullable=False, default=0)
+    rating_sumsq = db.Column(db.Integer, nullable=False, default=0)
+    rating_min = db.Column(db.Integer, nullable=True)
+    rating_max = db.Column(db.Integer, nullable=True)
+
+class QuestionOptionCount(db.Model):
+    """Количество выборов каждого варианта ответа"""
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    option_id = db.Column(db.Integer, db.ForeignKey('question_option.id'), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('question_id', 'option_id', name='uq_option_count'),)
+
+class QuestionRatingBucket(db.Model):
+    """Гистограмма оценок для rating/scale вопросов"""
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    value = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('question_id', 'value', name='uq_rating_bucket'),)
+
+class QuestionGridCount(db.Model):
+    """Количество выборов каждой ячейки сетки"""
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    row_id = db.Column(db.Integer, db.ForeignKey('question_option.id'), nullable=False)
+    col_id = db.Column(db.Integer, db.ForeignKey('question_option.id'), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (db.UniqueConstraint('question_id', 'row_id', 'col_id', name='uq_grid_count'),)
+
+class QuestionTerm(db.Model):
+    """Частоты терминов (основ слов) в текстовых ответах на вопрос"""
+    id = db.Column(db.Integer, primary_key=True)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    term = db.Column(db.String(100), nullable=False)  # Основа слова после стемминга
+    word = db.Column(db.String(100), nullable=False)  # Первая встреченная словоформа (для отображения)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    # Топ терминов вопроса читается по индексу (question_id, count)
+    __table_args__ = (
+        db.UniqueConstraint('question_id', 'term', name='uq_question_term'),
+        db.Index('ix_question_term_count', 'question_id', 'count'),
+    )
+
+class SurveyHourlyRollup(db.Model):
+    """Число отправок опроса по часам (обновляется в транзакции submit_survey)"""
+    id = db.Column(db.Integer, primary_key=True)
+    survey_id = db.Column(db.Integer, db.ForeignKey('survey.id'), nullable=False)
+    hour_bucket = db.Column(db.DateTime, nullable=False)  # created_at, усеченное до часа
+    response_count = db.Column(db.Integer, nullable=False, default=0)
+    completion_time_sum = db.Column(db.Integer, nullable=False, default=0)  # Сумма completion_time, секунды
+    completion_count = db.Column(db.Integer, nullable=False, default=0)  # Отправок с указанным completion_time
+    
+    __table_args__ = (db.UniqueConstraint('survey_id', 'hour_bucket', name='uq_survey_hourly_rollup'),)
 
 # Новые модели для аналитики
 class AnalyticsCache(db.Model):
@@ -126,19 +278,11 @@ def load_user(user_id):
 def utility_processor():
     def count_responses(surveys):
         """Подсчитывает общее количество ответов для списка опросов"""
-        total = 0
-        for survey in surveys:
-            if hasattr(survey, 'responses'):
-                total += len(survey.responses)
-        return total
+        return sum(survey.response_count or 0 for survey in surveys)
     
     def count_active_surveys(surveys):
         """Подсчитывает количество активных опросов (с ответами)"""
-        count = 0
-        for survey in surveys:
-            if hasattr(survey, 'responses') and len(survey.responses) > 0:
-                count += 1
-        return count
+        return sum(1 for survey in surveys if survey.response_count)
     
     def format_date(date_obj):
         """Форматирует дату в удобочитаемый вид"""
@@ -240,6 +384,944 @@ def survey_creation_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+# ==================== АГРЕГАТЫ ПО ВОПРОСАМ ====================
+
+OTHER_OPTION_KEY = '__other__'  # Ключ счетчика для "Другого варианта"
+CHOICE_QUESTION_TYPES = ['single_choice', 'multiple_choice', 'dropdown', 'checkbox']
+RATING_QUESTION_TYPES = ['rating', 'scale']
+GRID_QUESTION_TYPES = ['grid', 'checkbox_grid']
+TEXT_QUESTION_TYPES = ['text', 'text_paragraph']
+TYPED_QUESTION_TYPES = RATING_QUESTION_TYPES + ['date', 'time']  # Ответы с value_num/value_date
+
+def parse_json_list(json_string):
+    """Безопасно разбирает JSON список (варианты ответов, строки и столбцы сетки)"""
+    try:
+        value = json.loads(json_string) if json_string else []
+    except (json.JSONDecodeError, TypeError):
+        return []
+    return value if isinstance(value, list) else []
+
+def parse_selected_options(value):
+    """Возвращает список выбранных вариантов, если ответ сохранен JSON массивом"""
+    if not value or not value.startswith('['):
+        return None
+    try:
+        selected = json.loads(value)
+    except (json.JSONDecodeError, ValueError):
+        return None
+    return selected if isinstance(selected, list) else None
+
+def typed_answer_values(question_type, value):
+    """Типизированные значения ответа (value_num, value_date); None, если текст не разбирается"""
+    if not value:
+        return None, None
+    if question_type in RATING_QUESTION_TYPES:
+        return (int(value) if value.isdigit() else None), None
+    if question_type == 'date':
+        try:
+            return None, datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            return None, None
+    if question_type == 'time':
+        for time_format in ('%H:%M', '%H:%M:%S'):
+            try:
+                parsed = datetime.strptime(value, time_format)
+            except ValueError:
+                continue
+            return parsed.hour * 60 + parsed.minute, None
+    return None, None
+
+def parse_grid_cells(value):
+    """Разбирает ответ сетки ("строка|столбец" или JSON массив таких строк) в пары"""
+    if not value:
+        return []
+    cells = parse_selected_options(value)
+    if cells is None:
+        cells = [value]
+    return [tuple(cell.split('|', 1)) for cell in cells if isinstance(cell, str) and '|' in cell]
+
+# Варианты ответов, строки и столбцы сетки хранятся строками QuestionOption со стабильными id:
+# выборы и счетчики ссылаются на id, поэтому переименование варианта не отрывает старые ответы
+OPTION_KINDS = ('option', 'other', 'row', 'column')
+
+def question_option_labels(question):
+    """Текущие подписи вопроса по видам (из JSON полей options, grid_rows, grid_columns)"""
+    labels = {kind: [] for kind in OPTION_KINDS}
+    if question.type in CHOICE_QUESTION_TYPES:
+        labels['option'] = [label for label in parse_json_list(question.options) if isinstance(label, str)]
+        labels['other'] = [question.other_text or 'Другой вариант']
+    elif question.type in GRID_QUESTION_TYPES:
+        labels['row'] = [label for label in parse_json_list(question.grid_rows) if isinstance(label, str)]
+        labels['column'] = [label for label in parse_json_list(question.grid_columns) if isinstance(label, str)]
+    return labels
+
+class QuestionOptionIds:
+    """Интернированные варианты одного вопроса: подпись -> id по видам и id -> подпись"""
+
+    def __init__(self, rows):
+        self.ids = {kind: {} for kind in OPTION_KINDS}
+        self.known_ids = {kind: {} for kind in OPTION_KINDS}  # То же вместе с удаленными вариантами
+        self.order = {kind: [] for kind in OPTION_KINDS}  # id действующих строк по порядку
+        self.labels = {}  # id -> подпись, включая удаленные из вопроса варианты
+        for row in sorted(rows, key=lambda row: (row.position is None, row.position or 0)):
+            if row.alias_of_id is not None:
+                continue
+            self.labels[row.id] = row.label
+            self.known_ids[row.kind].setdefault(row.label, row.id)
+            if row.position is not None:
+                self.order[row.kind].append(row.id)
+                self.ids[row.kind].setdefault(row.label, row.id)
+        # Прежние подписи переименованных вариантов - для ответов, сохраненных до переименования
+        for row in rows:
+            if row.alias_of_id is not None:
+                self.known_ids[row.kind].setdefault(row.label, row.alias_of_id)
+
+    @property
+    def other_id(self):
+        return self.order['other'][0] if self.order['other'] else None
+
+    def active_labels(self):
+        return {kind: [self.labels[option_id] for option_id in ids] for kind, ids in self.order.items()}
+
+    def selected_ids(self, value, is_other, selected=None, include_retired=False):
+        """id выбранных вариантов ответа (неизвестный вариант учитывается только при is_other)
+        
+        include_retired - сопоставлять и с удаленными из вопроса вариантами (пересчет сохраненных ответов).
+        """
+        if selected is None:
+            selected = parse_selected_options(value)
+        ids = self.known_ids['option'] if include_retired else self.ids['option']
+        option_ids = []
+        for option in (selected if selected is not None else [value]):
+            if not isinstance(option, str):
+                continue
+            option_id = ids.get(option)
+            if option_id is not None:
+                option_ids.append(option_id)
+            elif (is_other or option == 'other') and self.other_id is not None:
+                option_ids.append(self.other_id)
+        return option_ids
+
+    def cell_ids(self, value, include_retired=False):
+        """Пары (id строки, id столбца) выбранных ячеек сетки; ячейки вне сетки не учитываются"""
+        ids = self.known_ids if include_retired else self.ids
+        cells = []
+        for row, col in parse_grid_cells(value):
+            row_id = ids['row'].get(row)
+            col_id = ids['column'].get(col)
+            if row_id is not None and col_id is not None:
+                cells.append((row_id, col_id))
+        return cells
+
+def sync_question_options(question, rows=None, label_ids=None):
+    """Приводит строки QuestionOption к текущим спискам вопроса.
+    
+    Подпись, уже встречавшаяся в вопросе, сохраняет свой id (в том числе при
+    перестановке и возврате удаленного варианта); новая подпись получает новую
+    строку. Исчезнувшие варианты не удаляются, а помечаются position = NULL.
+    
+    Переименование задается только явно: label_ids - {вид: [id строки или None
+    для каждой подписи]} из формы редактирования. Переименованная строка сохраняет
+    id, поэтому выборы и счетчики остаются привязанными, а прежняя подпись
+    сохраняется строкой-псевдонимом для пересчета выборов по тексту ответов.
+    Сохраненные ответы (Answer.value) не меняются.
+    """
+    rows = list(QuestionOption.query.filter_by(question_id=question.id) if rows is None else rows)
+    label_ids = label_ids or {}
+    for kind, labels in question_option_labels(question).items():
+        kind_rows = [row for row in rows if row.kind == kind]
+        options = [row for row in kind_rows if row.alias_of_id is None]
+        aliases = {(row.alias_of_id, row.label) for row in kind_rows if row.alias_of_id is not None}
+        unused = {row.id: row for row in options}
+        by_label = {}
+        for row in sorted(options, key=lambda row: row.position is None):
+            by_label.setdefault(row.label, row)
+        if kind == 'other':
+            # "Другой вариант" у вопроса один: смена его текста - всегда переименование
+            explicit = [row.id for row in sorted(options, key=lambda row: row.position or 0) if row.position is not None]
+        else:
+            explicit = label_ids.get(kind) or []
+
+        assigned = [None] * len(labels)
+        for position, label in enumerate(labels):
+            option_id = explicit[position] if position < len(explicit) else None
+            row = unused.pop(option_id, None) if isinstance(option_id, int) else None
+            if row is None:
+                continue
+            if row.label != label:
+                if (row.id, row.label) not in aliases:
+                    alias = QuestionOption(question_id=question.id, kind=kind, label=row.label, alias_of_id=row.id)
+                    db.session.add(alias)
+                    rows.append(alias)
+                    aliases.add((row.id, row.label))
+                row.label = label
+            assigned[position] = row
+        for position, label in enumerate(labels):
+            if assigned[position] is not None:
+                continue
+            row = by_label.get(label)
+            if row is not None and row.id in unused:
+                row = unused.pop(row.id)
+            else:
+                row = QuestionOption(question_id=question.id, kind=kind, label=label)
+                db.session.add(row)
+                rows.append(row)
+            assigned[position] = row
+
+        for position, row in enumerate(assigned):
+            row.position = position
+        for row in unused.values():
+            row.position = None
+    db.session.flush()
+    return QuestionOptionIds(rows)
+
+def _load_option_rows(questions):
+    """Строки QuestionOption набора вопросов одним запросом: question_id -> строки"""
+    rows_by_question = defaultdict(list)
+    question_ids = [question.id for question in questions]
+    if question_ids:
+        for row in QuestionOption.query.filter(QuestionOption.question_id.in_(question_ids)):
+            rows_by_question[row.question_id].append(row)
+    return rows_by_question
+
+def load_question_option_ids(questions):
+    """Интернированные варианты набора вопросов одним запросом (только чтение, без commit)
+    
+    Вопросы, измененные в обход create/edit_survey, синхронизируются не здесь, а
+    sync_drifted_question_options (migrate_database.py, maintenance.py sync-options).
+    """
+    questions = list(questions)
+    if not questions:
+        return {}
+    rows_by_question = _load_option_rows(questions)
+    result = {}
+    for question in questions:
+        option_ids = QuestionOptionIds(rows_by_question[question.id])
+        if option_ids.active_labels() != question_option_labels(question):
+            print(f"⚠️  Варианты вопроса {question.id} не совпадают со словарем вариантов, "
+                  f"выполните maintenance.py sync-options")
+        result[question.id] = option_ids
+    return result
+
+def sync_drifted_question_options(survey_id=None):
+    """Синхронизирует словарь вариантов вопросов, измененных в обход create/edit_survey (скрипты, старые данные)
+    
+    Версия затронутых опросов увеличивается, чтобы процессы перестроили схемы опросов.
+    Возвращает число синхронизированных вопросов.
+    """
+    query = Question.query
+    if survey_id is not None:
+        query = query.filter_by(survey_id=survey_id)
+    questions = query.all()
+    rows_by_question = _load_option_rows(questions)
+    survey_ids = set()
+    synced = 0
+    for question in questions:
+        rows = rows_by_question[question.id]
+        if QuestionOptionIds(rows).active_labels() != question_option_labels(question):
+            sync_question_options(question, rows)
+            survey_ids.add(question.survey_id)
+            synced += 1
+    if survey_ids:
+        db.session.execute(db.update(Survey).where(Survey.id.in_(survey_ids)).values(
+            version=db.func.coalesce(Survey.version, 1) + 1
+        ).execution_options(synchronize_session=False))
+    db.session.commit()
+    for changed_survey_id in survey_ids:
+        invalidate_compiled_survey(changed_survey_id)
+    return synced
+
+class AggregateDeltas:
+    """Накопитель изменений агрегатов по вопросам для одной или нескольких отправок"""
+
+    def __init__(self, count_values=True):
+        # False - счетчики вариантов, ячеек сетки и оценок задаются группировкой
+        # AnswerSelection, AnswerGridCell и Answer.value_num
+        self.count_values = count_values
+        self.stats = defaultdict(Counter)
+        self.bounds = {}  # (question_id, поле) -> (минимум, максимум)
+        self.options = Counter()
+        self.ratings = Counter()
+        self.grid = Counter()
+        self.terms = Counter()
+        self.term_words = {}  # (question_id, основа) -> словоформа для новой строки
+
+    def add_answer(self, question, value, is_other, option_ids=None):
+        """Учитывает один ответ на вопрос.
+        
+        Для вопросов с вариантами возвращает id выбранных вариантов, для сеток -
+        пары id (строка, столбец) выбранных ячеек.
+        """
+        question_id = question.id
+        stats = self.stats[question_id]
+        stats['answer_count'] += 1
+
+        if question.type in CHOICE_QUESTION_TYPES:
+            selected = parse_selected_options(value)
+            if selected is not None:
+                stats['selection_answer_count'] += 1
+                stats['selection_total'] += len(selected)
+            if not self.count_values:
+                return None
+            if option_ids is None:
+                option_ids = load_question_option_ids([question])[question_id]
+            selected_ids = option_ids.selected_ids(value, is_other, selected)
+            for option_id in selected_ids:
+                self.add_option(question_id, option_id)
+            return selected_ids
+
+        elif question.type in RATING_QUESTION_TYPES:
+            if self.count_values and value and value.isdigit():
+                self.add_rating(question_id, int(value))
+
+        elif question.type in GRID_QUESTION_TYPES:
+            if value and '|' in value:
+                stats['grid_answer_count'] += 1
+            if not self.count_values:
+                return None
+            if option_ids is None:
+                option_ids = load_question_option_ids([question])[question_id]
+            cells = option_ids.cell_ids(value)
+            for row_id, col_id in cells:
+                self.add_grid_cell(question_id, row_id, col_id)
+            return cells
+
+        elif question.type in TEXT_QUESTION_TYPES:
+            if value and value.strip():
+                stats['text_count'] += 1
+                stats['text_length_total'] += len(value)
+                self._extend_bounds(question_id, 'text_length', len(value))
+                for term, word in extract_terms(value):
+                    self.terms[(question_id, term)] += 1
+                    self.term_words.setdefault((question_id, term), word)
+
+    def add_option(self, question_id, option_id, count=1):
+        """Учитывает выбор варианта по его id (QuestionOption)"""
+        self.options[(question_id, option_id)] += count
+
+    def add_rating(self, question_id, rating, count=1):
+        """Учитывает оценку rating/scale (count одинаковых оценок)"""
+        stats = self.stats[question_id]
+        stats['rating_count'] += count
+        stats['rating_sum'] += rating * count
+        stats['rating_sumsq'] += rating * rating * count
+        self.ratings[(question_id, rating)] += count
+        self._extend_bounds(question_id, 'rating', rating)
+
+    def add_grid_cell(self, question_id, row_id, col_id, count=1):
+        """Учитывает выбор ячейки сетки по id строки и столбца (QuestionOption)"""
+        self.grid[(question_id, row_id, col_id)] += count
+
+    def _extend_bounds(self, question_id, field, value):
+        low, high = self.bounds.get((question_id, field), (value, value))
+        self.bounds[(question_id, field)] = (min(low, value), max(high, value))
+
+    def apply(self):
+        """Применяет накопленные изменения в текущей транзакции"""
+        for question_id, fields in self.stats.items():
+            increments = dict(fields)
+            bounds = {}
+            for field in ('rating', 'text_length'):
+                if (question_id, field) in self.bounds:
+                    low, high = self.bounds[(question_id, field)]
+                    bounds[f'{field}_min'] = ('min', low)
+                    bounds[f'{field}_max'] = ('max', high)
+            _upsert_counters(QuestionStats, {'question_id': question_id}, increments, bounds)
+
+        for (question_id, option_id), count in self.options.items():
+            _upsert_counters(QuestionOptionCount, {'question_id': question_id, 'option_id': option_id}, {'count': count})
+        for (question_id, rating), count in self.ratings.items():
+            _upsert_counters(QuestionRatingBucket, {'question_id': question_id, 'value': rating}, {'count': count})
+        for (question_id, row_id, col_id), count in self.grid.items():
+            _upsert_counters(QuestionGridCount, {'question_id': question_id, 'row_id': row_id, 'col_id': col_id}, {'count': count})
+        for (question_id, term), count in self.terms.items():
+            _upsert_counters(QuestionTerm, {'question_id': question_id, 'term': term}, {'count': count},
+                             defaults={'word': self.term_words[(question_id, term)]})
+
+def _upsert_counters(model, key, increments, bounds=None, defaults=None):
+    """Увеличивает счетчики строки агрегата, создавая ее при отсутствии (defaults - поля новой строки)"""
+    bounds = bounds or {}
+    values = {getattr(model, field): getattr(model, field) + amount for field, amount in increments.items()}
+    for field, (kind, value) in bounds.items():
+        column = getattr(model, field)
+        replace = column > value if kind == 'min' else column < value
+        values[column] = db.case((column.is_(None), value), (replace, value), else_=column)
+
+    query = model.query.filter_by(**key)
+    if query.update(values, synchronize_session=False):
+        return
+
+    initial = dict(key, **increments)
+    initial.update({field: value for field, (kind, value) in bounds.items()})
+    initial.update(defaults or {})
+    try:
+        with db.session.begin_nested():
+            db.session.add(model(**initial))
+    except IntegrityError:
+        # Строку успели создать в параллельной транзакции
+        query.update(values, synchronize_session=False)
+
+def _question_stats_dict(stats):
+    """Преобразует строку QuestionStats в словарь с нулевыми значениями по умолчанию"""
+    fields = ['answer_count', 'text_count', 'text_length_total', 'selection_answer_count',
+              'selection_total', 'grid_answer_count', 'rating_count', 'rating_sum', 'rating_sumsq']
+    result = {field: (getattr(stats, field) or 0) if stats else 0 for field in fields}
+    for field in ('text_length_min', 'text_length_max', 'rating_min', 'rating_max'):
+        result[field] = getattr(stats, field) if stats else None
+    return result
+
+def load_question_aggregates(question_ids):
+    """Загружает агрегаты для набора вопросов (несколько запросов независимо от числа ответов)"""
+    aggregates = {
+        question_id: {'stats': _question_stats_dict(None), 'options': {}, 'ratings': {}, 'grid': {}}
+        for question_id in question_ids
+    }
+    if not aggregates:
+        return aggregates
+
+    ids = list(aggregates.keys())
+    for stats in QuestionStats.query.filter(QuestionStats.question_id.in_(ids)):
+        aggregates[stats.question_id]['stats'] = _question_stats_dict(stats)
+    # Счетчики хранятся по id варианта, наружу отдаются по текущей подписи
+    option_rows = db.session.query(
+        QuestionOptionCount.question_id, QuestionOption.kind, QuestionOption.label, QuestionOptionCount.count
+    ).join(QuestionOption, QuestionOptionCount.option_id == QuestionOption.id).filter(
+        QuestionOptionCount.question_id.in_(ids)
+    ).order_by(QuestionOptionCount.id)
+    for question_id, kind, label, count in option_rows:
+        options = aggregates[question_id]['options']
+        key = OTHER_OPTION_KEY if kind == 'other' else label
+        options[key] = options.get(key, 0) + count
+    for row in QuestionRatingBucket.query.filter(QuestionRatingBucket.question_id.in_(ids)).order_by(QuestionRatingBucket.value):
+        aggregates[row.question_id]['ratings'][row.value] = row.count
+    row_option = db.aliased(QuestionOption)
+    col_option = db.aliased(QuestionOption)
+    grid_rows = db.session.query(
+        QuestionGridCount.question_id, row_option.label, col_option.label, QuestionGridCount.count
+    ).join(row_option, QuestionGridCount.row_id == row_option.id).join(
+        col_option, QuestionGridCount.col_id == col_option.id
+    ).filter(QuestionGridCount.question_id.in_(ids)).order_by(QuestionGridCount.id)
+    for question_id, row_label, col_label, count in grid_rows:
+        grid = aggregates[question_id]['grid']
+        grid[(row_label, col_label)] = grid.get((row_label, col_label), 0) + count
+    return aggregates
+
+@lru_cache(maxsize=1024)
+def _load_top_terms(question_id, text_count, limit):
+    """Топ терминов вопроса; text_count в ключе сбрасывает запомненный результат при новых ответах"""
+    rows = db.session.query(QuestionTerm.word, QuestionTerm.count).filter(
+        QuestionTerm.question_id == question_id
+    ).order_by(QuestionTerm.count.desc(), QuestionTerm.id).limit(limit).all()
+    return tuple((word, count) for word, count in rows)
+
+def load_top_terms(question_id, text_count, limit=10):
+    """Самые частые термины текстовых ответов на вопрос (список пар (слово, количество))"""
+    return list(_load_top_terms(question_id, text_count, limit))
+
+def delete_question_aggregates(question_ids):
+    """Удаляет агрегаты указанных вопросов"""
+    if not question_ids:
+        return
+    for model in (QuestionStats, QuestionOptionCount, QuestionRatingBucket, QuestionGridCount, QuestionTerm):
+        model.query.filter(model.question_id.in_(question_ids)).delete(synchronize_session=False)
+
+def rebuild_question_aggregates(survey_id=None, question_ids=None):
+    """Пересчитывает агрегаты по исходным строкам Answer, AnswerSelection и AnswerGridCell"""
+    query = Question.query
+    if survey_id is not None:
+        query = query.filter_by(survey_id=survey_id)
+    if question_ids is not None:
+        query = query.filter(Question.id.in_(list(question_ids)))
+    questions = query.all()
+
+    delete_question_aggregates([q.id for q in questions])
+
+    # Счетчики вариантов, ячеек сетки и оценок - группировкой AnswerSelection, AnswerGridCell
+    # и Answer.value_num, остальные агрегаты - по ответам
+    deltas = AggregateDeltas(count_values=False)
+    choice_ids = [question.id for question in questions if question.type in CHOICE_QUESTION_TYPES]
+    for question_id, option_id, count in count_option_selections(choice_ids):
+        deltas.add_option(question_id, option_id, count)
+    grid_ids = [question.id for question in questions if question.type in GRID_QUESTION_TYPES]
+    for question_id, row_id, col_id, count in count_grid_cells(grid_ids):
+        deltas.add_grid_cell(question_id, row_id, col_id, count)
+    rating_ids = [question.id for question in questions if question.type in RATING_QUESTION_TYPES]
+    for question_id, rating, count in count_rating_values(rating_ids):
+        deltas.add_rating(question_id, rating, count)
+
+    for question in questions:
+        rows = db.session.query(Answer.value, Answer.is_other).filter(
+            Answer.question_id == question.id
+        ).yield_per(1000)
+        for value, is_other in rows:
+            deltas.add_answer(question, value, is_other)
+
+    deltas.apply()
+    db.session.commit()
+    _load_top_terms.cache_clear()
+    return len(questions)
+
+def count_option_selections(question_ids):
+    """Число выборов каждого варианта: тройки (question_id, option_id, количество)"""
+    if not question_ids:
+        return []
+    return db.session.query(
+        AnswerSelection.question_id, AnswerSelection.option_id, db.func.count(AnswerSelection.id)
+    ).filter(
+        AnswerSelection.question_id.in_(list(question_ids))
+    ).group_by(AnswerSelection.question_id, AnswerSelection.option_id).all()
+
+def count_grid_cells(question_ids):
+    """Число выборов каждой ячейки сетки: четверки (question_id, row_id, col_id, количество)"""
+    if not question_ids:
+        return []
+    return db.session.query(
+        AnswerGridCell.question_id, AnswerGridCell.row_id, AnswerGridCell.col_id, db.func.count(AnswerGridCell.id)
+    ).filter(
+        AnswerGridCell.question_id.in_(list(question_ids))
+    ).group_by(AnswerGridCell.question_id, AnswerGridCell.row_id, AnswerGridCell.col_id).all()
+
+def count_rating_values(question_ids):
+    """Гистограмма оценок: тройки (question_id, оценка, количество) группировкой по value_num"""
+    if not question_ids:
+        return []
+    return db.session.query(
+        Answer.question_id, Answer.value_num, db.func.count(Answer.id)
+    ).filter(
+        Answer.question_id.in_(list(question_ids)), Answer.value_num.isnot(None)
+    ).group_by(Answer.question_id, Answer.value_num).all()
+
+def rebuild_typed_answer_values(survey_id=None, question_ids=None, batch_size=5000):
+    """Заполняет value_num/value_date по тексту ответов (ответы, сохраненные до появления полей)"""
+    query = Question.query
+    if survey_id is not None:
+        query = query.filter_by(survey_id=survey_id)
+    if question_ids is not None:
+        query = query.filter(Question.id.in_(list(question_ids)))
+
+    updated = 0
+    for question in query.all():
+        if question.type not in TYPED_QUESTION_TYPES:
+            # Тип вопроса сменился - типизированные значения больше не действительны
+            result = db.session.execute(db.update(Answer).where(
+                Answer.question_id == question.id,
+                db.or_(Answer.value_num.isnot(None), Answer.value_date.isnot(None))
+            ).values(value_num=None, value_date=None).execution_options(synchronize_session=False))
+            updated += result.rowcount
+            continue
+
+        # Пачки по id (keyset), обновление - executemany по первичному ключу
+        last_id = 0
+        while True:
+            batch = db.session.query(Answer.id, Answer.value).filter(
+                Answer.question_id == question.id, Answer.id > last_id
+            ).order_by(Answer.id).limit(batch_size).all()
+            if not batch:
+                break
+            rows = []
+            for answer_id, value in batch:
+                value_num, value_date = typed_answer_values(question.type, value)
+                rows.append({'id': answer_id, 'value_num': value_num, 'value_date': value_date})
+            db.session.execute(db.update(Answer), rows)
+            updated += len(rows)
+            last_id = batch[-1][0]
+    db.session.commit()
+    return updated
+
+def answer_selection_rows(question, answer_id, selected):
+    """Строки AnswerSelection или AnswerGridCell для результата AggregateDeltas.add_answer"""
+    if question.type in GRID_QUESTION_TYPES:
+        return [{'answer_id': answer_id, 'question_id': question.id, 'row_id': row_id, 'col_id': col_id}
+                for row_id, col_id in selected]
+    return [{'answer_id': answer_id, 'question_id': question.id, 'option_id': option_id} for option_id in selected]
+
+def rebuild_answer_selections(survey_id=None, question_ids=None, batch_size=5000):
+    """Заполняет AnswerSelection и AnswerGridCell заново по исходным строкам Answer.
+    
+    Ответы сопоставляются с подписями вариантов, строк и столбцов сетки, включая удаленные
+    из вопроса (их выборы и счетчики сохраняются); ответы, сохраненные до переименования
+    варианта, находятся по его прежней подписи (строке-псевдониму).
+    """
+    query = Question.query.filter(Question.type.in_(CHOICE_QUESTION_TYPES + GRID_QUESTION_TYPES))
+    if survey_id is not None:
+        query = query.filter_by(survey_id=survey_id)
+    if question_ids is not None:
+        query = query.filter(Question.id.in_(list(question_ids)))
+    questions = query.all()
+    if not questions:
+        return 0
+    option_ids_by_question = load_question_option_ids(questions)
+
+    for model in (AnswerSelection, AnswerGridCell):
+        model.query.filter(model.question_id.in_(list(option_ids_by_question))).delete(synchronize_session=False)
+
+    inserted = 0
+    pending = {AnswerSelection: [], AnswerGridCell: []}
+    for question in questions:
+        option_ids = option_ids_by_question[question.id]
+        model = AnswerGridCell if question.type in GRID_QUESTION_TYPES else AnswerSelection
+        rows = pending[model]
+        answers = db.session.query(Answer.id, Answer.value, Answer.is_other).filter(
+            Answer.question_id == question.id
+        ).yield_per(batch_size)
+        for answer_id, value, is_other in answers:
+            if model is AnswerGridCell:
+                selected = option_ids.cell_ids(value, include_retired=True)
+            else:
+                selected = option_ids.selected_ids(value, is_other, include_retired=True)
+            rows.extend(answer_selection_rows(question, answer_id, selected))
+            if len(rows) >= batch_size:
+                db.session.execute(db.insert(model), rows)
+                inserted += len(rows)
+                rows.clear()
+    for model, rows in pending.items():
+        if rows:
+            db.session.execute(db.insert(model), rows)
+            inserted += len(rows)
+    db.session.commit()
+    return inserted
+
+def recount_survey_counters(survey_id=None):
+    """Пересчитывает счетчики ответов опросов по исходным строкам одним UPDATE"""
+    response_count = db.select(db.func.count(SurveyResponse.id)).where(
+        SurveyResponse.survey_id == Survey.id
+    ).scalar_subquery()
+    last_response_at = db.select(db.func.max(SurveyResponse.created_at)).where(
+        SurveyResponse.survey_id == Survey.id
+    ).scalar_subquery()
+    answer_count = db.select(db.func.count(Answer.id)).join(
+        SurveyResponse, Answer.response_id == SurveyResponse.id
+    ).where(SurveyResponse.survey_id == Survey.id).scalar_subquery()
+    
+    statement = db.update(Survey).values(
+        response_count=response_count,
+        answer_count=answer_count,
+        last_response_at=last_response_at
+    )
+    if survey_id is not None:
+        statement = statement.where(Survey.id == survey_id)
+    result = db.session.execute(statement.execution_options(synchronize_session=False))
+    db.session.commit()
+    return result.rowcount
+
+def hour_bucket_start(moment):
+    """Начало часа, к которому относится момент времени (ключ SurveyHourlyRollup)"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def rebuild_hourly_rollup(survey_id=None):
+    """Пересчитывает почасовую сводку отправок группировкой SurveyResponse в БД"""
+    bucket = time_bucket(SurveyResponse.created_at, 'day_hour')
+    has_time = db.and_(SurveyResponse.completion_time.isnot(None), SurveyResponse.completion_time > 0)
+    query = db.session.query(
+        SurveyResponse.survey_id, bucket, db.func.count(SurveyResponse.id),
+        db.func.coalesce(db.func.sum(db.case((has_time, SurveyResponse.completion_time), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((has_time, 1), else_=0)), 0)
+    ).filter(SurveyResponse.created_at.isnot(None)).group_by(SurveyResponse.survey_id, bucket)
+    delete_query = SurveyHourlyRollup.query
+    if survey_id is not None:
+        query = query.filter(SurveyResponse.survey_id == survey_id)
+        delete_query = delete_query.filter_by(survey_id=survey_id)
+    
+    rows = [{
+        'survey_id': row_survey_id,
+        'hour_bucket': datetime.strptime(hour, '%Y-%m-%d %H'),
+        'response_count': count,
+        'completion_time_sum': completion_sum,
+        'completion_count': completion_count
+    } for row_survey_id, hour, count, completion_sum, completion_count in query.all()]
+    
+    delete_query.delete(synchronize_session=False)
+    if rows:
+        db.session.execute(db.insert(SurveyHourlyRollup), rows)
+    db.session.commit()
+    return len(rows)
+
+# ==================== СОХРАНЕНИЕ ОТВЕТОВ ====================
+
+SUBMISSION_RESPONSE_FIELDS = ['survey_id', 'user_id', 'respondent_name', 'ip_address',
+                              'user_agent', 'completion_time', 'created_at']
+
+def store_submissions(submissions, questions_by_id=None, option_ids_by_question=None):
+    """Сохраняет отправки опросов одной транзакцией с одним commit.
+    
+    Строки SurveyResponse и Answer вставляются пакетными INSERT с RETURNING,
+    выбранные варианты и ячейки сетки - executemany по таблице, агрегаты,
+    поисковый индекс и кеш обновляются в той же транзакции. questions_by_id и
+    option_ids_by_question можно передать из скомпилированной схемы опроса.
+    """
+    if not submissions:
+        return []
+    
+    # Проверка/создание поискового индекса - до начала записи (DDL в отдельном соединении)
+    search_enabled = answer_search_available()
+    
+    if questions_by_id is None:
+        question_ids = {answer['question_id'] for submission in submissions for answer in submission['answers']}
+        questions = Question.query.filter(Question.id.in_(question_ids)).all() if question_ids else []
+        questions_by_id = {question.id: question for question in questions}
+    
+    # id вариантов и ячеек сетки (синхронизация словаря вариантов, если нужна, фиксируется до записи ответов)
+    if option_ids_by_question is None:
+        option_ids_by_question = load_question_option_ids(
+            question for question in questions_by_id.values()
+            if question.type in CHOICE_QUESTION_TYPES or question.type in GRID_QUESTION_TYPES
+        )
+    
+    try:
+        responses = [SurveyResponse(network_prefix=network_prefix(submission.get('ip_address')),
+                                    **{field: submission.get(field) for field in SUBMISSION_RESPONSE_FIELDS})
+                     for submission in submissions]
+        db.session.add_all(responses)
+        db.session.flush()
+        response_ids = [response.id for response in responses]
+        
+        answer_rows = []
+        answer_selections = []  # (вопрос, выбранные варианты или ячейки) для каждой строки answer_rows
+        deltas = AggregateDeltas()
+        survey_counters = {}
+        hourly_counters = defaultdict(Counter)
+        for response, submission in zip(responses, submissions):
+            response_id = response.id
+            counters = survey_counters.setdefault(response.survey_id, {'responses': 0, 'answers': 0, 'last': None})
+            counters['responses'] += 1
+            if counters['last'] is None or response.created_at > counters['last']:
+                counters['last'] = response.created_at
+            hourly = hourly_counters[(response.survey_id, hour_bucket_start(response.created_at))]
+            hourly['response_count'] += 1
+            if response.completion_time:
+                hourly['completion_time_sum'] += response.completion_time
+                hourly['completion_count'] += 1
+            for answer in submission['answers']:
+                question = questions_by_id.get(answer['question_id'])
+                if question is None:
+                    continue  # Вопрос удалили после отправки формы
+                value_num, value_date = typed_answer_values(question.type, answer['value'])
+                answer_rows.append({
+                    'question_id': question.id,
+                    'response_id': response_id,
+                    'value': answer['value'],
+                    'is_other': answer['is_other'],
+                    'value_num': value_num,
+                    'value_date': value_date
+                })
+                counters['answers'] += 1
+                selected = deltas.add_answer(question, answer['value'], answer['is_other'],
+                                             option_ids_by_question.get(question.id))
+                answer_selections.append((question, selected or ()))
+        
+        if answer_rows:
+            # RETURNING в порядке параметров - id ответов для строк выбранных вариантов и ячеек
+            answer_ids = db.session.scalars(
+                db.insert(Answer).returning(Answer.id, sort_by_parameter_order=True), answer_rows
+            ).all()
+            selection_rows = {AnswerSelection: [], AnswerGridCell: []}
+            for answer_id, (question, selected) in zip(answer_ids, answer_selections):
+                if selected:
+                    model = AnswerGridCell if question.type in GRID_QUESTION_TYPES else AnswerSelection
+                    selection_rows[model].extend(answer_selection_rows(question, answer_id, selected))
+            for model, rows in selection_rows.items():
+                if rows:
+                    db.session.execute(db.insert(model), rows)
+            if search_enabled:
+                index_answers_for_search(db.session, response_ids)
+        deltas.apply()
+        for (survey_id, hour_bucket), increments in hourly_counters.items():
+            _upsert_counters(SurveyHourlyRollup, {'survey_id': survey_id, 'hour_bucket': hour_bucket}, dict(increments))
+        for survey_id, counters in survey_counters.items():
+            # Инкремент в SQL, чтобы параллельные транзакции не теряли обновления
+            db.session.execute(db.update(Survey).where(Survey.id == survey_id).values(
+                response_count=Survey.response_count + counters['responses'],
+                answer_count=Survey.answer_count + counters['answers'],
+                last_response_at=db.case(
+                    (db.or_(Survey.last_response_at.is_(None), Survey.last_response_at < counters['last']), counters['last']),
+                    else_=Survey.last_response_at
+                )
+            ).execution_options(synchronize_session=False))
+            invalidate_survey_cache(survey_id)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    
+    return response_ids
+
+# ==================== ОЧЕРЕДЬ ОТЛОЖЕННОЙ ЗАПИСИ ====================
+
+_submission_queue = None
+_submission_queue_lock = threading.Lock()
+
+def _flush_queued_submissions(submissions):
+    """Записывает пачку отправок из очереди в основную БД"""
+    with app.app_context():
+        survey_ids = {submission['survey_id'] for submission in submissions}
+        existing = {row[0] for row in db.session.query(Survey.id).filter(Survey.id.in_(survey_ids))}
+        batch = []
+        for submission in submissions:
+            if submission['survey_id'] not in existing:
+                print(f"⚠️  Опрос {submission['survey_id']} удален, отправка из очереди пропущена")
+                continue
+            submission = dict(submission)
+            submission['created_at'] = datetime.fromisoformat(submission['created_at'])
+            batch.append(submission)
+        store_submissions(batch)
+
+def get_submission_queue():
+    """Возвращает очередь отправок процесса (создается и запускается при первом обращении)"""
+    global _submission_queue
+    if _submission_queue is not None:
+        return _submission_queue
+    with _submission_queue_lock:
+        if _submission_queue is None:
+            from submission_queue import SubmissionQueue
+            
+            path = app.config.get('SUBMISSION_QUEUE_PATH', 'submission_queue.db')
+            if not os.path.isabs(path):
+                path = os.path.join(app.instance_path, path)
+            queue = SubmissionQueue(
+                path,
+                _flush_queued_submissions,
+                batch_size=app.config.get('SUBMISSION_QUEUE_BATCH_SIZE', 200),
+                max_latency=app.config.get('SUBMISSION_QUEUE_MAX_LATENCY', 2.0)
+            )
+            queue.start()
+            # При штатной остановке процесса дописываем остаток очереди
+            atexit.register(queue.stop)
+            _submission_queue = queue
+    return _submission_queue
+
+@app.before_request
+def start_submission_queue():
+    """Запускает обработчик очереди при первом запросе, чтобы дописать отправки, оставшиеся после падения"""
+    if app.config.get('SUBMISSION_QUEUE_ENABLED') and _submission_queue is None:
+        get_submission_queue()
+
+def enqueue_submission(submission):
+    """Ставит отправку в очередь; запись в основную БД выполнит фоновый поток"""
+    submission = dict(submission)
+    submission['created_at'] = submission['created_at'].isoformat()
+    return get_submission_queue().enqueue(submission)
+
+# ==================== КЕШ АНАЛИТИКИ ====================
+
+# Счетчики эффективности кеша (в пределах процесса)
+analytics_cache_stats = {'hits': 0, 'misses': 0, 'stores': 0, 'invalidated': 0, 'swept': 0}
+_cache_sweeper_lock = threading.Lock()
+_cache_sweeper_started = False
+
+def _encode_cache_value(value):
+    """Готовит значение к JSON: сохраняет нестроковые ключи словарей, кортежи и даты"""
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: _encode_cache_value(item) for key, item in value.items()}
+        return {'__items__': [[_encode_cache_value(key), _encode_cache_value(item)] for key, item in value.items()]}
+    if isinstance(value, tuple):
+        return {'__tuple__': [_encode_cache_value(item) for item in value]}
+    if isinstance(value, list):
+        return [_encode_cache_value(item) for item in value]
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    return value
+
+def _decode_cache_value(value):
+    """Обратное преобразование для _encode_cache_value"""
+    if isinstance(value, dict):
+        if len(value) == 1 and '__items__' in value:
+            decoded = {}
+            for key, item in value['__items__']:
+                decoded[_decode_cache_value(key)] = _decode_cache_value(item)
+            return decoded
+        if len(value) == 1 and '__tuple__' in value:
+            return tuple(_decode_cache_value(item) for item in value['__tuple__'])
+        if len(value) == 1 and '__datetime__' in value:
+            return datetime.fromisoformat(value['__datetime__'])
+        return {key: _decode_cache_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_decode_cache_value(item) for item in value]
+    return value
+
+def cached_analytics(cache_key, compute, ttl=None):
+    """Возвращает результат compute() из AnalyticsCache или вычисляет и сохраняет его"""
+    _start_cache_sweeper()
+    now = datetime.utcnow()
+    entry = AnalyticsCache.query.filter(
+        AnalyticsCache.cache_key == cache_key,
+        AnalyticsCache.expires_at > now
+    ).first()
+    if entry:
+        try:
+            value = _decode_cache_value(json.loads(entry.data))
+            analytics_cache_stats['hits'] += 1
+            return value
+        except (json.JSONDecodeError, TypeError, ValueError):
+            pass
+
+    analytics_cache_stats['misses'] += 1
+    value = compute()
+
+    ttl = ttl or app.config.get('ANALYTICS_CACHE_TTL', 300)
+    try:
+        AnalyticsCache.query.filter_by(cache_key=cache_key).delete(synchronize_session=False)
+        db.session.add(AnalyticsCache(
+            cache_key=cache_key,
+            data=json.dumps(_encode_cache_value(value), ensure_ascii=False),
+            created_at=now,
+            expires_at=now + timedelta(seconds=ttl)
+        ))
+        db.session.commit()
+        analytics_cache_stats['stores'] += 1
+    except Exception as e:
+        # Кеш не должен ломать страницу (например, запись уже добавил другой процесс)
+        db.session.rollback()
+        print(f"⚠️  Не удалось сохранить кеш '{cache_key}': {e}")
+    return value
+
+def invalidate_survey_cache(survey_id, include_global=False):
+    """Удаляет ключи кеша опроса (без commit - в транзакции вызывающего кода)
+    
+    Глобальная аналитика и кросс-анализ при каждой отправке не сбрасываются, а живут
+    GLOBAL_ANALYTICS_CACHE_TTL; include_global=True - изменение самого опроса
+    (вопросы, активность), после которого они сбрасываются сразу.
+    """
+    condition = AnalyticsCache.cache_key.like(f'survey:{survey_id}:%')
+    if include_global:
+        condition = db.or_(condition,
+                           AnalyticsCache.cache_key.like('global:%'),
+                           AnalyticsCache.cache_key.like('cross:%'))
+    deleted = AnalyticsCache.query.filter(condition).delete(synchronize_session=False)
+    analytics_cache_stats['invalidated'] += deleted
+    return deleted
+
+def sweep_analytics_cache():
+    """Удаляет просроченные записи кеша"""
+    deleted = AnalyticsCache.query.filter(
+        AnalyticsCache.expires_at <= datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    analytics_cache_stats['swept'] += deleted
+    return deleted
+
+def _cache_sweeper_loop(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            with app.app_context():
+                sweep_analytics_cache()
+        except Exception as e:
+            print(f"⚠️  Ошибка очистки кеша аналитики: {e}")
+
+def _start_cache_sweeper():
+    """Запускает фоновую очистку просроченного кеша (один поток на процесс)"""
+    global _cache_sweeper_started
+    if _cache_sweeper_started:
+        return
+    with _cache_sweeper_lock:
+        if _cache_sweeper_started:
+            return
+        interval = app.config.get('ANALYTICS_CACHE_SWEEP_INTERVAL', 600)
+        threading.Thread(target=_cache_sweeper_loop, args=(interval,), daemon=True,
+                         name='analytics-cache-sweeper').start()
+        _cache_sweeper_started = True
+
 # Маршруты
 @app.route('/')
 def index():
@@ -571,6 +1653,7 @@ def create_survey():
         
         # Добавляем вопросы
         questions_data = json.loads(request.form.get('questions', '[]'))
+        questions = []
         for i, q_data in enumerate(questions_data):
             question = Question(
                 text=q_data['text'],
@@ -588,6 +1671,12 @@ def create_survey():
                 survey_id=survey.id
             )
             db.session.add(question)
+            questions.append(question)
+        
+        # Словарь вариантов ответов новых вопросов
+        db.session.flush()
+        for question in questions:
+            sync_question_options(question, [])
         
         db.session.commit()
         flash('Опрос создан успешно', 'success')
@@ -595,16 +1684,129 @@ def create_survey():
     
     return render_template('create_survey.html')
 
+# ==================== СКОМПИЛИРОВАННЫЕ СХЕМЫ ОПРОСОВ ====================
+
+# Схемы опросов процесса: survey_id -> CompiledSurvey. Схема хранит версию опроса,
+# которая увеличивается при каждом изменении, поэтому устаревшая схема не
+# используется ни в одном процессе, даже если опрос изменили в другом.
+_compiled_survey_cache = OrderedDict()
+_compiled_survey_lock = threading.Lock()
+
+def compile_survey(survey):
+    """Строит схему опроса: вопросы по порядку с разобранными JSON полями и id вариантов"""
+    questions = Question.query.filter_by(survey_id=survey.id).order_by(Question.question_order, Question.id).all()
+    option_ids_by_question = load_question_option_ids(
+        question for question in questions
+        if question.type in CHOICE_QUESTION_TYPES or question.type in GRID_QUESTION_TYPES
+    )
+    compiled_questions = [CompiledQuestion(
+        question,
+        options=parse_json_list(question.options),
+        rating_labels=parse_json_list(question.rating_labels),
+        grid_rows=parse_json_list(question.grid_rows),
+        grid_columns=parse_json_list(question.grid_columns)
+    ) for question in questions]
+    return CompiledSurvey(survey.id, survey.version or 1, compiled_questions, option_ids_by_question)
+
+def get_compiled_survey(survey):
+    """Схема текущей версии опроса из кеша процесса (строится при первом обращении)"""
+    version = survey.version or 1
+    with _compiled_survey_lock:
+        compiled = _compiled_survey_cache.get(survey.id)
+        if compiled is not None and compiled.version == version:
+            _compiled_survey_cache.move_to_end(survey.id)
+            return compiled
+    
+    compiled = compile_survey(survey)
+    with _compiled_survey_lock:
+        _compiled_survey_cache[survey.id] = compiled
+        _compiled_survey_cache.move_to_end(survey.id)
+        while len(_compiled_survey_cache) > app.config.get('SURVEY_SCHEMA_CACHE_SIZE', 256):
+            _compiled_survey_cache.popitem(last=False)
+    return compiled
+
+def invalidate_compiled_survey(survey_id):
+    """Удаляет схему опроса из кеша процесса (другие процессы увидят новую версию опроса)"""
+    with _compiled_survey_lock:
+        _compiled_survey_cache.pop(survey_id, None)
+
+# ==================== КЕШ СТРАНИЦ ОПРОСОВ ====================
+
+# Готовый HTML страницы опроса для анонимных посетителей: (хост, survey_id, тема) ->
+# (версия, ETag, HTML). Страница зависит только от версии опроса, поэтому после
+# изменения опроса запись просто перестает совпадать по версии и перестраивается.
+_survey_page_cache = OrderedDict()
+_survey_page_lock = threading.Lock()
+survey_page_cache_stats = {'hits': 0, 'misses': 0, 'not_modified': 0}
+
+def survey_page_etag(survey_id, version, is_active, viewer, theme):
+    """ETag страницы опроса: версия и активность опроса, посетитель и тема оформления"""
+    key = f'{survey_id}:{version}:{int(bool(is_active))}:{viewer}:{theme}'
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def _survey_page_response(html, etag, last_modified, anonymous):
+    response = make_response(html)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    # Браузер хранит страницу, но перепроверяет ее условным запросом при каждом открытии
+    response.headers['Cache-Control'] = 'no-cache' if anonymous else 'private, no-cache'
+    response.vary.add('Cookie')
+    return response
+
 @app.route('/surveys/<int:survey_id>')
 def view_survey(survey_id):
-    survey = Survey.query.get_or_404(survey_id)
+    # Для ETag и поиска в кеше достаточно версии опроса - без загрузки вопросов
+    version, is_active, response_count, created_at, updated_at = db.session.query(
+        Survey.version, Survey.is_active, Survey.response_count, Survey.created_at, Survey.updated_at
+    ).filter(Survey.id == survey_id).first_or_404()
+    version = version or 1
     
     # Проверяем, активен ли опрос
-    if not survey.is_active:
+    if not is_active:
         flash('Этот опрос временно недоступен', 'error')
         return redirect(url_for('index'))
     
-    return render_template('view_survey.html', survey=survey)
+    # Число ответов видят только авторизованные посетители (автор и администраторы), поэтому
+    # страница анонимного посетителя меняется лишь вместе с версией опроса
+    anonymous = not current_user.is_authenticated
+    viewer = 'anonymous' if anonymous else (
+        f'user{current_user.id}:{current_user.username}:{int(bool(current_user.is_admin))}:'
+        f'{int(bool(current_user.can_create_surveys))}:{response_count}'
+    )
+    theme = 'dark' if request.cookies.get('theme') == 'dark' else 'light'
+    etag = survey_page_etag(survey_id, version, is_active, viewer, theme)
+    last_modified = updated_at or created_at
+    # Непоказанные flash-сообщения выводятся на этой странице - ее нельзя отдавать из кеша
+    cacheable = '_flashes' not in session
+    
+    if cacheable and not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        survey_page_cache_stats['not_modified'] += 1
+        response = _survey_page_response('', etag, last_modified, anonymous)
+        response.status_code = 304
+        return response
+    
+    # Ссылка "Поделиться" в странице строится из request.url_root (схема, хост и префикс приложения)
+    cache_key = (request.url_root, survey_id, theme)
+    if cacheable and anonymous:
+        with _survey_page_lock:
+            entry = _survey_page_cache.get(cache_key)
+            if entry is not None and entry[0] == version:
+                _survey_page_cache.move_to_end(cache_key)
+                survey_page_cache_stats['hits'] += 1
+                return _survey_page_response(entry[2], etag, last_modified, anonymous)
+    
+    survey = db.session.get(Survey, survey_id)
+    compiled = get_compiled_survey(survey)
+    html = render_template('view_survey.html', survey=survey, questions=compiled.questions)
+    
+    if cacheable and anonymous:
+        survey_page_cache_stats['misses'] += 1
+        with _survey_page_lock:
+            _survey_page_cache[cache_key] = (version, etag, html)
+            _survey_page_cache.move_to_end(cache_key)
+            while len(_survey_page_cache) > app.config.get('SURVEY_PAGE_CACHE_SIZE', 512):
+                _survey_page_cache.popitem(last=False)
+    return _survey_page_response(html, etag, last_modified, anonymous)
 
 @app.route('/surveys/<int:survey_id>/edit', methods=['GET', 'POST'])
 @login_required
@@ -623,31 +1825,83 @@ def edit_survey(survey_id):
         survey.is_anonymous = 'is_anonymous' in request.form
         survey.require_auth = 'require_auth' in request.form
         survey.require_name = 'require_name' in request.form
+        survey.version = (survey.version or 1) + 1
+        survey.updated_at = datetime.utcnow()
         
-        # Удаляем старые вопросы
-        Question.query.filter_by(survey_id=survey.id).delete()
-        
-        # Добавляем новые вопросы
+        # Вопросы с id из формы обновляются на месте (ответы и агрегаты сохраняются),
+        # остальные создаются заново; исчезнувшие из формы вопросы удаляются вместе с агрегатами
+        existing_questions = {question.id: question for question in survey.questions}
+        kept_questions = []
+        retyped_ids = []
+        label_ids = {}  # id вопроса -> id вариантов, строк и столбцов из формы (переименование по id)
         questions_data = json.loads(request.form.get('questions', '[]'))
         for i, q_data in enumerate(questions_data):
-            question = Question(
-                text=q_data['text'],
-                type=q_data['type'],
-                options=json.dumps(q_data.get('options', [])),
-                is_required=q_data.get('is_required', True),
-                allow_other=q_data.get('allow_other', False),
-                other_text=q_data.get('other_text', 'Другой вариант'),
-                rating_min=q_data.get('rating_min', 1),
-                rating_max=q_data.get('rating_max', 5),
-                rating_labels=json.dumps(q_data.get('rating_labels', [])),
-                grid_rows=json.dumps(q_data.get('grid_rows', [])),
-                grid_columns=json.dumps(q_data.get('grid_columns', [])),
-                question_order=i,
-                survey_id=survey.id
-            )
-            db.session.add(question)
+            question = existing_questions.pop(q_data.get('id'), None)
+            if question is None:
+                question = Question(survey_id=survey.id)
+                db.session.add(question)
+            elif question.type != q_data['type']:
+                retyped_ids.append(question.id)
+            question.text = q_data['text']
+            question.type = q_data['type']
+            question.options = json.dumps(q_data.get('options', []))
+            question.is_required = q_data.get('is_required', True)
+            question.allow_other = q_data.get('allow_other', False)
+            question.other_text = q_data.get('other_text', 'Другой вариант')
+            question.rating_min = q_data.get('rating_min', 1)
+            question.rating_max = q_data.get('rating_max', 5)
+            question.rating_labels = json.dumps(q_data.get('rating_labels', []))
+            question.grid_rows = json.dumps(q_data.get('grid_rows', []))
+            question.grid_columns = json.dumps(q_data.get('grid_columns', []))
+            question.question_order = i
+            kept_questions.append(question)
+            if question.id is not None:
+                label_ids[question.id] = {
+                    'option': q_data.get('option_ids'),
+                    'row': q_data.get('grid_row_ids'),
+                    'column': q_data.get('grid_column_ids')
+                }
         
+        removed_ids = list(existing_questions)
+        delete_question_aggregates(removed_ids + retyped_ids)
+        # Ответы вопросов, сменивших тип, заново индексируются ниже, если вопрос стал текстовым
+        remove_questions_from_search(retyped_ids)
+        if removed_ids:
+            # Ответы удаленных вопросов удаляются вместе с вопросом: сначала поисковый индекс
+            # и выборы, ссылающиеся на ответы, затем сами ответы, варианты и вопросы
+            remove_questions_from_search(removed_ids)
+            for model in (AnswerSelection, AnswerGridCell):
+                model.query.filter(model.question_id.in_(removed_ids)).delete(synchronize_session=False)
+            removed_answers = Answer.query.filter(Answer.question_id.in_(removed_ids)).delete(synchronize_session=False)
+            QuestionOption.query.filter(QuestionOption.question_id.in_(removed_ids)).delete(synchronize_session=False)
+            Question.query.filter(Question.id.in_(removed_ids)).delete(synchronize_session=False)
+            if removed_answers:
+                db.session.execute(db.update(Survey).where(Survey.id == survey.id).values(
+                    answer_count=Survey.answer_count - removed_answers
+                ).execution_options(synchronize_session=False))
+        
+        # Варианты, переименованные в форме (с прежним id), сохраняют id, поэтому прежние выборы и
+        # счетчики остаются привязанными; новые подписи без id получают новые строки
+        db.session.flush()
+        for question in kept_questions:
+            sync_question_options(question, label_ids=label_ids.get(question.id))
+        
+        invalidate_survey_cache(survey.id, include_global=True)
         db.session.commit()
+        invalidate_compiled_survey(survey.id)
+        
+        # При смене типа вопроса выборы и агрегаты пересчитываются по сохраненным ответам
+        if retyped_ids:
+            for model in (AnswerSelection, AnswerGridCell):
+                model.query.filter(model.question_id.in_(retyped_ids)).delete(synchronize_session=False)
+            rebuild_answer_selections(question_ids=retyped_ids)
+            rebuild_typed_answer_values(question_ids=retyped_ids)
+            rebuild_question_aggregates(question_ids=retyped_ids)
+            text_ids = [question.id for question in kept_questions
+                        if question.id in retyped_ids and question.type in TEXT_QUESTION_TYPES]
+            if text_ids and answer_search_available():
+                index_answers_for_search(db.session, question_ids=text_ids)
+                db.session.commit()
         flash('Опрос обновлен успешно', 'success')
         return redirect(url_for('dashboard'))
     
@@ -663,7 +1917,9 @@ def edit_survey(survey_id):
         'questions': []
     }
     
+    option_ids_by_question = load_question_option_ids(survey.questions)
     for question in survey.questions:
+        option_ids = option_ids_by_question[question.id]
         question_data = {
             'id': question.id,
             'text': question.text,
@@ -680,6 +1936,10 @@ def edit_survey(survey_id):
             'grid_columns': json.loads(question.grid_columns) if question.grid_columns else [],
             'question_order': question.question_order
         }
+        # id вариантов, строк и столбцов: измененная в форме подпись с прежним id - переименование
+        labels = question_option_labels(question)
+        for field, kind in (('option_ids', 'option'), ('grid_row_ids', 'row'), ('grid_column_ids', 'column')):
+            question_data[field] = [option_ids.ids[kind].get(label) for label in labels[kind]]
         survey_data['questions'].append(question_data)
     
     return render_template('edit_survey.html', survey=survey_data)
@@ -697,6 +1957,9 @@ def toggle_survey_active(survey_id):
     
     # Переключаем статус
     survey.is_active = not survey.is_active
+    survey.version = (survey.version or 1) + 1
+    survey.updated_at = datetime.utcnow()
+    invalidate_survey_cache(survey.id, include_global=True)
     db.session.commit()
     
     status = "активирован" if survey.is_active else "деактивирован"
@@ -725,51 +1988,366 @@ def submit_survey(survey_id):
             flash('Пожалуйста, укажите ваше имя', 'error')
             return redirect(url_for('view_survey', survey_id=survey_id))
     
-    # Создаем ответ на опрос
-    response = SurveyResponse(
-        survey_id=survey.id,
-        user_id=current_user.id if current_user.is_authenticated else None,
-        respondent_name=respondent_name,
-        ip_address=request.remote_addr,
-        user_agent=request.headers.get('User-Agent', ''),
-        completion_time=request.form.get('completion_time', type=int)  # Время в секундах
-    )
-    db.session.add(response)
-    db.session.commit()
+    # Собираем ответ и все ответы на вопросы, затем сохраняем одной транзакцией
+    submission = {
+        'survey_id': survey.id,
+        'user_id': current_user.id if current_user.is_authenticated else None,
+        'respondent_name': respondent_name,
+        'ip_address': request.remote_addr,
+        'user_agent': request.headers.get('User-Agent', ''),
+        'completion_time': request.form.get('completion_time', type=int),  # Время в секундах
+        'created_at': datetime.utcnow(),
+        'answers': []
+    }
     
-    # Сохраняем ответы на вопросы
-    for question in survey.questions:
-        answer_value = request.form.get(f'question_{question.id}')
-        if answer_value:
-            # Обрабатываем разные типы ответов
-            if question.type in ['multiple_choice', 'checkbox']:
-                # Для множественного выбора ответ может быть списком
-                if isinstance(answer_value, list):
-                    answer_value = json.dumps(answer_value)
-            elif question.type in ['grid', 'checkbox_grid']:
-                # Для сеток ответ уже в JSON формате
-                if isinstance(answer_value, list):
-                    answer_value = json.dumps(answer_value)
-            elif question.type == 'dropdown' and answer_value == 'other':
-                # Для dropdown с "другим вариантом" ищем текст
-                other_text = request.form.get(f'question_{question.id}_other_text')
-                if other_text:
-                    answer_value = other_text
-                else:
-                    answer_value = 'other'
-            
-            answer = Answer(
-                question_id=question.id,
-                response_id=response.id,
-                value=answer_value,
-                is_other=request.form.get(f'question_{question.id}_other') == 'true' or answer_value == 'other'
-            )
-            db.session.add(answer)
+    # Ответы читаются по скомпилированной схеме: имена полей и проверки значений для каждого типа вопроса
+    compiled = get_compiled_survey(survey)
+    submission['answers'] = compiled.answers_from_form(request.form)
     
-    db.session.commit()
+    if app.config.get('SUBMISSION_QUEUE_ENABLED'):
+        enqueue_submission(submission)
+    else:
+        store_submissions([submission], compiled.questions_by_id, compiled.option_ids_by_question)
     flash('Опрос успешно пройден!', 'success')
     return redirect(url_for('index'))
 
+# ==================== ПОЛНОТЕКСТОВЫЙ ПОИСК ПО ОТВЕТАМ ====================
+
+# Индекс answer_search повторяет Answer.value для текстовых вопросов:
+# в SQLite это виртуальная таблица FTS5 (rowid = answer.id, опрос - токен survey<ID>
+# в отдельном столбце, чтобы фильтр по опросу тоже шел по индексу), в PostgreSQL -
+# таблица с tsvector и GIN-индексом. Для других СУБД поиск недоступен.
+
+SEARCH_HIGHLIGHT_START = '\x02'
+SEARCH_HIGHLIGHT_END = '\x03'
+SEARCH_MAX_TERMS = 10
+
+_answer_search_state = {'available': False}
+
+def _answer_search_ddl(dialect):
+    if dialect == 'sqlite':
+        return ["CREATE VIRTUAL TABLE IF NOT EXISTS answer_search USING fts5("
+                "value, survey_key, question_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"]
+    if dialect == 'postgresql':
+        return [
+            "CREATE TABLE IF NOT EXISTS answer_search ("
+            "answer_id INTEGER PRIMARY KEY, survey_id INTEGER NOT NULL, question_id INTEGER NOT NULL, "
+            "value TEXT NOT NULL, document TSVECTOR NOT NULL)",
+            "CREATE INDEX IF NOT EXISTS ix_answer_search_document ON answer_search USING GIN (document)",
+            "CREATE INDEX IF NOT EXISTS ix_answer_search_survey ON answer_search (survey_id)",
+        ]
+    return []
+
+def ensure_answer_search_index(backfill=True):
+    """Создает поисковый индекс и заполняет его при первом создании; False - поиск недоступен
+    
+    Выполняет DDL, поэтому вызывается из migrate_database.py, init_db.py и maintenance.py
+    rebuild-search, а не при обработке запросов.
+    """
+    from sqlalchemy import inspect
+    
+    statements = _answer_search_ddl(db.engine.dialect.name)
+    if not statements:
+        return False
+    try:
+        existed = inspect(db.engine).has_table('answer_search')
+        with db.engine.begin() as connection:
+            for statement in statements:
+                connection.execute(db.text(statement))
+            if not existed and backfill:
+                indexed = index_answers_for_search(connection)
+                print(f"🔎 Создан поисковый индекс ответов, проиндексировано: {indexed}")
+    except Exception as e:
+        # Например, SQLite собран без FTS5
+        print(f"⚠️  Полнотекстовый поиск недоступен: {e}")
+        return False
+    return True
+
+def answer_search_available():
+    """Есть ли поисковый индекс в БД (только проверка, без DDL)
+    
+    Найденный индекс запоминается на процесс; пока индекса нет, проверка повторяется,
+    чтобы процесс начал индексировать ответы сразу после migrate_database.py.
+    """
+    from sqlalchemy import inspect
+    
+    if not _answer_search_state['available'] and _answer_search_ddl(db.engine.dialect.name):
+        _answer_search_state['available'] = inspect(db.engine).has_table('answer_search')
+    return _answer_search_state['available']
+
+def index_answers_for_search(connection, response_ids=None, question_ids=None):
+    """Добавляет непустые текстовые ответы в поисковый индекс одним INSERT ... SELECT
+    
+    connection - db.session (в транзакции сохранения ответов) или соединение движка.
+    Без response_ids и question_ids индексируются все ответы (первичное заполнение).
+    """
+    from sqlalchemy import bindparam
+    
+    if db.engine.dialect.name == 'postgresql':
+        insert = (
+            "INSERT INTO answer_search (answer_id, survey_id, question_id, value, document) "
+            "SELECT answer.id, survey_response.survey_id, answer.question_id, answer.value, "
+            "to_tsvector(CAST(:config AS regconfig), answer.value)"
+        )
+        conflict = " ON CONFLICT (answer_id) DO NOTHING"
+    else:
+        insert = (
+            "INSERT INTO answer_search (rowid, value, survey_key, question_id) "
+            "SELECT answer.id, answer.value, 'survey' || survey_response.survey_id, answer.question_id"
+        )
+        conflict = ""
+    
+    sql = (insert +
+           " FROM answer JOIN survey_response ON survey_response.id = answer.response_id"
+           " JOIN question ON question.id = answer.question_id"
+           " WHERE question.type IN :types AND trim(answer.value) != ''")
+    params = {'types': TEXT_QUESTION_TYPES}
+    bind = [bindparam('types', expanding=True)]
+    if response_ids is not None:
+        if not response_ids:
+            return 0
+        sql += " AND answer.response_id IN :response_ids"
+        params['response_ids'] = list(response_ids)
+        bind.append(bindparam('response_ids', expanding=True))
+    if question_ids is not None:
+        if not question_ids:
+            return 0
+        sql += " AND answer.question_id IN :question_ids"
+        params['question_ids'] = list(question_ids)
+        bind.append(bindparam('question_ids', expanding=True))
+    if db.engine.dialect.name == 'postgresql':
+        params['config'] = app.config.get('SEARCH_PG_CONFIG', 'russian')
+    
+    result = connection.execute(db.text(sql + conflict).bindparams(*bind), params)
+    return result.rowcount
+
+def rebuild_answer_search_index():
+    """Перестраивает поисковый индекс по таблице Answer (создает его при отсутствии);
+    возвращает число проиндексированных ответов"""
+    if not ensure_answer_search_index(backfill=False):
+        return None
+    with db.engine.begin() as connection:
+        connection.execute(db.text('DELETE FROM answer_search'))
+        return index_answers_for_search(connection)
+
+def remove_questions_from_search(question_ids):
+    """Удаляет из поискового индекса ответы вопросов (в транзакции db.session, до удаления ответов)"""
+    from sqlalchemy import bindparam
+    
+    if not question_ids or not answer_search_available():
+        return 0
+    if db.engine.dialect.name == 'postgresql':
+        sql = "DELETE FROM answer_search WHERE question_id IN :question_ids"
+    else:
+        sql = "DELETE FROM answer_search WHERE rowid IN (SELECT id FROM answer WHERE question_id IN :question_ids)"
+    result = db.session.execute(db.text(sql).bindparams(bindparam('question_ids', expanding=True)),
+                                {'question_ids': list(question_ids)})
+    return result.rowcount
+
+def _search_terms(query):
+    """Слова запроса (не более SEARCH_MAX_TERMS) без служебного синтаксиса FTS"""
+    return re.findall(r'\w+', (query or '').lower())[:SEARCH_MAX_TERMS]
+
+def _highlight_snippet(snippet):
+    """Экранирует фрагмент ответа и заменяет маркеры совпадений на <mark>"""
+    from markupsafe import escape
+    
+    html = str(escape(snippet or ''))
+    return html.replace(SEARCH_HIGHLIGHT_START, '<mark>').replace(SEARCH_HIGHLIGHT_END, '</mark>')
+
+def search_survey_answers(survey_id, query, page=1, per_page=20):
+    """Ранжированный поиск по текстовым ответам опроса с подсветкой совпадений"""
+    from text_terms import stem
+    
+    terms = _search_terms(query)
+    if not terms:
+        return {'total': 0, 'hits': []}
+    offset = (page - 1) * per_page
+    
+    if db.engine.dialect.name == 'postgresql':
+        params = {
+            'config': app.config.get('SEARCH_PG_CONFIG', 'russian'),
+            'query': ' & '.join(f'{term}:*' for term in terms),
+            'survey_id': survey_id,
+            'options': f'StartSel={SEARCH_HIGHLIGHT_START}, StopSel={SEARCH_HIGHLIGHT_END}, MaxWords=35, MinWords=15',
+        }
+        matches = ("FROM answer_search, to_tsquery(CAST(:config AS regconfig), :query) AS query "
+                   "WHERE answer_search.survey_id = :survey_id AND answer_search.document @@ query")
+        total = db.session.execute(db.text(f"SELECT count(*) {matches}"), params).scalar()
+        rows = db.session.execute(db.text(
+            "SELECT answer_search.answer_id, "
+            "ts_headline(CAST(:config AS regconfig), answer_search.value, query, :options), "
+            f"ts_rank(answer_search.document, query) AS rank {matches} "
+            "ORDER BY rank DESC, answer_search.answer_id LIMIT :limit OFFSET :offset"
+        ), dict(params, limit=per_page, offset=offset)).all()
+    else:
+        # Префиксный поиск по основам слов: "сервисом" находит "сервис", "сервиса"...
+        phrases = ' '.join('"{}"*'.format(stem(term) if len(stem(term)) >= 3 else term) for term in terms)
+        params = {'match': f'survey_key : survey{survey_id} AND value : ({phrases})'}
+        total = db.session.execute(db.text(
+            "SELECT count(*) FROM answer_search WHERE answer_search MATCH :match"
+        ), params).scalar()
+        rows = db.session.execute(db.text(
+            "SELECT rowid, snippet(answer_search, 0, :start, :end, '…', 24), rank "
+            "FROM answer_search WHERE answer_search MATCH :match ORDER BY rank LIMIT :limit OFFSET :offset"
+        ), dict(params, start=SEARCH_HIGHLIGHT_START, end=SEARCH_HIGHLIGHT_END,
+                limit=per_page, offset=offset)).all()
+    
+    # Вопрос и отправка для найденных ответов - одним запросом; удаленные ответы пропускаются
+    answer_ids = [row[0] for row in rows]
+    details = {}
+    if answer_ids:
+        details = {row.id: row for row in db.session.query(
+            Answer.id, Answer.response_id, Answer.question_id, Question.text.label('question_text'),
+            SurveyResponse.created_at
+        ).join(Question, Question.id == Answer.question_id).join(
+            SurveyResponse, SurveyResponse.id == Answer.response_id
+        ).filter(Answer.id.in_(answer_ids))}
+    
+    hits = []
+    for answer_id, snippet, rank in rows:
+        detail = details.get(answer_id)
+        if detail is None:
+            continue
+        hits.append({
+            'answer_id': answer_id,
+            'response_id': detail.response_id,
+            'question_id': detail.question_id,
+            'question_text': detail.question_text,
+            'created_at': detail.created_at.isoformat() if detail.created_at else None,
+            'snippet': _highlight_snippet(snippet),
+            'rank': round(abs(rank), 6)
+        })
+    return {'total': total, 'hits': hits}
+
+@app.route('/surveys/<int:survey_id>/search')
+@login_required
+def search_survey_results(survey_id):
+    """Поиск по текстовым ответам опроса (ранжированные страницы с подсветкой)"""
+    survey = Survey.query.get_or_404(survey_id)
+    if not current_user.is_admin and survey.creator_id != current_user.id:
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    if not answer_search_available():
+        return jsonify({'error': 'Полнотекстовый поиск недоступен для этой базы данных'}), 503
+    
+    query = request.args.get('q', '').strip()
+    if not _search_terms(query):
+        return jsonify({'error': 'Пустой поисковый запрос'}), 400
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(100, max(1, request.args.get('per_page', app.config.get('SEARCH_PAGE_SIZE', 20), type=int)))
+    
+    result = search_survey_answers(survey_id, query, page, per_page)
+    return jsonify({
+        'query': query,
+        'page': page,
+        'per_page': per_page,
+        'total': result['total'],
+        'pages': (result['total'] + per_page - 1) // per_page,
+        'hits': result['hits']
+    })
+
+# ==================== ПОСТРАНИЧНЫЙ ВЫВОД РЕЗУЛЬТАТОВ ====================
+
+def encode_page_cursor(*parts):
+    """Курсор страницы: значения ключа последней строки через '_'"""
+    return '_'.join(part.isoformat() if isinstance(part, datetime) else str(part) for part in parts)
+
+def load_response_page(survey_id, cursor=None, limit=50):
+    """Страница ответов опроса по ключу (created_at, id) от новых к старым
+    
+    Вместо OFFSET запрос продолжает с последней показанной строки, поэтому
+    стоимость страницы не зависит от ее номера и общего числа ответов.
+    """
+    query = SurveyResponse.query.filter(SurveyResponse.survey_id == survey_id)
+    if cursor:
+        created_at, _, response_id = cursor.rpartition('_')
+        created_at, response_id = datetime.fromisoformat(created_at), int(response_id)
+        query = query.filter(
+            SurveyResponse.created_at <= created_at,
+            db.or_(SurveyResponse.created_at < created_at, SurveyResponse.id < response_id)
+        )
+    rows = query.order_by(SurveyResponse.created_at.desc(), SurveyResponse.id.desc()).limit(limit + 1).all()
+    responses = rows[:limit]
+    
+    # Заполненность и пользователи - одним запросом на страницу, а не на каждую строку
+    response_ids = [response.id for response in responses]
+    answer_counts = {}
+    if response_ids:
+        answer_counts = dict(db.session.query(Answer.response_id, db.func.count(Answer.id)).filter(
+            Answer.response_id.in_(response_ids)
+        ).group_by(Answer.response_id).all())
+    user_ids = {response.user_id for response in responses if response.user_id}
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+    
+    return {
+        'responses': responses,
+        'answer_counts': answer_counts,
+        'users': users,
+        'next_cursor': encode_page_cursor(responses[-1].created_at, responses[-1].id) if len(rows) > limit else None
+    }
+
+def load_text_answer_page(question_id, cursor=None, limit=20):
+    """Страница непустых текстовых ответов на вопрос по ключу (response_id, id)"""
+    query = db.session.query(Answer.response_id, Answer.id, Answer.value).filter(
+        Answer.question_id == question_id,
+        Answer.value.isnot(None),
+        db.func.trim(Answer.value) != ''
+    )
+    if cursor:
+        response_id, _, answer_id = cursor.partition('_')
+        response_id, answer_id = int(response_id), int(answer_id)
+        query = query.filter(
+            Answer.response_id >= response_id,
+            db.or_(Answer.response_id > response_id, Answer.id > answer_id)
+        )
+    rows = query.order_by(Answer.response_id, Answer.id).limit(limit + 1).all()
+    page = rows[:limit]
+    return {
+        'answers': [value.strip() for _, _, value in page],
+        'next_cursor': encode_page_cursor(page[-1].response_id, page[-1].id) if len(rows) > limit else None
+    }
+
+@app.route('/surveys/<int:survey_id>/results/responses')
+@login_required
+def survey_results_responses(survey_id):
+    """Следующая страница таблиц ответов (HTML строк для подгрузки)"""
+    from flask import get_template_attribute
+    
+    survey = Survey.query.get_or_404(survey_id)
+    if not current_user.is_admin and survey.creator_id != current_user.id:
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    
+    try:
+        page = load_response_page(survey_id, request.args.get('cursor'), app.config.get('RESULTS_PAGE_SIZE', 50))
+    except ValueError:
+        return jsonify({'error': 'Некорректный курсор'}), 400
+    start_index = request.args.get('offset', 0, type=int)
+    
+    question_count = len(survey.questions)
+    return jsonify({
+        'responses_html': get_template_attribute('surveys/response_rows.html', 'response_rows')(
+            survey, page, start_index, question_count),
+        'details_html': get_template_attribute('surveys/response_rows.html', 'detail_rows')(
+            survey, page, start_index),
+        'count': len(page['responses']),
+        'next_cursor': page['next_cursor']
+    })
+
+@app.route('/surveys/<int:survey_id>/results/questions/<int:question_id>/text-answers')
+@login_required
+def survey_results_text_answers(survey_id, question_id):
+    """Следующая страница текстовых ответов на вопрос"""
+    survey = Survey.query.get_or_404(survey_id)
+    if not current_user.is_admin and survey.creator_id != current_user.id:
+        return jsonify({'error': 'Доступ запрещен'}), 403
+    
+    question = Question.query.filter_by(id=question_id, survey_id=survey_id).first_or_404()
+    try:
+        page = load_text_answer_page(question.id, request.args.get('cursor'), app.config.get('TEXT_ANSWERS_PAGE_SIZE', 20))
+    except ValueError:
+        return jsonify({'error': 'Некорректный курсор'}), 400
+    return jsonify(page)
+
 @app.route('/surveys/<int:survey_id>/results')
 @login_required
 def survey_results(survey_id):
@@ -779,12 +2357,14 @@ def survey_results(survey_id):
         flash('У вас нет доступа к результатам этого опроса', 'error')
         return redirect(url_for('dashboard'))
     
-    # Получаем все ответы на опрос
-    responses = SurveyResponse.query.filter_by(survey_id=survey_id).order_by(SurveyResponse.created_at.desc()).all()
+    # Первая страница ответов; остальные страницы подгружаются по курсору
+    response_page = load_response_page(survey_id, limit=app.config.get('RESULTS_PAGE_SIZE', 50))
     
-    # Анализ общих результатов
+    # Анализ общих результатов (счетчики читаются из агрегатов, а не из всех ответов)
+    aggregates = load_question_aggregates([question.id for question in survey.questions])
     results = {}
     for question in survey.questions:
+        aggregate = aggregates[question.id]
         try:
             if question.type == 'multiple_choice':
                 # Безопасно загружаем опции
@@ -792,10 +2372,7 @@ def survey_results(survey_id):
                     if question.options and question.options.strip():
                         options = json.loads(question.options)
                         if isinstance(options, list) and options:
-                            counts = {opt: 0 for opt in options}
-                            for answer in question.answers:
-                                if answer.value in counts:
-                                    counts[answer.value] += 1
+                            counts = {opt: aggregate['options'].get(opt, 0) for opt in options}
                             results[question.id] = {
                                 'type': 'multiple_choice',
                                 'text': question.text,
@@ -827,26 +2404,17 @@ def survey_results(survey_id):
                     }
                     
             elif question.type == 'rating':
-                ratings = []
-                for answer in question.answers:
-                    try:
-                        if answer.value and answer.value.isdigit():
-                            ratings.append(int(answer.value))
-                    except (ValueError, TypeError):
-                        continue
+                from rating_stats import rating_statistics
                 
-                if ratings:
-                    # Создаем данные для графика рейтингов
-                    rating_data = {}
-                    for rating in range(1, 11):
-                        rating_data[rating] = ratings.count(rating)
-                    
+                # Данные для графика рейтингов - распределение по шкале 1..10
+                rating_stats = rating_statistics(aggregate['ratings'], 1, 10)
+                if rating_stats:
                     results[question.id] = {
                         'type': 'rating',
                         'text': question.text,
-                        'average': sum(ratings) / len(ratings),
-                        'count': len(ratings),
-                        'data': rating_data
+                        'average': rating_stats['mean'],
+                        'count': rating_stats['count'],
+                        'data': {rating: rating_stats['distribution'][rating] for rating in range(1, 11)}
                     }
                 else:
                     results[question.id] = {
@@ -877,30 +2445,12 @@ def survey_results(survey_id):
                         row_totals = {row: 0 for row in grid_rows}
                         col_totals = {col: 0 for col in grid_columns}
                         
-                        for answer in question.answers:
-                            if answer.value:
-                                if question.type == 'checkbox_grid' and answer.value.startswith('['):
-                                    # Для checkbox_grid - массив ответов
-                                    try:
-                                        selected_options = json.loads(answer.value)
-                                        for option in selected_options:
-                                            if '|' in option:
-                                                row, col = option.split('|', 1)
-                                                if row in grid_rows and col in grid_columns:
-                                                    key = f"{row}|{col}"
-                                                    grid_data[key] = grid_data.get(key, 0) + 1
-                                                    row_totals[row] += 1
-                                                    col_totals[col] += 1
-                                    except (json.JSONDecodeError, ValueError):
-                                        continue
-                                elif '|' in answer.value:
-                                    # Для grid - один ответ
-                                    row, col = answer.value.split('|', 1)
-                                    if row in grid_rows and col in grid_columns:
-                                        key = f"{row}|{col}"
-                                        grid_data[key] = grid_data.get(key, 0) + 1
-                                        row_totals[row] += 1
-                                        col_totals[col] += 1
+                        for (row, col), count in aggregate['grid'].items():
+                            if row in grid_rows and col in grid_columns:
+                                key = f"{row}|{col}"
+                                grid_data[key] = grid_data.get(key, 0) + count
+                                row_totals[row] += count
+                                col_totals[col] += count
                         
                         results[question.id] = {
                             'type': 'grid',
@@ -924,15 +2474,13 @@ def survey_results(survey_id):
                     }
                     
             else:  # text
-                answers = []
-                for answer in question.answers:
-                    if answer.value and answer.value.strip():
-                        answers.append(answer.value.strip())
-                
+                page = load_text_answer_page(question.id, limit=app.config.get('TEXT_ANSWERS_PAGE_SIZE', 20))
                 results[question.id] = {
                     'type': 'text',
                     'text': question.text,
-                    'answers': answers
+                    'answers': page['answers'],
+                    'total': aggregate['stats']['text_count'],
+                    'next_cursor': page['next_cursor']
                 }
                 
         except Exception as e:
@@ -943,7 +2491,8 @@ def survey_results(survey_id):
                 'error': f'Ошибка обработки: {str(e)}'
             }
     
-    return render_template('survey_results.html', survey=survey, results=results, responses=responses)
+    return render_template('survey_results.html', survey=survey, results=results, response_page=response_page,
+                           response_count=survey.response_count, last_response_at=survey.last_response_at)
 
 @app.route('/surveys/<int:survey_id>/export-excel')
 @login_required
@@ -961,13 +2510,19 @@ def export_survey_excel(survey_id):
             flash('У вас нет доступа к результатам этого опроса', 'error')
             return redirect(url_for('dashboard'))
         
+        # Большие опросы выгружаются потоково, чтобы не собирать книгу в памяти
+        response_count = survey.response_count
+        if request.args.get('stream') == '1' or response_count >= app.config.get('EXCEL_STREAMING_THRESHOLD', 2000):
+            return stream_survey_excel(survey, response_count)
+        
         # Получаем ответы и аналитику
         responses = survey.responses
         question_analytics = {}
         
         # Анализируем каждый вопрос
+        aggregates = load_question_aggregates([question.id for question in survey.questions])
         for question in survey.questions:
-            question_analytics[question.id] = analyze_question(question, responses)
+            question_analytics[question.id] = analyze_question(question, responses, aggregates[question.id])
         
         # Создаем улучшенный Excel отчет
         wb = create_enhanced_excel_report(survey, responses, question_analytics)
@@ -1003,6 +2558,369 @@ def export_survey_excel(survey_id):
 
 
 
+def _export_job_response(survey_id, job_id, status):
+    payload = dict(status)
+    payload['job_id'] = job_id
+    payload['status_url'] = url_for('excel_export_job_status', survey_id=survey_id, job_id=job_id)
+    if status['status'] == 'ready':
+        payload['download_url'] = url_for('download_excel_export', survey_id=survey_id, job_id=job_id)
+    return jsonify(payload)
+
+def _check_export_access(survey, job_id=None):
+    """Ошибка доступа к заданиям экспорта (или None): права и принадлежность ключа опросу"""
+    if not current_user.is_admin and survey.creator_id != current_user.id:
+        return jsonify({'error': 'Нет доступа'}), 403
+    if job_id is not None:
+        match = EXPORT_JOB_ID_PATTERN.match(job_id)
+        if not match or int(match.group(1)) != survey.id:
+            return jsonify({'error': 'Задание не найдено'}), 404
+    return None
+
+@app.route('/surveys/<int:survey_id>/export-jobs', methods=['POST'])
+@login_required
+def start_excel_export(survey_id):
+    """Запуск фонового построения Excel-отчета"""
+    survey = Survey.query.get_or_404(survey_id)
+    error = _check_export_access(survey)
+    if error:
+        return error
+    
+    job_id, status = start_excel_export_job(survey)
+    return _export_job_response(survey_id, job_id, status), 202 if status['status'] == 'running' else 200
+
+@app.route('/surveys/<int:survey_id>/export-jobs/<job_id>')
+@login_required
+def excel_export_job_status(survey_id, job_id):
+    """Статус задания экспорта"""
+    survey = Survey.query.get_or_404(survey_id)
+    error = _check_export_access(survey, job_id)
+    if error:
+        return error
+    
+    return _export_job_response(survey_id, job_id, get_export_job_status(get_export_directory(), job_id))
+
+@app.route('/surveys/<int:survey_id>/export-jobs/<job_id>/download')
+@login_required
+def download_excel_export(survey_id, job_id):
+    """Скачивание готового Excel-отчета"""
+    from flask import send_file
+    
+    survey = Survey.query.get_or_404(survey_id)
+    error = _check_export_access(survey, job_id)
+    if error:
+        return error
+    
+    path = export_job_paths(get_export_directory(), job_id)['artifact']
+    if not os.path.exists(path):
+        return jsonify({'error': 'Отчет еще не готов или устарел'}), 404
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=f"survey_{survey_id}_enhanced_report_{job_id.split('_', 1)[1]}.xlsx",
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        conditional=True
+    )
+
+@app.route('/surveys/<int:survey_id>/export/raw.<export_format>')
+@login_required
+def export_survey_raw(survey_id, export_format):
+    """Потоковая выгрузка сырых данных: CSV, NDJSON или колоночный BGCOL (по умолчанию в gzip)"""
+    from raw_export import EXPORT_FORMATS, gzip_stream
+    from flask import stream_with_context
+    
+    survey = Survey.query.get_or_404(survey_id)
+    
+    if not current_user.is_admin and survey.creator_id != current_user.id:
+        flash('У вас нет доступа к результатам этого опроса', 'error')
+        return redirect(url_for('dashboard'))
+    
+    if export_format not in EXPORT_FORMATS:
+        flash(f'Неизвестный формат выгрузки: {export_format}', 'error')
+        return redirect(url_for('survey_results', survey_id=survey_id))
+    
+    encoder, mimetype = EXPORT_FORMATS[export_format]
+    questions = sorted(survey.questions, key=lambda question: (question.question_order or 0, question.id))
+    columns = [
+        {'name': 'response_id', 'type': 'int'},
+        {'name': 'created_at', 'type': 'timestamp'},
+        {'name': 'user_id', 'type': 'int'},
+        {'name': 'username', 'type': 'string'},
+        {'name': 'respondent_name', 'type': 'string'},
+        {'name': 'ip_address', 'type': 'string'},
+        {'name': 'completion_time', 'type': 'int'},
+    ] + [{'name': f'question_{question.id}', 'type': 'string', 'text': question.text, 'question_type': question.type}
+         for question in questions]
+    question_ids = [question.id for question in questions]
+    
+    def rows():
+        for response, username, answers in iter_response_records(survey_id):
+            user_id = None if survey.is_anonymous else response.user_id
+            yield [
+                response.id,
+                response.created_at,
+                user_id,
+                username if user_id else None,
+                response.respondent_name,
+                response.ip_address,
+                response.completion_time
+            ] + [answers[question_id].value if question_id in answers else None for question_id in question_ids]
+    
+    chunks = encoder(columns, rows())
+    filename = f"survey_{survey_id}_raw_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    if request.args.get('gzip', '1') != '0':
+        chunks = gzip_stream(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    return app.response_class(stream_with_context(chunks), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
+
+def get_excel_summary(survey, response_count):
+    """Метрики листа резюме, посчитанные в БД (как calculate_* в enhanced_excel_export)"""
+    survey_responses = SurveyResponse.survey_id == survey.id
+    
+    completion_sum, completion_count = db.session.query(
+        db.func.sum(SurveyResponse.completion_time), db.func.count(SurveyResponse.completion_time)
+    ).filter(survey_responses, SurveyResponse.completion_time.isnot(None), SurveyResponse.completion_time != 0).one()
+    
+    # Завершенным считается ответ, в котором отвечено не меньше 80% вопросов
+    completion_rate = "0%"
+    if response_count:
+        # Группировка только по ответам этого опроса, а не по всей таблице answer
+        answers_per_response = db.session.query(
+            Answer.response_id.label('response_id'), db.func.count(Answer.id).label('answer_count')
+        ).join(SurveyResponse, SurveyResponse.id == Answer.response_id).filter(
+            survey_responses
+        ).group_by(Answer.response_id).subquery()
+        completed = db.session.query(db.func.count(SurveyResponse.id)).outerjoin(
+            answers_per_response, answers_per_response.c.response_id == SurveyResponse.id
+        ).filter(
+            survey_responses,
+            db.func.coalesce(answers_per_response.c.answer_count, 0) >= len(survey.questions) * 0.8
+        ).scalar()
+        completion_rate = f"{(completed/response_count*100):.1f}%"
+    
+    unique_ips = db.session.query(db.func.count(db.distinct(SurveyResponse.ip_address))).filter(
+        survey_responses, SurveyResponse.ip_address.isnot(None), SurveyResponse.ip_address != ''
+    ).scalar()
+    
+    return {
+        'response_count': response_count,
+        'avg_completion_time': f"{completion_sum/completion_count:.1f} мин" if completion_count else "Нет данных",
+        'completion_rate': completion_rate,
+        'unique_ips': unique_ips
+    }
+
+def iter_response_records(survey_id, batch_size=1000):
+    """Ответы опроса вместе с ответами на вопросы, по одной отправке за раз.
+    
+    Один запрос (ответ LEFT JOIN ответы на вопросы, упорядочено по id) читается
+    через yield_per, поэтому в памяти находится только текущая пачка строк.
+    """
+    query = db.select(SurveyResponse, User.username, Answer.question_id, Answer.value).outerjoin(
+        User, User.id == SurveyResponse.user_id
+    ).outerjoin(
+        Answer, Answer.response_id == SurveyResponse.id
+    ).where(
+        SurveyResponse.survey_id == survey_id
+    ).order_by(SurveyResponse.id, Answer.id).execution_options(yield_per=batch_size)
+    
+    current, username, answers = None, None, {}
+    for response, response_username, question_id, value in db.session.execute(query):
+        if current is not None and response.id != current.id:
+            yield current, username, answers
+            # Уже выгруженные ответы не держим в identity map сессии
+            db.session.expunge(current)
+            answers = {}
+        current, username = response, response_username
+        if question_id is not None and question_id not in answers:
+            answers[question_id] = SimpleNamespace(value=value)
+    if current is not None:
+        yield current, username, answers
+
+def write_survey_excel(survey, path, response_count=None):
+    """Записывает Excel-отчет опроса в файл (write-only книга, память не зависит от числа ответов)"""
+    from streaming_excel_export import write_streaming_excel_report
+    
+    if response_count is None:
+        response_count = survey.response_count
+    
+    questions = survey.questions
+    aggregates = load_question_aggregates([question.id for question in questions])
+    question_analytics = {question.id: analyze_question(question, response_count, aggregates[question.id])
+                          for question in questions}
+    summary = get_excel_summary(survey, response_count)
+    
+    return write_streaming_excel_report(path, survey, questions, summary, question_analytics,
+                                        iter_response_records(survey.id))
+
+def stream_survey_excel(survey, response_count):
+    """Потоковый Excel-экспорт: книга пишется во временный файл и отдается частями"""
+    import tempfile
+    
+    fd, path = tempfile.mkstemp(prefix=f'survey_{survey.id}_', suffix='.xlsx')
+    os.close(fd)
+    try:
+        write_survey_excel(survey, path, response_count)
+    except Exception:
+        os.remove(path)
+        raise
+    
+    def generate():
+        try:
+            with open(path, 'rb') as report:
+                while True:
+                    chunk = report.read(64 * 1024)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            os.remove(path)
+    
+    filename = f"survey_{survey.id}_enhanced_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+    return app.response_class(generate(), headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'Content-Length': str(os.path.getsize(path))
+    }, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+# ==================== ФОНОВЫЙ ЭКСПОРТ EXCEL ====================
+# Отчеты строятся в отдельном пуле процессов. Готовый файл хранится на диске под
+# ключом survey{id}_r{максимальный id ответа}_v{версия опроса}: пока в опросе нет
+# новых ответов и изменений, повторная выгрузка отдает уже готовый файл. Состояние
+# задания определяется файлами в каталоге, поэтому его видят все воркеры gunicorn.
+
+EXPORT_JOB_ID_PATTERN = re.compile(r'^survey(\d+)_r(\d+)_v(\d+)$')
+_export_executor = None
+_export_executor_lock = threading.Lock()
+
+def get_export_directory():
+    directory = app.config.get('EXPORT_ARTIFACT_DIR', 'exports')
+    if not os.path.isabs(directory):
+        directory = os.path.join(app.instance_path, directory)
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+def get_export_job_id(survey):
+    """Ключ отчета: меняется при новом ответе или изменении опроса"""
+    max_response_id = db.session.query(db.func.max(SurveyResponse.id)).filter(
+        SurveyResponse.survey_id == survey.id
+    ).scalar() or 0
+    return f"survey{survey.id}_r{max_response_id}_v{survey.version or 1}"
+
+def export_job_paths(directory, job_id):
+    base = os.path.join(directory, job_id)
+    return {
+        'artifact': base + '.xlsx',
+        'partial': base + '.xlsx.part',
+        'pending': base + '.pending',
+        'error': base + '.error'
+    }
+
+def get_export_job_status(directory, job_id):
+    """Статус задания по файлам: ready, running, failed или missing"""
+    paths = export_job_paths(directory, job_id)
+    if os.path.exists(paths['artifact']):
+        return {'status': 'ready', 'size': os.path.getsize(paths['artifact'])}
+    if os.path.exists(paths['error']):
+        with open(paths['error'], encoding='utf-8') as error_file:
+            return {'status': 'failed', 'error': error_file.read()}
+    if os.path.exists(paths['pending']):
+        age = time.time() - os.path.getmtime(paths['pending'])
+        if age < app.config.get('EXPORT_JOB_TIMEOUT', 1800):
+            return {'status': 'running', 'elapsed': round(age, 1)}
+    return {'status': 'missing'}
+
+def cleanup_export_artifacts(directory, keep_job_id=None):
+    """Удаляет устаревшие файлы отчетов.
+    
+    Удаляются: отчеты старше EXPORT_ARTIFACT_TTL, отчеты опроса keep_job_id
+    с другим ключом (вытеснены новой версией) и зависшие задания.
+    """
+    ttl = app.config.get('EXPORT_ARTIFACT_TTL', 86400)
+    job_timeout = app.config.get('EXPORT_JOB_TIMEOUT', 1800)
+    keep_prefix = None
+    if keep_job_id:
+        keep_prefix = keep_job_id.split('_', 1)[0] + '_'
+    
+    removed = 0
+    now = time.time()
+    for filename in os.listdir(directory):
+        job_id = filename.split('.', 1)[0]
+        if not EXPORT_JOB_ID_PATTERN.match(job_id) or job_id == keep_job_id:
+            continue
+        path = os.path.join(directory, filename)
+        try:
+            age = now - os.path.getmtime(path)
+            finished = filename.endswith('.xlsx') or filename.endswith('.error')
+            superseded = finished and keep_prefix is not None and job_id.startswith(keep_prefix)
+            if superseded or age > ttl or (not finished and age > job_timeout):
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            continue  # Файл уже удалил другой процесс
+    return removed
+
+def run_excel_export_job(survey_id, job_id, directory):
+    """Строит отчет в процессе пула; результат атомарно переименовывается в готовый файл"""
+    paths = export_job_paths(directory, job_id)
+    with app.app_context():
+        try:
+            survey = db.session.get(Survey, survey_id)
+            if survey is None:
+                raise ValueError(f'Опрос {survey_id} не найден')
+            write_survey_excel(survey, paths['partial'])
+            os.replace(paths['partial'], paths['artifact'])
+            cleanup_export_artifacts(directory, keep_job_id=job_id)
+        except Exception as e:
+            print(f"❌ Ошибка фонового экспорта {job_id}: {e}")
+            with open(paths['error'], 'w', encoding='utf-8') as error_file:
+                error_file.write(str(e))
+            if os.path.exists(paths['partial']):
+                os.remove(paths['partial'])
+        finally:
+            if os.path.exists(paths['pending']):
+                os.remove(paths['pending'])
+            db.session.remove()
+    return job_id
+
+def get_export_executor():
+    """Пул процессов для отчетов (spawn: дочерние процессы не наследуют соединения и потоки)"""
+    global _export_executor
+    if _export_executor is None:
+        with _export_executor_lock:
+            if _export_executor is None:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                
+                _export_executor = ProcessPoolExecutor(
+                    max_workers=app.config.get('EXPORT_JOB_WORKERS', 2),
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _export_executor
+
+def start_excel_export_job(survey):
+    """Запускает построение отчета, если готового файла для текущего ключа еще нет"""
+    directory = get_export_directory()
+    job_id = get_export_job_id(survey)
+    status = get_export_job_status(directory, job_id)
+    if status['status'] in ('ready', 'running'):
+        return job_id, status
+    
+    paths = export_job_paths(directory, job_id)
+    for stale in (paths['error'], paths['pending']):
+        if os.path.exists(stale):
+            os.remove(stale)
+    try:
+        # Маркер создается атомарно: одно задание на ключ даже при нескольких воркерах
+        os.close(os.open(paths['pending'], os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return job_id, get_export_job_status(directory, job_id)
+    
+    cleanup_export_artifacts(directory)
+    get_export_executor().submit(run_excel_export_job, survey.id, job_id, directory)
+    return job_id, {'status': 'running', 'elapsed': 0}
+
 def get_survey_type_name(survey):
     """Получение названия типа опроса"""
     if survey.is_anonymous:
@@ -1059,23 +2977,19 @@ def get_question_options_text(question):
             pass
     return "Нет вариантов"
 
-def get_question_statistics(question):
+def get_question_statistics(question, aggregate=None):
     """Получение статистики по вопросу"""
-    answers = question.answers
-    total_answers = len(answers)
+    if aggregate is None:
+        aggregate = load_question_aggregates([question.id])[question.id]
+    stats = aggregate['stats']
+    total_answers = stats['answer_count']
     
     if question.type in ['single_choice', 'multiple_choice', 'dropdown']:
         try:
             options = json.loads(question.options) if question.options else []
             if options:
-                counts = {opt: 0 for opt in options}
-                other_count = 0
-                
-                for answer in answers:
-                    if answer.is_other:
-                        other_count += 1
-                    elif answer.value in counts:
-                        counts[answer.value] += 1
+                counts = {opt: aggregate['options'].get(opt, 0) for opt in options}
+                other_count = aggregate['options'].get(OTHER_OPTION_KEY, 0)
                 
                 stats_parts = [f"{opt}: {count}" for opt, count in counts.items()]
                 if other_count > 0:
@@ -1085,37 +2999,37 @@ def get_question_statistics(question):
         except:
             pass
     elif question.type in ['rating', 'scale']:
-        ratings = [int(answer.value) for answer in answers if answer.value and answer.value.isdigit()]
-        if ratings:
-            avg = sum(ratings) / len(ratings)
-            return f"Всего: {len(ratings)}; Средний: {avg:.2f}; Мин: {min(ratings)}; Макс: {max(ratings)}"
+        from rating_stats import rating_statistics
+        
+        rating_stats = rating_statistics(aggregate['ratings'])
+        if rating_stats:
+            return (f"Всего: {rating_stats['count']}; Средний: {rating_stats['mean']:.2f}; "
+                    f"Медиана: {rating_stats['median']}; Мин: {rating_stats['min']}; Макс: {rating_stats['max']}")
     elif question.type in ['text', 'text_paragraph']:
-        if answers:
-            avg_length = sum(len(answer.value) for answer in answers if answer.value) / len(answers)
+        if total_answers:
+            avg_length = stats['text_length_total'] / total_answers
             return f"Всего: {total_answers}; Средняя длина: {avg_length:.0f} символов"
     elif question.type in ['grid', 'checkbox_grid']:
-        grid_count = 0
-        for answer in answers:
-            if '|' in answer.value:
-                grid_count += 1
+        grid_count = stats['grid_answer_count']
         return f"Всего: {total_answers}; Заполненных ячеек: {grid_count}"
     elif question.type in ['date', 'time']:
         return f"Всего: {total_answers}; Тип: {question.type}"
     
     return f"Всего ответов: {total_answers}"
 
-def get_question_analysis(question):
+def get_question_analysis(question, aggregate=None):
     """Получение анализа вопроса"""
-    answers = question.answers
-    total_answers = len(answers)
+    if aggregate is None:
+        aggregate = load_question_aggregates([question.id])[question.id]
+    stats = aggregate['stats']
+    total_answers = stats['answer_count']
     
     if total_answers == 0:
         return "Нет ответов"
     
     if question.type in ['rating', 'scale']:
-        ratings = [int(answer.value) for answer in answers if answer.value and answer.value.isdigit()]
-        if ratings:
-            avg = sum(ratings) / len(ratings)
+        if stats['rating_count']:
+            avg = stats['rating_sum'] / stats['rating_count']
             max_rating = question.rating_max or 10
             if avg >= max_rating * 0.8:
                 return "Высокие оценки"
@@ -1124,34 +3038,11 @@ def get_question_analysis(question):
             else:
                 return "Средние оценки"
     
-    elif question.type in ['single_choice', 'multiple_choice', 'dropdown']:
+    elif question.type in ['single_choice', 'multiple_choice', 'dropdown', 'checkbox']:
         try:
             options = json.loads(question.options) if question.options else []
             if options:
-                counts = {opt: 0 for opt in options}
-                for answer in answers:
-                    if answer.value in counts:
-                        counts[answer.value] += 1
-                
-                max_option = max(counts.items(), key=lambda x: x[1])
-                percentage = (max_option[1] / total_answers) * 100
-                return f"Популярный ответ: {max_option[0]} ({percentage:.1f}%)"
-        except:
-            pass
-    
-    elif question.type == 'checkbox':
-        try:
-            options = json.loads(question.options) if question.options else []
-            if options:
-                counts = {opt: 0 for opt in options}
-                for answer in answers:
-                    if answer.value.startswith('['):
-                        selected_options = json.loads(answer.value)
-                        for opt in selected_options:
-                            if opt in counts:
-                                counts[opt] += 1
-                    elif answer.value in counts:
-                        counts[answer.value] += 1
+                counts = {opt: aggregate['options'].get(opt, 0) for opt in options}
                 
                 max_option = max(counts.items(), key=lambda x: x[1])
                 percentage = (max_option[1] / total_answers) * 100
@@ -1160,20 +3051,16 @@ def get_question_analysis(question):
             pass
     
     elif question.type in ['text', 'text_paragraph']:
-        if answers:
-            avg_length = sum(len(answer.value) for answer in answers if answer.value) / len(answers)
-            if avg_length > 100:
-                return "Длинные ответы"
-            elif avg_length < 20:
-                return "Короткие ответы"
-            else:
-                return "Средние ответы"
+        avg_length = stats['text_length_total'] / total_answers
+        if avg_length > 100:
+            return "Длинные ответы"
+        elif avg_length < 20:
+            return "Короткие ответы"
+        else:
+            return "Средние ответы"
     
     elif question.type in ['grid', 'checkbox_grid']:
-        grid_count = 0
-        for answer in answers:
-            if '|' in answer.value:
-                grid_count += 1
+        grid_count = stats['grid_answer_count']
         if grid_count > total_answers * 0.8:
             return "Высокая заполняемость"
         elif grid_count < total_answers * 0.3:
@@ -1238,10 +3125,11 @@ def view_response_detail(survey_id, response_id):
         flash('Ответ не принадлежит указанному опросу', 'error')
         return redirect(url_for('survey_results', survey_id=survey_id))
     
-    # Получаем ответы на вопросы
+    # Ответы и вопросы загружаются двумя запросами и сопоставляются в памяти
+    questions_by_id = {question.id: question for question in survey.questions}
     answers = {}
-    for answer in response.answers:
-        question = answer.question
+    for answer in Answer.query.filter_by(response_id=response.id).order_by(Answer.id):
+        question = questions_by_id.get(answer.question_id)
         if question:
             answers[question.id] = {
                 'question_text': question.text,
@@ -1250,9 +3138,12 @@ def view_response_detail(survey_id, response_id):
                 'question_options': question.options
             }
     
+    respondent = db.session.get(User, response.user_id) if response.user_id else None
+    
     return render_template('response_detail.html', 
                          survey=survey, 
                          response=response, 
+                         respondent=respondent,
                          answers=answers)
 
 # LDAP маршруты
@@ -1509,6 +3400,29 @@ def cross_analysis():
                          users=users_data, period=period, survey_type=survey_type, 
                          user_id=user_id, **analytics_data)
 
+@app.route('/admin/analytics-cache/stats')
+@admin_required
+def analytics_cache_status():
+    """Статистика работы кеша аналитики"""
+    now = datetime.utcnow()
+    lookups = analytics_cache_stats['hits'] + analytics_cache_stats['misses']
+    return jsonify({
+        'process': analytics_cache_stats,
+        'hit_rate': round(analytics_cache_stats['hits'] / lookups * 100, 1) if lookups else 0,
+        'entries': AnalyticsCache.query.count(),
+        'expired_entries': AnalyticsCache.query.filter(AnalyticsCache.expires_at <= now).count()
+    })
+
+@app.route('/admin/submission-queue/stats')
+@admin_required
+def submission_queue_status():
+    """Глубина очереди отложенной записи ответов"""
+    if not app.config.get('SUBMISSION_QUEUE_ENABLED'):
+        return jsonify({'enabled': False})
+    metrics = get_submission_queue().metrics()
+    metrics['enabled'] = True
+    return jsonify(metrics)
+
 @app.route('/api/survey/<int:survey_id>/response/<int:response_id>/details')
 @login_required
 def get_response_details(survey_id, response_id):
@@ -1523,10 +3437,16 @@ def get_response_details(survey_id, response_id):
     if response.survey_id != survey_id:
         return jsonify({'error': 'Ответ не принадлежит этому опросу'}), 400
     
+    # Все ответы отправки одним запросом, сгруппированные по вопросу
+    answers_by_question = defaultdict(list)
+    for answer in Answer.query.filter_by(response_id=response_id).order_by(Answer.id):
+        answers_by_question[answer.question_id].append(answer)
+    
     # Собираем детали ответа
     details = []
     for question in survey.questions:
-        answer = Answer.query.filter_by(response_id=response_id, question_id=question.id).first()
+        question_answers = answers_by_question.get(question.id, [])
+        answer = question_answers[0] if question_answers else None
         
         answer_text = "Нет ответа"
         if answer and answer.value:
@@ -1557,14 +3477,9 @@ def get_response_details(survey_id, response_id):
                         selected_options = json.loads(answer.value)
                         answer_text = '; '.join(selected_options)
                     elif answer.value == 'other':
-                        # Ищем текст "другого варианта" в других ответах
-                        other_answers = Answer.query.filter_by(
-                            response_id=response_id, 
-                            question_id=question.id
-                        ).all()
-                        
+                        # Ищем текст "другого варианта" в других ответах на этот вопрос
                         other_text = None
-                        for other_answer in other_answers:
+                        for other_answer in question_answers:
                             if other_answer.value and other_answer.value != 'other':
                                 other_text = other_answer.value
                                 break
@@ -1591,10 +3506,9 @@ def get_response_details(survey_id, response_id):
         user_name = 'Аноним'
     elif survey.require_name:
         user_name = response.respondent_name or 'Не указано'
-    elif response.user_id and response.user:
-        user_name = response.user.username
-    elif response.user_id and not response.user:
-        user_name = 'Удален'
+    elif response.user_id:
+        user = db.session.get(User, response.user_id)
+        user_name = user.username if user else 'Удален'
     else:
         user_name = response.respondent_name or 'Аноним'
     
@@ -1607,6 +3521,123 @@ def get_response_details(survey_id, response_id):
         'details': details
     })
 
+# ==================== КРОСС-ТАБУЛЯЦИЯ ОТВЕТОВ ====================
+
+# Колоночные матрицы ответов по опросам: survey_id -> ((версия, число ответов), матрица).
+# Ключ меняется при каждой новой отправке (счетчик response_count) и изменении опроса,
+# поэтому устаревшая матрица не используется ни в одном процессе.
+_response_matrix_cache = OrderedDict()
+_response_matrix_lock = threading.Lock()
+
+def build_response_matrix(survey):
+    """Строит колоночную матрицу ответов опроса по вопросам с вариантами и оценками"""
+    from response_matrix import ResponseMatrix
+    
+    response_ids = [response_id for (response_id,) in db.session.query(SurveyResponse.id).filter(
+        SurveyResponse.survey_id == survey.id
+    ).order_by(SurveyResponse.id)]
+    matrix = ResponseMatrix(survey.id, response_ids)
+    option_ids_by_question = load_question_option_ids(
+        question for question in survey.questions if question.type in CHOICE_QUESTION_TYPES
+    )
+    # id варианта -> номер столбца индикатора (-1 - другой вариант); удаленные варианты не учитываются
+    option_positions = {}
+    for question in survey.questions:
+        if question.type in CHOICE_QUESTION_TYPES:
+            option_ids = option_ids_by_question[question.id]
+            if matrix.add_choice_column(question.id, option_ids.active_labels()['option']) is None:
+                continue  # Вариантов больше, чем помещается в битовую маску (причина - в matrix.unsupported)
+            option_positions.update({option_id: index for index, option_id in enumerate(option_ids.order['option'])})
+            if option_ids.other_id is not None:
+                option_positions[option_ids.other_id] = -1
+        elif question.type in RATING_QUESTION_TYPES:
+            matrix.add_rating_column(question.id, question.rating_min or 1, question.rating_max or 10)
+    if not matrix.columns or not response_ids:
+        return matrix
+    
+    choice_ids = [question_id for question_id, column in matrix.columns.items() if column.kind == 'choice']
+    rating_ids = [question_id for question_id, column in matrix.columns.items() if column.kind == 'rating']
+    
+    # Выборы вариантов - из AnswerSelection без разбора JSON, пачками по вопросу
+    if choice_ids:
+        selections = defaultdict(lambda: ([], []))
+        rows = db.session.query(Answer.response_id, AnswerSelection.question_id, AnswerSelection.option_id).join(
+            Answer, AnswerSelection.answer_id == Answer.id
+        ).filter(AnswerSelection.question_id.in_(choice_ids)).execution_options(yield_per=5000)
+        for response_id, question_id, option_id in rows:
+            ordinal = matrix.ordinals.get(response_id)
+            index = option_positions.get(option_id)
+            if ordinal is None or index is None:
+                continue  # Отправка появилась после выборки списка ответов или вариант удален из вопроса
+            ordinals, indices = selections[question_id]
+            ordinals.append(ordinal)
+            indices.append(index)
+        for question_id, (ordinals, indices) in selections.items():
+            matrix.columns[question_id].add_indices(ordinals, indices)
+    
+    if rating_ids:
+        rows = db.session.query(Answer.response_id, Answer.question_id, Answer.value_num).filter(
+            Answer.question_id.in_(rating_ids), Answer.value_num.isnot(None)
+        ).execution_options(yield_per=5000)
+        for response_id, question_id, rating in rows:
+            ordinal = matrix.ordinals.get(response_id)
+            if ordinal is not None:
+                matrix.columns[question_id].add(ordinal, rating)
+    return matrix
+
+def get_response_matrix(survey):
+    """Колоночная матрица ответов опроса из кеша процесса (перестраивается при новых ответах)"""
+    key = (survey.version, survey.response_count)
+    with _response_matrix_lock:
+        cached = _response_matrix_cache.get(survey.id)
+        if cached and cached[0] == key:
+            _response_matrix_cache.move_to_end(survey.id)
+            return cached[1]
+    
+    matrix = build_response_matrix(survey)
+    with _response_matrix_lock:
+        _response_matrix_cache[survey.id] = (key, matrix)
+        _response_matrix_cache.move_to_end(survey.id)
+        while len(_response_matrix_cache) > app.config.get('RESPONSE_MATRIX_CACHE_SIZE', 16):
+            _response_matrix_cache.popitem(last=False)
+    return matrix
+
+@app.route('/api/survey/<int:survey_id>/crosstab')
+@login_required
+def get_survey_crosstab(survey_id):
+    """Таблица сопряженности двух вопросов (row, col) и средние оценки по группам"""
+    from response_matrix import crosstab, group_means
+    
+    survey = Survey.query.get_or_404(survey_id)
+    if not current_user.is_admin and survey.creator_id != current_user.id:
+        return jsonify({'error': 'Нет доступа'}), 403
+    
+    row_id = request.args.get('row', type=int)
+    col_id = request.args.get('col', type=int)
+    questions = {question.id: question for question in survey.questions}
+    if row_id not in questions or col_id not in questions:
+        return jsonify({'error': 'Укажите вопросы опроса в параметрах row и col'}), 400
+    
+    matrix = get_response_matrix(survey)
+    for question_id in (row_id, col_id):
+        if question_id in matrix.unsupported:
+            return jsonify({'error': f'Кросс-табуляция недоступна: {matrix.unsupported[question_id]}'}), 400
+    if row_id not in matrix.columns or col_id not in matrix.columns:
+        return jsonify({'error': 'Кросс-табуляция доступна только для вопросов с вариантами ответа и оценок'}), 400
+    
+    row_column = matrix.columns[row_id]
+    col_column = matrix.columns[col_id]
+    result = crosstab(row_column, col_column)
+    result.update({
+        'survey_id': survey_id,
+        'responses': matrix.size,
+        'row_question': {'id': row_id, 'text': questions[row_id].text, 'type': questions[row_id].type},
+        'col_question': {'id': col_id, 'text': questions[col_id].text, 'type': questions[col_id].type},
+        # Средняя оценка по группам строк (например, оценка по отделам)
+        'means': group_means(row_column, col_column) if col_column.kind == 'rating' else None
+    })
+    return jsonify(result)
+
 @app.route('/api/analytics/survey/<int:survey_id>/chart-data')
 @login_required
 def get_survey_chart_data(survey_id):
@@ -1617,29 +3648,44 @@ def get_survey_chart_data(survey_id):
         return jsonify({'error': 'Access denied'}), 403
     
     chart_data = get_survey_chart_data_internal(survey_id)
+    
+    # Временная линия по часам, неделям или месяцам - перегруппировкой небольшой почасовой сводки
+    bucket = request.args.get('bucket', 'day')
+    if bucket != 'day' and bucket in ROLLUP_UNITS:
+        chart_data = dict(chart_data, response_timeline=response_timeline(load_hourly_rollup(survey_id), bucket))
     return jsonify(chart_data)
 
 def get_survey_analytics(survey_id):
-    """Получение аналитических данных по опросу"""
+    """Получение аналитических данных по опросу (с кешированием)"""
     survey = Survey.query.get(survey_id)
     if not survey:
         return None
     
-    responses = SurveyResponse.query.filter_by(survey_id=survey_id).all()
+    analytics = cached_analytics(f'survey:{survey_id}:analytics', lambda: _compute_survey_analytics(survey_id))
+    analytics['survey'] = survey
+    return analytics
+
+def _compute_survey_analytics(survey_id):
+    """Вычисление аналитических данных по опросу"""
     questions = Question.query.filter_by(survey_id=survey_id).order_by(Question.question_order).all()
     
+    # Число отправок, время прохождения и временные ряды - из почасовой сводки, без строк ответов
+    rollup = load_hourly_rollup(survey_id)
+    
     # Основные метрики
-    total_responses = len(responses)
+    total_responses = sum(count for _, count, _, _ in rollup)
     completion_rate = 100.0  # Все начатые опросы считаются завершенными
     
     # Время прохождения
-    completion_times = [r.completion_time for r in responses if r.completion_time]
-    avg_completion_time = sum(completion_times) / len(completion_times) if completion_times else 0
+    completion_time_sum = sum(time_sum for _, _, time_sum, _ in rollup)
+    completion_count = sum(timed for _, _, _, timed in rollup)
+    avg_completion_time = completion_time_sum / completion_count if completion_count else 0
     
     # Анализ по вопросам
     question_analytics = []
+    aggregates = load_question_aggregates([question.id for question in questions])
     for question in questions:
-        q_analytics = analyze_question(question, responses)
+        q_analytics = analyze_question(question, total_responses, aggregates[question.id])
         # Преобразуем объект Question в словарь для JSON сериализации
         q_analytics['question'] = {
             'id': question.id,
@@ -1658,13 +3704,12 @@ def get_survey_analytics(survey_id):
         question_analytics.append(q_analytics)
     
     # Временная аналитика
-    time_analytics = get_time_analytics(responses)
+    time_analytics = rollup_time_analytics(rollup)
     
     # Географическая аналитика (по IP)
-    geo_analytics = get_geo_analytics(responses)
+    geo_analytics = query_geo_analytics(SurveyResponse.survey_id == survey_id)
     
     return {
-        'survey': survey,
         'total_responses': total_responses,
         'completion_rate': completion_rate,
         'avg_completion_time': avg_completion_time,
@@ -1673,13 +3718,20 @@ def get_survey_analytics(survey_id):
         'geo_analytics': geo_analytics
     }
 
-def analyze_question(question, responses):
-    """Расширенный анализ конкретного вопроса с полезными метриками"""
-    answers = Answer.query.filter_by(question_id=question.id).all()
+def analyze_question(question, responses, aggregate=None):
+    """Расширенный анализ конкретного вопроса с полезными метриками
+    
+    responses - список ответов на опрос или уже посчитанное их количество.
+    """
+    response_count = responses if isinstance(responses, int) else len(responses)
+    if aggregate is None:
+        aggregate = load_question_aggregates([question.id])[question.id]
+    stats = aggregate['stats']
+    total_answers = stats['answer_count']
     
     analytics = {
         'question': question,
-        'total_answers': len(answers),
+        'total_answers': total_answers,
         'response_rate': 0,
         'data': {},
         'insights': [],
@@ -1689,20 +3741,14 @@ def analyze_question(question, responses):
     
     if question.type in ['single_choice', 'multiple_choice', 'dropdown']:
         options = json.loads(question.options) if question.options else []
-        option_counts = {option: 0 for option in options}
-        other_count = 0
-        
-        for answer in answers:
-            if answer.value in option_counts:
-                option_counts[answer.value] += 1
-            elif answer.is_other or answer.value == 'other':
-                other_count += 1
+        option_counts = {option: aggregate['options'].get(option, 0) for option in options}
+        other_count = aggregate['options'].get(OTHER_OPTION_KEY, 0)
         
         if other_count > 0:
             option_counts['Другие'] = other_count
         
         # Вычисляем проценты
-        total_responses = len(answers)
+        total_responses = total_answers
         option_percentages = {k: (v / total_responses * 100) if total_responses > 0 else 0 
                              for k, v in option_counts.items()}
         
@@ -1731,38 +3777,24 @@ def analyze_question(question, responses):
         if other_count > total_responses * 0.2:
             analytics['recommendations'].append("Частые 'другие' ответы указывают на необходимость пересмотра вариантов")
         
-        analytics['response_rate'] = (len(answers) / len(responses)) * 100 if responses else 0
+        analytics['response_rate'] = (total_answers / response_count) * 100 if response_count else 0
         
     elif question.type == 'checkbox':
         options = json.loads(question.options) if question.options else []
-        option_counts = {option: 0 for option in options}
-        other_count = 0
-        
-        for answer in answers:
-            if answer.value and answer.value.startswith('['):
-                selected_options = json.loads(answer.value)
-                for option in selected_options:
-                    if option in option_counts:
-                        option_counts[option] += 1
-                    elif answer.is_other:
-                        other_count += 1
+        option_counts = {option: aggregate['options'].get(option, 0) for option in options}
+        other_count = aggregate['options'].get(OTHER_OPTION_KEY, 0)
         
         if other_count > 0:
             option_counts['Другие'] = other_count
         
         # Вычисляем проценты от общего количества ответов
-        total_responses = len(answers)
+        total_responses = total_answers
         option_percentages = {k: (v / total_responses * 100) if total_responses > 0 else 0 
                              for k, v in option_counts.items()}
         
         # Статистика по количеству выбранных вариантов
-        selections_per_response = []
-        for answer in answers:
-            if answer.value and answer.value.startswith('['):
-                selections = len(json.loads(answer.value))
-                selections_per_response.append(selections)
-        
-        avg_selections = sum(selections_per_response) / len(selections_per_response) if selections_per_response else 0
+        selection_answers = stats['selection_answer_count']
+        avg_selections = stats['selection_total'] / selection_answers if selection_answers else 0
         
         analytics['data'] = {
             'counts': option_counts,
@@ -1776,36 +3808,29 @@ def analyze_question(question, responses):
         if avg_selections > len(options) * 0.7:
             analytics['recommendations'].append("Пользователи выбирают много вариантов - рассмотрите ограничение количества выборов")
         
-        analytics['response_rate'] = (len(answers) / len(responses)) * 100 if responses else 0
+        analytics['response_rate'] = (total_answers / response_count) * 100 if response_count else 0
         
     elif question.type in ['rating', 'scale']:
-        ratings = [int(answer.value) for answer in answers if answer.value and answer.value.isdigit()]
-        if ratings:
-            min_rating = question.rating_min or 1
-            max_rating = question.rating_max or 10
-            
-            avg_rating = sum(ratings) / len(ratings)
-            median_rating = sorted(ratings)[len(ratings) // 2]
-            
-            # Распределение по шкале
-            distribution = {str(i): ratings.count(i) for i in range(min_rating, max_rating + 1)}
-            
-            # Стандартное отклонение
-            variance = sum((x - avg_rating) ** 2 for x in ratings) / len(ratings)
-            std_deviation = variance ** 0.5
-            
-            # Коэффициент вариации
-            cv = (std_deviation / avg_rating) * 100 if avg_rating > 0 else 0
+        from rating_stats import rating_statistics
+        
+        min_rating = question.rating_min or 1
+        max_rating = question.rating_max or 10
+        rating_stats = rating_statistics(aggregate['ratings'], min_rating, max_rating)
+        if rating_stats:
+            avg_rating = rating_stats['mean']
+            std_deviation = rating_stats['std']
+            cv = rating_stats['coefficient_of_variation']
             
             analytics['data'] = {
-                'min': min(ratings),
-                'max': max(ratings),
+                'min': rating_stats['min'],
+                'max': rating_stats['max'],
                 'avg': round(avg_rating, 2),
-                'median': median_rating,
+                'median': rating_stats['median'],
                 'std_deviation': round(std_deviation, 2),
                 'coefficient_of_variation': round(cv, 2),
-                'distribution': distribution,
-                'total_responses': len(ratings)
+                'percentiles': {str(q): round(value, 2) for q, value in rating_stats['percentiles'].items()},
+                'distribution': {str(value): count for value, count in rating_stats['distribution'].items()},
+                'total_responses': rating_stats['count']
             }
             
             # Инсайты
@@ -1823,33 +3848,29 @@ def analyze_question(question, responses):
             if std_deviation > (max_rating - min_rating) * 0.3:
                 analytics['recommendations'].append("Большой разброс оценок - рассмотрите уточняющие вопросы")
             
-        analytics['response_rate'] = (len(answers) / len(responses)) * 100 if responses else 0
+        analytics['response_rate'] = (total_answers / response_count) * 100 if response_count else 0
         
     elif question.type in ['text', 'text_paragraph']:
-        text_answers = [answer.value for answer in answers if answer.value and answer.value.strip()]
-        
-        if text_answers:
-            lengths = [len(text) for text in text_answers]
-            avg_length = sum(lengths) / len(lengths)
-            median_length = sorted(lengths)[len(lengths) // 2]
-            max_length = max(lengths)
-            min_length = min(lengths)
-            
-            # Анализ ключевых слов (простейший)
-            all_words = []
-            for text in text_answers:
-                words = text.lower().split()
-                all_words.extend(words)
-            
-            word_freq = {}
-            for word in all_words:
-                if len(word) > 3:  # Игнорируем короткие слова
-                    word_freq[word] = word_freq.get(word, 0) + 1
+        if stats['text_count']:
+            # Медиана длины и примеры ответов читаются запросами с LIMIT, а не всеми текстами
+            non_empty = db.and_(
+                Answer.question_id == question.id,
+                Answer.value.isnot(None),
+                db.func.trim(Answer.value) != ''
+            )
+            median_length = db.session.query(db.func.length(Answer.value)).filter(non_empty).order_by(
+                db.func.length(Answer.value)
+            ).offset(stats['text_count'] // 2).limit(1).scalar()
+            text_answers = [value for (value,) in db.session.query(Answer.value).filter(non_empty).order_by(Answer.id).limit(3)]
+            avg_length = stats['text_length_total'] / stats['text_count']
+            max_length = stats['text_length_max']
+            min_length = stats['text_length_min']
             
-            top_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)[:10]
+            # Ключевые слова - из частотного словаря вопроса (основы без стоп-слов)
+            top_words = load_top_terms(question.id, stats['text_count'])
             
             analytics['data'] = {
-                'total_texts': len(text_answers),
+                'total_texts': stats['text_count'],
                 'avg_length': round(avg_length, 1),
                 'median_length': median_length,
                 'max_length': max_length,
@@ -1867,32 +3888,18 @@ def analyze_question(question, responses):
             if top_words:
                 analytics['insights'].append(f"Частые слова: {', '.join([w[0] for w in top_words[:5]])}")
             
-        analytics['response_rate'] = (len(answers) / len(responses)) * 100 if responses else 0
+        analytics['response_rate'] = (total_answers / response_count) * 100 if response_count else 0
         
     elif question.type in ['grid', 'checkbox_grid']:
         grid_data = {}
         row_totals = {}
         col_totals = {}
         
-        for answer in answers:
-            if answer.value:
-                if answer.value.startswith('['):
-                    # checkbox_grid - массив ответов
-                    selected_options = json.loads(answer.value)
-                    for option in selected_options:
-                        if '|' in option:
-                            row, col = option.split('|', 1)
-                            key = f"{row}|{col}"
-                            grid_data[key] = grid_data.get(key, 0) + 1
-                            row_totals[row] = row_totals.get(row, 0) + 1
-                            col_totals[col] = col_totals.get(col, 0) + 1
-                elif '|' in answer.value:
-                    # grid - один ответ
-                    row, col = answer.value.split('|', 1)
-                    key = f"{row}|{col}"
-                    grid_data[key] = grid_data.get(key, 0) + 1
-                    row_totals[row] = row_totals.get(row, 0) + 1
-                    col_totals[col] = col_totals.get(col, 0) + 1
+        for (row, col), count in aggregate['grid'].items():
+            key = f"{row}|{col}"
+            grid_data[key] = grid_data.get(key, 0) + count
+            row_totals[row] = row_totals.get(row, 0) + count
+            col_totals[col] = col_totals.get(col, 0) + count
         
         # Находим наиболее популярные комбинации
         sorted_combinations = sorted(grid_data.items(), key=lambda x: x[1], reverse=True)
@@ -1909,140 +3916,297 @@ def analyze_question(question, responses):
             most_popular = sorted_combinations[0]
             analytics['insights'].append(f"Наиболее популярная комбинация: {most_popular[0]} ({most_popular[1]} раз)")
         
-        analytics['response_rate'] = (len(answers) / len(responses)) * 100 if responses else 0
+        analytics['response_rate'] = (total_answers / response_count) * 100 if response_count else 0
         
     elif question.type in ['date', 'time']:
-        date_time_answers = [answer.value for answer in answers if answer.value]
+        # Диапазон и распределение считаются в SQL по типизированным полям, текст читается только для примеров
+        answered = db.and_(Answer.question_id == question.id, Answer.value.isnot(None), Answer.value != '')
+        sample_answers = [value for (value,) in db.session.query(Answer.value).filter(answered).order_by(Answer.id).limit(10)]
         
-        if date_time_answers:
+        if sample_answers:
             # Анализ дат
             if question.type == 'date':
-                try:
-                    dates = [datetime.strptime(d, '%Y-%m-%d').date() for d in date_time_answers]
-                    min_date = min(dates)
-                    max_date = max(dates)
+                min_date, max_date, dated_count = db.session.query(
+                    db.func.min(Answer.value_date), db.func.max(Answer.value_date), db.func.count(Answer.value_date)
+                ).filter(Answer.question_id == question.id).one()
+                
+                if dated_count:
+                    month = time_bucket(Answer.value_date, 'month')
+                    by_month = db.session.query(month, db.func.count(Answer.id)).filter(
+                        Answer.question_id == question.id, Answer.value_date.isnot(None)
+                    ).group_by(month).order_by(month).all()
                     date_range = (max_date - min_date).days
                     
                     analytics['data'] = {
-                        'answers': date_time_answers,
+                        'answers': sample_answers,
                         'min_date': min_date.isoformat(),
                         'max_date': max_date.isoformat(),
                         'date_range_days': date_range,
-                        'total_answers': len(date_time_answers)
+                        'by_month': {bucket: count for bucket, count in by_month},
+                        'total_answers': dated_count
                     }
                     
                     if date_range > 365:
                         analytics['insights'].append(f"Широкий диапазон дат: {date_range} дней")
-                    
-                except:
-                    analytics['data'] = {'answers': date_time_answers}
+                else:
+                    analytics['data'] = {'answers': sample_answers}
             else:
-                # Анализ времени
+                # Анализ времени (value_num - минуты от полуночи)
+                earliest, latest, timed_count = db.session.query(
+                    db.func.min(Answer.value_num), db.func.max(Answer.value_num), db.func.count(Answer.value_num)
+                ).filter(Answer.question_id == question.id).one()
+                hour = Answer.value_num // 60
+                by_hour = db.session.query(hour, db.func.count(Answer.id)).filter(
+                    Answer.question_id == question.id, Answer.value_num.isnot(None)
+                ).group_by(hour).order_by(hour).all()
+                
                 analytics['data'] = {
-                    'answers': date_time_answers,
-                    'total_answers': len(date_time_answers)
+                    'answers': sample_answers,
+                    'total_answers': timed_count or total_answers,
+                    'earliest': f"{earliest // 60:02d}:{earliest % 60:02d}" if earliest is not None else None,
+                    'latest': f"{latest // 60:02d}:{latest % 60:02d}" if latest is not None else None,
+                    'by_hour': {int(bucket): count for bucket, count in by_hour}
                 }
         
-        analytics['response_rate'] = (len(answers) / len(responses)) * 100 if responses else 0
+        analytics['response_rate'] = (total_answers / response_count) * 100 if response_count else 0
     
     # Общие статистики
     analytics['statistics'] = {
         'response_rate': analytics['response_rate'],
-        'total_responses': len(answers),
-        'completion_rate': (len(answers) / len(responses)) * 100 if responses else 0,
+        'total_responses': total_answers,
+        'completion_rate': (total_answers / response_count) * 100 if response_count else 0,
         'is_required': question.is_required
     }
     
     return analytics
 
-def get_time_analytics(responses):
-    """Анализ по времени"""
-    if not responses:
+ROLLUP_UNITS = ('hour', 'day', 'week', 'month')
+
+def load_hourly_rollup(survey_id=None):
+    """Почасовая сводка отправок (по всем опросам или одному): строки (час, отправок, сумма времени, с временем)"""
+    query = db.session.query(
+        SurveyHourlyRollup.hour_bucket,
+        db.func.sum(SurveyHourlyRollup.response_count),
+        db.func.sum(SurveyHourlyRollup.completion_time_sum),
+        db.func.sum(SurveyHourlyRollup.completion_count)
+    ).group_by(SurveyHourlyRollup.hour_bucket).order_by(SurveyHourlyRollup.hour_bucket)
+    if survey_id is not None:
+        query = query.filter(SurveyHourlyRollup.survey_id == survey_id)
+    return query.all()
+
+def load_response_hours(*criteria):
+    """Отправки, сгруппированные по часу в БД, в формате строк почасовой сводки (criteria - фильтры SurveyResponse)
+    
+    Для срезов, которых нет в SurveyHourlyRollup (например, ответы одного пользователя по всем опросам).
+    """
+    bucket = time_bucket(SurveyResponse.created_at, 'day_hour')
+    has_time = db.and_(SurveyResponse.completion_time.isnot(None), SurveyResponse.completion_time > 0)
+    rows = db.session.query(
+        bucket, db.func.count(SurveyResponse.id),
+        db.func.coalesce(db.func.sum(db.case((has_time, SurveyResponse.completion_time), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((has_time, 1), else_=0)), 0)
+    ).filter(SurveyResponse.created_at.isnot(None), *criteria).group_by(bucket).order_by(bucket).all()
+    return [(datetime.strptime(hour, '%Y-%m-%d %H'), count, completion_sum, completion_count)
+            for hour, count, completion_sum, completion_count in rows]
+
+def rebucket_rollup(rows, unit):
+    """Сворачивает почасовую сводку в ряд по часам, дням, неделям (с понедельника) или месяцам"""
+    formats = {'hour': '%Y-%m-%d %H:00', 'day': '%Y-%m-%d', 'month': '%Y-%m'}
+    series = {}
+    for hour_bucket, count, _, _ in rows:
+        if unit == 'week':
+            key = (hour_bucket - timedelta(days=hour_bucket.weekday())).strftime('%Y-%m-%d')
+        else:
+            key = hour_bucket.strftime(formats[unit])
+        series[key] = series.get(key, 0) + count
+    return series
+
+def rollup_time_analytics(rows):
+    """Активность по дням и часам и пиковый час по почасовой сводке отправок"""
+    if not rows:
         return {}
-    
-    # Группировка по дням
-    daily_responses = {}
-    for response in responses:
-        date_key = response.created_at.strftime('%Y-%m-%d')
-        daily_responses[date_key] = daily_responses.get(date_key, 0) + 1
-    
-    # Группировка по часам
     hourly_responses = {}
-    for response in responses:
-        hour_key = response.created_at.hour
-        hourly_responses[hour_key] = hourly_responses.get(hour_key, 0) + 1
-    
+    for hour_bucket, count, _, _ in rows:
+        hourly_responses[hour_bucket.hour] = hourly_responses.get(hour_bucket.hour, 0) + count
     return {
-        'daily': daily_responses,
+        'daily': rebucket_rollup(rows, 'day'),
         'hourly': hourly_responses,
         'peak_hour': max(hourly_responses.items(), key=lambda x: x[1])[0] if hourly_responses else 0
     }
 
-def get_geo_analytics(responses):
-    """Географическая аналитика (упрощенная по IP)"""
-    if not responses:
+def time_bucket(column, unit):
+    """Выражение группировки даты для текущей СУБД: 'day' -> 'YYYY-MM-DD', 'month' -> 'YYYY-MM',
+    'day_hour' -> 'YYYY-MM-DD HH', 'hour' -> 0..23"""
+    dialect = db.engine.dialect.name
+    if unit == 'day_hour':
+        if dialect == 'sqlite':
+            return db.func.strftime('%Y-%m-%d %H', column)
+        if dialect == 'postgresql':
+            return db.func.to_char(column, 'YYYY-MM-DD HH24')
+        if dialect == 'mysql':
+            return db.func.date_format(column, '%Y-%m-%d %H')
+        return db.func.substr(db.cast(column, db.String), 1, 13)
+    if unit == 'month':
+        if dialect == 'sqlite':
+            return db.func.strftime('%Y-%m', column)
+        if dialect == 'postgresql':
+            return db.func.to_char(column, 'YYYY-MM')
+        if dialect == 'mysql':
+            return db.func.date_format(column, '%Y-%m')
+        return db.func.substr(db.cast(column, db.String), 1, 7)
+    if unit == 'day':
+        if dialect == 'sqlite':
+            return db.func.strftime('%Y-%m-%d', column)
+        if dialect == 'postgresql':
+            return db.func.to_char(column, 'YYYY-MM-DD')
+        if dialect == 'mysql':
+            return db.func.date_format(column, '%Y-%m-%d')
+        return db.cast(db.func.date(column), db.String)
+    if unit == 'hour':
+        if dialect == 'sqlite':
+            return db.cast(db.func.strftime('%H', column), db.Integer)
+        return db.cast(db.extract('hour', column), db.Integer)
+    raise ValueError(f'Неизвестная единица группировки: {unit}')
+
+def user_activity_query():
+    """Запрос (User, число созданных опросов, число данных ответов) - считается группировкой в БД"""
+    surveys_by_creator = db.session.query(
+        Survey.creator_id.label('user_id'), db.func.count(Survey.id).label('survey_count')
+    ).group_by(Survey.creator_id).subquery()
+    responses_by_user = db.session.query(
+        SurveyResponse.user_id.label('user_id'), db.func.count(SurveyResponse.id).label('response_count')
+    ).filter(SurveyResponse.user_id.isnot(None)).group_by(SurveyResponse.user_id).subquery()
+    
+    survey_count = db.func.coalesce(surveys_by_creator.c.survey_count, 0)
+    response_count = db.func.coalesce(responses_by_user.c.response_count, 0)
+    query = db.session.query(User, survey_count, response_count).outerjoin(
+        surveys_by_creator, surveys_by_creator.c.user_id == User.id
+    ).outerjoin(
+        responses_by_user, responses_by_user.c.user_id == User.id
+    )
+    return query, survey_count, response_count
+
+_prefix_database = None
+_prefix_database_lock = threading.Lock()
+
+def get_prefix_database():
+    """Локальная база сетевых префиксов (загружается один раз на процесс)"""
+    global _prefix_database
+    if _prefix_database is None:
+        with _prefix_database_lock:
+            if _prefix_database is None:
+                path = app.config.get('GEO_DATABASE_PATH')
+                database = load_prefix_database(path, app.config.get('GEO_LOOKUP_CACHE_SIZE', 4096))
+                if len(database):
+                    print(f"🌍 Загружена база сетевых префиксов: {len(database)} диапазонов")
+                else:
+                    print(f"⚠️  База сетевых префиксов {path} не найдена или пуста, страны и провайдеры не определяются")
+                _prefix_database = database
+    return _prefix_database
+
+def query_geo_analytics(*criteria):
+    """Географическая аналитика: группировка ответов по сетевому префиксу в БД и поиск префиксов в локальной базе
+    
+    criteria - фильтры SurveyResponse. ip_groups - число ответов по сетям, countries/cities/providers -
+    по данным базы префиксов (сети, которых нет в базе, не учитываются).
+    """
+    rows = db.session.query(
+        SurveyResponse.network_prefix, db.func.count(SurveyResponse.id), db.func.count(db.distinct(SurveyResponse.ip_address))
+    ).filter(*criteria).group_by(SurveyResponse.network_prefix).order_by(db.func.min(SurveyResponse.id)).all()
+    if not rows:
         return {}
     
-    # Группировка по IP (упрощенная геолокация)
+    database = get_prefix_database()
     ip_groups = {}
-    for response in responses:
-        # Упрощенная группировка по первым трем октетам IP
-        ip_parts = response.ip_address.split('.')
-        if len(ip_parts) >= 3:
-            ip_group = '.'.join(ip_parts[:3]) + '.x'
-            ip_groups[ip_group] = ip_groups.get(ip_group, 0) + 1
+    located = {field: {} for field in GEO_FIELDS}
+    for prefix, count, _ in rows:
+        if not prefix:
+            continue
+        ip_groups[prefix] = count
+        record = database.lookup_prefix(prefix)
+        for field in GEO_FIELDS:
+            if record and record[field]:
+                located[field][record[field]] = located[field].get(record[field], 0) + count
     
     return {
         'ip_groups': ip_groups,
-        'unique_ips': len(set(r.ip_address for r in responses))
+        # Адрес всегда попадает в одну сеть, поэтому уникальные адреса сетей не пересекаются
+        'unique_ips': sum(unique for _, _, unique in rows),
+        'countries': located['country'],
+        'cities': located['city'],
+        'providers': located['provider']
     }
 
+def rebuild_network_prefixes(batch_size=5000):
+    """Заполняет сетевые префиксы ответов по ip_address (одно обновление на уникальный адрес)"""
+    addresses = [ip_address for (ip_address,) in db.session.query(SurveyResponse.ip_address).distinct()]
+    table = SurveyResponse.__table__
+    for start in range(0, len(addresses), batch_size):
+        db.session.execute(
+            table.update().where(table.c.ip_address == db.bindparam('address')).values(
+                network_prefix=db.bindparam('prefix')
+            ),
+            [{'address': address, 'prefix': network_prefix(address)} for address in addresses[start:start + batch_size]]
+        )
+    db.session.commit()
+    return len(addresses)
+
 def get_global_analytics():
-    """Глобальная аналитика по всем опросам"""
-    surveys = Survey.query.all()
-    users = User.query.all()
-    all_responses = SurveyResponse.query.all()
-    
+    """Глобальная аналитика по всем опросам (с кешированием)"""
+    return cached_analytics('global:analytics', _compute_global_analytics,
+                            ttl=app.config.get('GLOBAL_ANALYTICS_CACHE_TTL', 60))
+
+def _compute_global_analytics():
+    """Вычисление глобальной аналитики по всем опросам (несколько GROUP BY запросов, без обхода ответов)"""
     # Общая статистика
-    total_surveys = len(surveys)
-    total_users = len(users)
-    total_responses = len(all_responses)
-    
-    # Активные опросы (с ответами)
-    active_surveys = len([s for s in surveys if len(s.responses) > 0])
+    total_surveys = db.session.query(db.func.count(Survey.id)).scalar()
+    total_users, admins_count, creators_count = db.session.query(
+        db.func.count(User.id),
+        db.func.coalesce(db.func.sum(db.case((User.is_admin == True, 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((User.can_create_surveys == True, 1), else_=0)), 0)
+    ).one()
+    
+    # Количество ответов и активные опросы (с ответами) - по счетчикам опросов
+    total_responses, active_surveys = db.session.query(
+        db.func.coalesce(db.func.sum(Survey.response_count), 0),
+        db.func.coalesce(db.func.sum(db.case((Survey.response_count > 0, 1), else_=0)), 0)
+    ).one()
     
     # Топ опросы по количеству ответов (конвертируем в словари)
+    top_surveys_rows = db.session.query(Survey, User.username).outerjoin(
+        User, User.id == Survey.creator_id
+    ).order_by(Survey.response_count.desc(), Survey.id).limit(10).all()
+    
     top_surveys_data = []
-    for survey in sorted(surveys, key=lambda x: len(x.responses), reverse=True)[:10]:
+    for survey, creator_name in top_surveys_rows:
         top_surveys_data.append({
             'id': survey.id,
             'title': survey.title,
             'description': survey.description,
-            'creator': survey.creator.username if survey.creator else 'Неизвестно',
-            'response_count': len(survey.responses),
+            'creator': creator_name if creator_name else 'Неизвестно',
+            'response_count': survey.response_count,
             'created_at': survey.created_at.isoformat() if survey.created_at else None,
             'is_active': survey.is_active
         })
     
-    # Статистика по пользователям
-    unique_respondents = set()
-    for response in all_responses:
-        if response.user_id:
-            unique_respondents.add(response.user_id)
-        elif response.respondent_name:
-            unique_respondents.add(f"name_{response.respondent_name}")
-        else:
-            unique_respondents.add("anonymous")
+    # Статистика по пользователям: пользователи, имена и все анонимные как один респондент
+    without_user = SurveyResponse.user_id.is_(None)
+    named = db.and_(without_user, SurveyResponse.respondent_name.isnot(None), SurveyResponse.respondent_name != '')
+    users_count, names_count, has_anonymous = db.session.query(
+        db.func.count(db.distinct(SurveyResponse.user_id)),
+        db.func.count(db.distinct(db.case((named, SurveyResponse.respondent_name)))),
+        db.func.max(db.case((db.and_(without_user, db.not_(named)), 1), else_=0))
+    ).one()
     
     user_stats = {
         'total': total_users,
-        'admins': len([u for u in users if u.is_admin]),
-        'survey_creators': len([u for u in users if u.can_create_surveys]),
-        'active_respondents': len(unique_respondents)
+        'admins': admins_count,
+        'survey_creators': creators_count,
+        'active_respondents': users_count + names_count + (has_anonymous or 0)
     }
     
     # Временная статистика
-    time_stats = get_time_analytics(all_responses)
+    time_stats = rollup_time_analytics(load_hourly_rollup())
     
     # Данные для графиков по времени
     daily_data = time_stats.get('daily', {})
@@ -2055,32 +4219,28 @@ def get_global_analytics():
     hourly_labels = [f"{hour:02d}:00" for hour in range(24)]
     hourly_values = [hourly_data.get(hour, 0) for hour in range(24)]
     
-    # Топ пользователей
-    top_users_data = []
-    for user in users:
-        user_surveys = Survey.query.filter_by(creator_id=user.id).count()
-        user_responses = SurveyResponse.query.filter_by(user_id=user.id).count()
-        if user_surveys > 0 or user_responses > 0:
-            top_users_data.append({
-                'username': user.username,
-                'survey_count': user_surveys,
-                'total_responses': user_responses
-            })
-    
-    # Сортируем по количеству ответов
-    top_users_data.sort(key=lambda x: x['total_responses'], reverse=True)
-    top_users_data = top_users_data[:10]
+    # Топ пользователей: опросы и ответы считаются группировкой, а не запросами на каждого
+    activity, user_surveys, user_responses = user_activity_query()
+    top_users_rows = activity.filter(
+        db.or_(user_surveys > 0, user_responses > 0)
+    ).order_by(user_responses.desc(), User.id).limit(10).all()
+    
+    top_users_data = [{
+        'username': user.username,
+        'survey_count': survey_count,
+        'total_responses': total
+    } for user, survey_count, total in top_users_rows]
     
     # Типы опросов
     survey_types_labels = ['Анонимные', 'С авторизацией', 'С вводом имени']
-    survey_types_data = [
-        len([s for s in surveys if s.is_anonymous]),
-        len([s for s in surveys if s.require_auth]),
-        len([s for s in surveys if s.require_name])
-    ]
+    survey_types_data = [int(value or 0) for value in db.session.query(
+        db.func.sum(db.case((Survey.is_anonymous == True, 1), else_=0)),
+        db.func.sum(db.case((Survey.require_auth == True, 1), else_=0)),
+        db.func.sum(db.case((Survey.require_name == True, 1), else_=0))
+    ).one()]
     
     # Географическая аналитика
-    geo_analytics = get_geo_analytics(all_responses)
+    geo_analytics = query_geo_analytics()
     geo_labels = list(geo_analytics.get('ip_groups', {}).keys())
     geo_data = list(geo_analytics.get('ip_groups', {}).values())
     
@@ -2089,9 +4249,9 @@ def get_global_analytics():
     
     # Географическая статистика
     unique_ips = geo_analytics.get('unique_ips', 0)
-    countries_count = len(geo_labels)  # Упрощенная статистика
-    cities_count = len(geo_labels)     # Упрощенная статистика
-    providers_count = len(geo_labels)  # Упрощенная статистика
+    countries_count = len(geo_analytics.get('countries', {}))
+    cities_count = len(geo_analytics.get('cities', {}))
+    providers_count = len(geo_analytics.get('providers', {}))
     
     # Данные для графиков активности (упрощенные)
     activity_labels = ['Опросы', 'Ответы', 'Пользователи']
@@ -2123,24 +4283,31 @@ def get_global_analytics():
         'activity_data': activity_data
     }
 
+USER_RECENT_RESPONSES = 50  # Ответов пользователя в списке аналитики (всего - total_responses_given)
+
 def get_user_analytics(user_id):
     """Аналитика по пользователю"""
     user = User.query.get(user_id)
     if not user:
         return None
     
-    # Опросы пользователя
+    # Опросы пользователя (счетчики ответов - из денормализованных полей Survey)
     user_surveys = Survey.query.filter_by(creator_id=user_id).all()
     
-    # Ответы пользователя
-    user_responses = SurveyResponse.query.filter_by(user_id=user_id).all()
-    
-    # Статистика
+    # Статистика: ответы пользователя считаются в БД, строки ответов не загружаются
     total_surveys_created = len(user_surveys)
-    total_responses_given = len(user_responses)
+    user_responses = SurveyResponse.user_id == user_id
+    total_responses_given = db.session.query(db.func.count(SurveyResponse.id)).filter(user_responses).scalar()
     
-    # Активность по времени
-    activity_stats = get_time_analytics(user_responses)
+    # Активность по времени - группировкой по часам в БД
+    activity_stats = rollup_time_analytics(load_response_hours(user_responses))
+    
+    # Последние ответы пользователя с названием опроса одним запросом
+    recent_responses = db.session.query(
+        SurveyResponse.id, SurveyResponse.survey_id, Survey.title, SurveyResponse.created_at, SurveyResponse.completion_time
+    ).outerjoin(Survey, Survey.id == SurveyResponse.survey_id).filter(user_responses).order_by(
+        SurveyResponse.created_at.desc(), SurveyResponse.id.desc()
+    ).limit(USER_RECENT_RESPONSES).all()
     
     # Конвертируем опросы в словари
     surveys_data = []
@@ -2149,20 +4316,20 @@ def get_user_analytics(user_id):
             'id': survey.id,
             'title': survey.title,
             'description': survey.description,
-            'response_count': len(survey.responses),
+            'response_count': survey.response_count,
             'created_at': survey.created_at.isoformat() if survey.created_at else None,
             'is_active': survey.is_active
         })
     
     # Конвертируем ответы в словари
     responses_data = []
-    for response in user_responses:
+    for response_id, survey_id, survey_title, created_at, completion_time in recent_responses:
         responses_data.append({
-            'id': response.id,
-            'survey_id': response.survey_id,
-            'survey_title': response.survey.title if response.survey else 'Неизвестный опрос',
-            'created_at': response.created_at.isoformat() if response.created_at else None,
-            'completion_time': response.completion_time
+            'id': response_id,
+            'survey_id': survey_id,
+            'survey_title': survey_title if survey_title is not None else 'Неизвестный опрос',
+            'created_at': created_at.isoformat() if created_at else None,
+            'completion_time': completion_time
         })
     
     return {
@@ -2181,47 +4348,61 @@ def get_user_analytics(user_id):
     }
 
 def get_cross_analysis(period='month', survey_type='all', user_id='all'):
-    """Кросс-анализ между опросами"""
+    """Кросс-анализ между опросами (с кешированием)"""
+    return cached_analytics(f'cross:{period}:{survey_type}:{user_id}',
+                            lambda: _compute_cross_analysis(period, survey_type, user_id),
+                            ttl=app.config.get('GLOBAL_ANALYTICS_CACHE_TTL', 60))
+
+def _compute_cross_analysis(period, survey_type, user_id):
+    """Вычисление кросс-анализа между опросами (группировкой в БД, без обхода ответов)"""
     # Применяем фильтры
-    query = Survey.query
+    criteria = []
     
     if survey_type != 'all':
         if survey_type == 'anonymous':
-            query = query.filter_by(is_anonymous=True)
+            criteria.append(Survey.is_anonymous == True)
         elif survey_type == 'auth_required':
-            query = query.filter_by(require_auth=True)
+            criteria.append(Survey.require_auth == True)
         elif survey_type == 'name_required':
-            query = query.filter_by(require_name=True)
+            criteria.append(Survey.require_name == True)
     
     if user_id != 'all':
-        query = query.filter_by(creator_id=user_id)
+        criteria.append(Survey.creator_id == user_id)
     
-    surveys = query.all()
+    # Анализ популярности типов вопросов (в порядке появления: по опросам, затем по вопросам)
+    type_rows = db.session.query(
+        Question.survey_id, Question.type, db.func.min(Question.id), db.func.count(Question.id)
+    ).join(Survey, Survey.id == Question.survey_id).filter(*criteria).group_by(
+        Question.survey_id, Question.type
+    ).order_by(Question.survey_id, db.func.min(Question.id)).all()
     
-    # Анализ популярности типов вопросов
     question_types = {}
-    for survey in surveys:
-        for question in survey.questions:
-            question_types[question.type] = question_types.get(question.type, 0) + 1
-    
-    # Анализ эффективности типов опросов
-    survey_type_effectiveness = {
-        'anonymous': {'total': 0, 'responses': 0, 'avg_responses': 0},
-        'auth_required': {'total': 0, 'responses': 0, 'avg_responses': 0},
-        'name_required': {'total': 0, 'responses': 0, 'avg_responses': 0}
-    }
-    
-    for survey in surveys:
-        response_count = len(survey.responses)
-        if survey.is_anonymous:
-            survey_type_effectiveness['anonymous']['total'] += 1
-            survey_type_effectiveness['anonymous']['responses'] += response_count
-        if survey.require_auth:
-            survey_type_effectiveness['auth_required']['total'] += 1
-            survey_type_effectiveness['auth_required']['responses'] += response_count
-        if survey.require_name:
-            survey_type_effectiveness['name_required']['total'] += 1
-            survey_type_effectiveness['name_required']['responses'] += response_count
+    for _, question_type, _, count in type_rows:
+        question_types[question_type] = question_types.get(question_type, 0) + count
+    
+    # Анализ эффективности типов опросов (по счетчикам ответов опросов)
+    response_count = Survey.response_count
+    
+    def type_totals(flag):
+        return (db.func.coalesce(db.func.sum(db.case((flag == True, 1), else_=0)), 0),
+                db.func.coalesce(db.func.sum(db.case((flag == True, response_count), else_=0)), 0))
+    
+    totals = db.session.query(
+        db.func.count(Survey.id),
+        db.func.coalesce(db.func.sum(response_count), 0),
+        *type_totals(Survey.is_anonymous),
+        *type_totals(Survey.require_auth),
+        *type_totals(Survey.require_name)
+    ).select_from(Survey).filter(*criteria).one()
+    surveys_count, total_responses = totals[0], totals[1]
+    
+    survey_type_effectiveness = {}
+    for index, survey_type_key in enumerate(['anonymous', 'auth_required', 'name_required']):
+        survey_type_effectiveness[survey_type_key] = {
+            'total': totals[2 + index * 2],
+            'responses': totals[3 + index * 2],
+            'avg_responses': 0
+        }
     
     # Вычисляем средние значения
     for survey_type_key in survey_type_effectiveness:
@@ -2231,39 +4412,35 @@ def get_cross_analysis(period='month', survey_type='all', user_id='all'):
                 survey_type_effectiveness[survey_type_key]['total'], 2
             )
     
-    # Анализ по периодам
-    period_stats = get_period_analysis(surveys, period)
+    # Анализ по периодам: все окна считаются за один проход
+    periods = get_period_analysis(criteria, ['week', 'month', 'quarter', 'year', period])
+    period_stats = periods[period]
     
     # Статистика по пользователям
-    all_users = User.query.all()
+    users_count = db.session.query(db.func.count(User.id)).scalar()
     user_stats = {
-        'avg_surveys_per_user': round(len(surveys) / len(all_users), 2) if all_users else 0,
+        'avg_surveys_per_user': round(surveys_count / users_count, 2) if users_count else 0,
         'avg_responses_per_user': 0,
         'most_active_user': 'Неизвестно',
         'avg_completion_time': 0
     }
     
     # Вычисляем средние ответы на пользователя
-    total_responses = sum(len(survey.responses) for survey in surveys)
-    if all_users:
-        user_stats['avg_responses_per_user'] = round(total_responses / len(all_users), 2)
-    
-    # Находим самого активного пользователя
-    user_activity = {}
-    for user in all_users:
-        user_surveys = Survey.query.filter_by(creator_id=user.id).count()
-        user_responses = SurveyResponse.query.filter_by(user_id=user.id).count()
-        user_activity[user.username] = user_surveys + user_responses
+    if users_count:
+        user_stats['avg_responses_per_user'] = round(total_responses / users_count, 2)
     
-    if user_activity:
-        most_active = max(user_activity, key=user_activity.get)
-        user_stats['most_active_user'] = most_active
+    # Находим самого активного пользователя (созданные опросы + данные ответы)
+    activity, user_surveys, user_responses = user_activity_query()
+    most_active = activity.order_by((user_surveys + user_responses).desc(), User.id).first()
+    if most_active:
+        user_stats['most_active_user'] = most_active[0].username
     
     # Среднее время прохождения
-    all_responses = SurveyResponse.query.all()
-    completion_times = [r.completion_time for r in all_responses if r.completion_time]
-    if completion_times:
-        user_stats['avg_completion_time'] = round(sum(completion_times) / len(completion_times), 2)
+    completion_sum, completion_count = db.session.query(
+        db.func.sum(SurveyResponse.completion_time), db.func.count(SurveyResponse.completion_time)
+    ).filter(SurveyResponse.completion_time.isnot(None), SurveyResponse.completion_time != 0).one()
+    if completion_count:
+        user_stats['avg_completion_time'] = round(completion_sum / completion_count, 2)
     
     # Данные для графиков
     comparison_labels = list(question_types.keys())
@@ -2278,10 +4455,10 @@ def get_cross_analysis(period='month', survey_type='all', user_id='all'):
     
     time_labels = ['Неделя', 'Месяц', 'Квартал', 'Год']
     time_data = [
-        get_period_analysis(surveys, 'week')['responses_given'],
-        get_period_analysis(surveys, 'month')['responses_given'],
-        get_period_analysis(surveys, 'quarter')['responses_given'],
-        get_period_analysis(surveys, 'year')['responses_given']
+        periods['week']['responses_given'],
+        periods['month']['responses_given'],
+        periods['quarter']['responses_given'],
+        periods['year']['responses_given']
     ]
     
     return {
@@ -2289,7 +4466,7 @@ def get_cross_analysis(period='month', survey_type='all', user_id='all'):
         'survey_type_effectiveness': survey_type_effectiveness,
         'period_stats': period_stats,
         'user_stats': user_stats,
-        'total_surveys': len(surveys),
+        'total_surveys': surveys_count,
         'comparison_labels': comparison_labels,
         'comparison_data': comparison_data,
         'effectiveness_labels': effectiveness_labels,
@@ -2303,44 +4480,59 @@ def get_cross_analysis(period='month', survey_type='all', user_id='all'):
         }
     }
 
-def get_period_analysis(surveys, period):
-    """Анализ активности по периодам"""
-    from datetime import datetime, timedelta
+# Длина окон анализа по периодам (дни); неизвестный период считается годом
+PERIOD_DAYS = {'week': 7, 'month': 30, 'quarter': 90, 'year': 365}
+
+def get_period_analysis(survey_criteria, periods):
+    """Анализ активности сразу по нескольким периодам.
     
+    Опросы и ответы раскладываются по окнам одним запросом на каждую таблицу
+    (SUM(CASE ...) по каждому окну). Учитываются ответы на опросы, созданные
+    в том же окне. survey_criteria - фильтры Survey.
+    """
     now = datetime.now()
-    if period == 'week':
-        start_date = now - timedelta(days=7)
-    elif period == 'month':
-        start_date = now - timedelta(days=30)
-    elif period == 'quarter':
-        start_date = now - timedelta(days=90)
-    else:
-        start_date = now - timedelta(days=365)
+    starts = {period: now - timedelta(days=PERIOD_DAYS.get(period, 365)) for period in periods}
+    
+    def window_counts(created_at):
+        return [db.func.coalesce(db.func.sum(db.case((created_at >= start_date, 1), else_=0)), 0)
+                for start_date in starts.values()]
     
-    period_surveys = [s for s in surveys if s.created_at >= start_date]
-    period_responses = []
+    surveys_created = db.session.query(*window_counts(Survey.created_at)).filter(*survey_criteria).one()
     
-    for survey in period_surveys:
-        for response in survey.responses:
-            if response.created_at >= start_date:
-                period_responses.append(response)
+    # Ответ попадает в окно, если и он, и его опрос созданы не раньше начала окна
+    responses_given = db.session.query(*[
+        db.func.coalesce(db.func.sum(db.case((db.and_(Survey.created_at >= start_date,
+                                                      SurveyResponse.created_at >= start_date), 1), else_=0)), 0)
+        for start_date in starts.values()
+    ]).select_from(SurveyResponse).join(Survey, Survey.id == SurveyResponse.survey_id).filter(*survey_criteria).one()
     
     return {
-        'period': period,
-        'surveys_created': len(period_surveys),
-        'responses_given': len(period_responses),
-        'start_date': start_date.isoformat(),
-        'end_date': now.isoformat()
+        period: {
+            'period': period,
+            'surveys_created': surveys_created[index],
+            'responses_given': responses_given[index],
+            'start_date': start_date.isoformat(),
+            'end_date': now.isoformat()
+        }
+        for index, (period, start_date) in enumerate(starts.items())
     }
 
+def response_timeline(rollup, unit='day'):
+    """Временная линия отправок [{'date': ключ периода, 'count': n}] по почасовой сводке"""
+    return [{'date': date, 'count': count} for date, count in sorted(rebucket_rollup(rollup, unit).items())]
+
 def get_survey_chart_data_internal(survey_id):
-    """Внутренняя функция для получения данных графиков"""
+    """Внутренняя функция для получения данных графиков (с кешированием)"""
+    return cached_analytics(f'survey:{survey_id}:chart', lambda: _compute_survey_chart_data(survey_id))
+
+def _compute_survey_chart_data(survey_id):
+    """Вычисление данных графиков опроса"""
     survey = Survey.query.get(survey_id)
     if not survey:
         return {}
     
-    responses = SurveyResponse.query.filter_by(survey_id=survey_id).all()
     questions = Question.query.filter_by(survey_id=survey_id).order_by(Question.question_order).all()
+    rollup = load_hourly_rollup(survey_id)
     
     chart_data = {
         'response_timeline': [],
@@ -2348,19 +4540,12 @@ def get_survey_chart_data_internal(survey_id):
     }
     
     # Временная линия ответов
-    daily_counts = {}
-    for response in responses:
-        date_key = response.created_at.strftime('%Y-%m-%d')
-        daily_counts[date_key] = daily_counts.get(date_key, 0) + 1
-    
-    chart_data['response_timeline'] = [
-        {'date': date, 'count': count} 
-        for date, count in sorted(daily_counts.items())
-    ]
+    chart_data['response_timeline'] = response_timeline(rollup, 'day')
     
     # Данные для графиков вопросов
+    aggregates = load_question_aggregates([question.id for question in questions])
     for question in questions:
-        q_data = analyze_question(question, responses)
+        q_data = analyze_question(question, survey.response_count, aggregates[question.id])
         chart_data['question_charts'].append({
             'question_id': question.id,
             'question_text': question.text,
@@ -2375,6 +4560,7 @@ def get_survey_chart_data_internal(survey_id):
 if __name__ == '__main__':
     with app.app_context():
         db.create_all()
+        ensure_answer_search_index()
     
     # Проверяем SSL и запускаем соответственно
     try:
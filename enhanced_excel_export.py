@@ -22,29 +22,47 @@ except ImportError:
         def query():
             return None
 
+def get_report_styles():
+    """Стили отчета (общие для обычного и потокового экспорта)"""
+    return {
+        'header_font': Font(bold=True, size=16, color='FFFFFF'),
+        'header_fill': PatternFill(start_color='DC3545', end_color='DC3545', fill_type='solid'),
+        'header_alignment': Alignment(horizontal='center', vertical='center'),
+        
+        'subheader_font': Font(bold=True, size=12, color='2C3E50'),
+        'subheader_fill': PatternFill(start_color='E8F4FD', end_color='E8F4FD', fill_type='solid'),
+        
+        'data_font': Font(size=10),
+        'data_alignment': Alignment(horizontal='left', vertical='center'),
+        'number_alignment': Alignment(horizontal='center', vertical='center'),
+        
+        'border': Border(
+            left=Side(style='thin', color='CCCCCC'),
+            right=Side(style='thin', color='CCCCCC'),
+            top=Side(style='thin', color='CCCCCC'),
+            bottom=Side(style='thin', color='CCCCCC')
+        )
+    }
+
 def create_enhanced_excel_report(survey, responses, question_analytics):
     """Создает улучшенный Excel отчет с графиками и аналитикой"""
     
     wb = Workbook()
     
     # Стили
-    header_font = Font(bold=True, size=16, color='FFFFFF')
-    header_fill = PatternFill(start_color='DC3545', end_color='DC3545', fill_type='solid')
-    header_alignment = Alignment(horizontal='center', vertical='center')
+    styles = get_report_styles()
+    header_font = styles['header_font']
+    header_fill = styles['header_fill']
+    header_alignment = styles['header_alignment']
     
-    subheader_font = Font(bold=True, size=12, color='2C3E50')
-    subheader_fill = PatternFill(start_color='E8F4FD', end_color='E8F4FD', fill_type='solid')
+    subheader_font = styles['subheader_font']
+    subheader_fill = styles['subheader_fill']
     
-    data_font = Font(size=10)
-    data_alignment = Alignment(horizontal='left', vertical='center')
-    number_alignment = Alignment(horizontal='center', vertical='center')
+    data_font = styles['data_font']
+    data_alignment = styles['data_alignment']
+    number_alignment = styles['number_alignment']
     
-    border = Border(
-        left=Side(style='thin', color='CCCCCC'),
-        right=Side(style='thin', color='CCCCCC'),
-        top=Side(style='thin', color='CCCCCC'),
-        bottom=Side(style='thin', color='CCCCCC')
-    )
+    border = styles['border']
     
     # ========== ЛИСТ 1: ИСПОЛНИТЕЛЬНОЕ РЕЗЮМЕ ==========
     ws_summary = wb.active
@@ -94,7 +112,7 @@ def create_enhanced_excel_report(survey, responses, question_analytics):
     ws_summary[f'A{row}'].border = border
     row += 1
     
-    insights = generate_key_insights(survey, responses, question_analytics)
+    insights = generate_key_insights(survey, len(responses), question_analytics)
     for insight in insights:
         ws_summary.merge_cells(f'A{row}:H{row}')
         ws_summary[f'A{row}'] = f"• {insight}"
@@ -111,7 +129,7 @@ def create_enhanced_excel_report(survey, responses, question_analytics):
     ws_summary[f'A{row}'].border = border
     row += 1
     
-    recommendations = generate_recommendations(survey, responses, question_analytics)
+    recommendations = generate_recommendations(survey, len(responses), question_analytics)
     for rec in recommendations:
         ws_summary.merge_cells(f'A{row}:H{row}')
         ws_summary[f'A{row}'] = f"• {rec}"
@@ -359,15 +377,15 @@ def calculate_completion_rate(survey, responses):
     
     return f"{(completed_responses/len(responses)*100):.1f}%"
 
-def generate_key_insights(survey, responses, question_analytics):
+def generate_key_insights(survey, response_count, question_analytics):
     """Генерирует ключевые инсайты"""
     insights = []
     
     # Общие инсайты
-    if len(responses) > 50:
-        insights.append(f"Высокая вовлеченность: {len(responses)} ответов")
-    elif len(responses) < 10:
-        insights.append(f"Низкая вовлеченность: только {len(responses)} ответов")
+    if response_count > 50:
+        insights.append(f"Высокая вовлеченность: {response_count} ответов")
+    elif response_count < 10:
+        insights.append(f"Низкая вовлеченность: только {response_count} ответов")
     
     # Инсайты по вопросам
     for question in survey.questions:
@@ -376,12 +394,12 @@ def generate_key_insights(survey, responses, question_analytics):
     
     return insights[:5]  # Максимум 5 инсайтов
 
-def generate_recommendations(survey, responses, question_analytics):
+def generate_recommendations(survey, response_count, question_analytics):
     """Генерирует рекомендации"""
     recommendations = []
     
     # Общие рекомендации
-    if len(responses) < 20:
+    if response_count < 20:
         recommendations.append("Рассмотрите продление срока проведения опроса для увеличения количества ответов")
     
     # Рекомендации по вопросам
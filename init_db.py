@@ -22,13 +22,14 @@ def init_database():
     
     try:
         # Импортируем приложение и модели
-        from app import app, db, User, Survey, Question
+        from app import app, db, User, Survey, Question, ensure_answer_search_index, sync_question_options
         
         with app.app_context():
             print("🔧 Создание таблиц базы данных...")
             
-            # Создаем все таблицы
+            # Создаем все таблицы и поисковый индекс ответов
             db.create_all()
+            ensure_answer_search_index()
             print("✅ Таблицы созданы успешно")
             
             # Проверяем, есть ли уже пользователи
@@ -110,6 +111,7 @@ def init_database():
                 }
             ]
             
+            questions = []
             for q_data in questions_data:
                 question = Question(
                     text=q_data['text'],
@@ -118,7 +120,12 @@ def init_database():
                     survey_id=demo_survey.id
                 )
                 db.session.add(question)
+                questions.append(question)
             
+            # Словарь вариантов ответов новых вопросов
+            db.session.flush()
+            for question in questions:
+                sync_question_options(question, [])
             db.session.commit()
             print("✅ Демо-опрос создан")
             
@@ -162,15 +169,19 @@ def reset_database():
         return False
     
     try:
-        from app import app, db
+        from app import app, db, ensure_answer_search_index
         
         with app.app_context():
             print("🗑️  Удаление всех таблиц...")
+            # Поисковый индекс ответов не описан моделью, поэтому удаляется отдельно
+            db.session.execute(db.text('DROP TABLE IF EXISTS answer_search'))
+            db.session.commit()
             db.drop_all()
             print("✅ Таблицы удалены")
             
             print("🔧 Создание новых таблиц...")
             db.create_all()
+            ensure_answer_search_index()
             print("✅ Таблицы созданы заново")
             
             print("🎉 База данных сброшена успешно!")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Офлайн-геолокация по сетевым префиксам BG Survey Platform
+
+Адрес респондента сворачивается в сетевой префикс (/24 для IPv4, /48 для
+IPv6) один раз при сохранении ответа, поэтому география считается
+группировкой по префиксу в БД и поиском небольшого числа уникальных
+префиксов в локальной базе диапазонов - без обращений к внешним сервисам.
+
+База префиксов - CSV-файл с заголовком и колонками:
+
+    network,country,city,provider        (сеть в нотации CIDR)
+    start_ip,end_ip,country,city,provider (диапазон адресов)
+
+Диапазоны не должны пересекаться (как в блоках GeoLite2 / DB-IP). Они
+сортируются по началу и ищутся bisect; результаты поиска по префиксу
+запоминаются в LRU-кеше.
+"""
+
+import csv
+import ipaddress
+import os
+from bisect import bisect_right
+from functools import lru_cache
+
+IPV4_PREFIX_LENGTH = 24
+IPV6_PREFIX_LENGTH = 48
+GEO_FIELDS = ('country', 'city', 'provider')
+
+def network_prefix(ip_address):
+    """Сетевой префикс адреса ('10.1.2.0/24', '2001:db8:1::/48'); None для некорректного адреса"""
+    try:
+        address = ipaddress.ip_address((ip_address or '').strip())
+    except ValueError:
+        return None
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    length = IPV4_PREFIX_LENGTH if address.version == 4 else IPV6_PREFIX_LENGTH
+    return str(ipaddress.ip_network(f'{address}/{length}', strict=False))
+
+def _row_range(row):
+    """Границы диапазона строки базы: (версия, начало, конец) целыми числами"""
+    if row.get('network'):
+        network = ipaddress.ip_network(row['network'].strip(), strict=False)
+        return network.version, int(network.network_address), int(network.broadcast_address)
+    start = ipaddress.ip_address(row['start_ip'].strip())
+    end = ipaddress.ip_address(row['end_ip'].strip())
+    if start.version != end.version or int(start) > int(end):
+        raise ValueError(f"некорректный диапазон {start} - {end}")
+    return start.version, int(start), int(end)
+
+class PrefixDatabase:
+    """Таблица диапазонов адресов, отсортированная по началу, с поиском bisect"""
+
+    def __init__(self, ranges=(), cache_size=4096):
+        # Для каждой версии IP - параллельные списки начал, концов и записей
+        self._tables = {4: ([], [], []), 6: ([], [], [])}
+        for version, start, end, record in sorted(ranges, key=lambda item: (item[0], item[1])):
+            starts, ends, records = self._tables[version]
+            starts.append(start)
+            ends.append(end)
+            records.append(record)
+        self.lookup_prefix = lru_cache(maxsize=cache_size)(self._lookup_prefix)
+
+    @classmethod
+    def load(cls, path, cache_size=4096):
+        """Читает базу префиксов из CSV; пропускает строки с некорректными адресами"""
+        ranges = []
+        with open(path, newline='', encoding='utf-8') as handle:
+            for row in csv.DictReader(handle):
+                try:
+                    version, start, end = _row_range(row)
+                except (KeyError, AttributeError, ValueError):
+                    continue
+                record = {field: (row.get(field) or '').strip() for field in GEO_FIELDS}
+                ranges.append((version, start, end, record))
+        return cls(ranges, cache_size)
+
+    def __len__(self):
+        return sum(len(starts) for starts, _, _ in self._tables.values())
+
+    def lookup(self, ip_address):
+        """Запись базы (country, city, provider) для адреса или None"""
+        try:
+            address = ipaddress.ip_address(ip_address)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        starts, ends, records = self._tables[address.version]
+        value = int(address)
+        index = bisect_right(starts, value) - 1
+        if index >= 0 and value <= ends[index]:
+            return records[index]
+        return None
+
+    def _lookup_prefix(self, prefix):
+        """Запись базы для сетевого префикса (ищется по адресу сети)"""
+        if not prefix:
+            return None
+        return self.lookup(prefix.split('/', 1)[0])
+
+def load_prefix_database(path, cache_size=4096):
+    """База префиксов из файла или пустая база, если файла нет"""
+    if not path or not os.path.exists(path):
+        return PrefixDatabase(cache_size=cache_size)
+    return PrefixDatabase.load(path, cache_size)
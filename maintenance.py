@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Служебные команды BG Survey Platform (пересчет производных данных)
+"""
+
+import os
+import sys
+import argparse
+
+# Добавляем текущую директорию в путь
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app import app, db
+
+def rebuild_aggregates(args):
+    """Пересчитывает агрегаты по вопросам из таблиц Answer, AnswerSelection и AnswerGridCell"""
+    from app import rebuild_question_aggregates
+
+    target = f"опроса {args.survey}" if args.survey else "всех опросов"
+    print(f"🔄 Пересчет агрегатов для {target}...")
+    questions_count = rebuild_question_aggregates(args.survey)
+    print(f"✅ Агрегаты пересчитаны для {questions_count} вопросов")
+
+def sync_options(args):
+    """Синхронизирует словарь вариантов (QuestionOption) вопросов, измененных в обход редактора опросов"""
+    from app import sync_drifted_question_options
+
+    target = f"опроса {args.survey}" if args.survey else "всех опросов"
+    print(f"🔄 Синхронизация вариантов ответов для {target}...")
+    synced = sync_drifted_question_options(args.survey)
+    print(f"✅ Синхронизировано вопросов: {synced}")
+
+def rebuild_selections(args):
+    """Заполняет таблицы выбранных вариантов и ячеек сетки (AnswerSelection, AnswerGridCell) по исходным ответам"""
+    from app import rebuild_answer_selections
+
+    target = f"опроса {args.survey}" if args.survey else "всех опросов"
+    print(f"🔄 Пересчет выбранных вариантов для {target}...")
+    inserted = rebuild_answer_selections(args.survey)
+    print(f"✅ Записано выборов: {inserted}")
+
+def rebuild_typed_values(args):
+    """Заполняет типизированные значения ответов (value_num, value_date) по тексту ответов"""
+    from app import rebuild_typed_answer_values
+
+    target = f"опроса {args.survey}" if args.survey else "всех опросов"
+    print(f"🔄 Пересчет типизированных значений ответов для {target}...")
+    updated = rebuild_typed_answer_values(args.survey)
+    print(f"✅ Обновлено ответов: {updated}")
+
+def recount_surveys(args):
+    """Пересчитывает счетчики ответов опросов (response_count, answer_count, last_response_at)"""
+    from app import recount_survey_counters
+
+    target = f"опроса {args.survey}" if args.survey else "всех опросов"
+    print(f"🔄 Пересчет счетчиков ответов для {target}...")
+    surveys_count = recount_survey_counters(args.survey)
+    print(f"✅ Счетчики пересчитаны для {surveys_count} опросов")
+
+def rebuild_rollup(args):
+    """Пересчитывает почасовую сводку отправок (SurveyHourlyRollup) по ответам"""
+    from app import rebuild_hourly_rollup
+
+    target = f"опроса {args.survey}" if args.survey else "всех опросов"
+    print(f"🔄 Пересчет почасовой сводки отправок для {target}...")
+    hours = rebuild_hourly_rollup(args.survey)
+    print(f"✅ Записано часов: {hours}")
+
+def rebuild_networks(args):
+    """Заполняет сетевые префиксы ответов (network_prefix) по IP адресам"""
+    from app import rebuild_network_prefixes
+
+    print("🔄 Пересчет сетевых префиксов ответов...")
+    addresses = rebuild_network_prefixes()
+    print(f"✅ Обработано IP адресов: {addresses}")
+
+def rebuild_search(args):
+    """Перестраивает полнотекстовый индекс текстовых ответов"""
+    from app import rebuild_answer_search_index
+
+    print("🔄 Перестройка поискового индекса ответов...")
+    indexed = rebuild_answer_search_index()
+    if indexed is None:
+        raise RuntimeError('полнотекстовый поиск недоступен для этой базы данных')
+    print(f"✅ Проиндексировано ответов: {indexed}")
+
+def sweep_cache(args):
+    """Удаляет просроченные записи кеша аналитики"""
+    from app import sweep_analytics_cache
+
+    deleted = sweep_analytics_cache()
+    print(f"✅ Удалено просроченных записей кеша: {deleted}")
+
+def flush_queue(args):
+    """Дописывает в БД все отправки из очереди отложенной записи (ручное восстановление после сбоя)"""
+    from app import app, _flush_queued_submissions
+    from submission_queue import SubmissionQueue
+
+    path = app.config.get('SUBMISSION_QUEUE_PATH', 'submission_queue.db')
+    if not os.path.isabs(path):
+        path = os.path.join(app.instance_path, path)
+    if not os.path.exists(path):
+        print(f"ℹ️  Очередь {path} не найдена")
+        return
+
+    # С --recover-claims считаем зависшими все захваченные пачки (приложение должно быть остановлено)
+    queue = SubmissionQueue(path, _flush_queued_submissions, claim_timeout=0 if args.recover_claims else 300)
+    recovered = queue.recover()
+    written = queue.flush()
+    metrics = queue.metrics()
+    print(f"✅ Записано отправок: {written} (возвращено захваченных: {recovered})")
+    print(f"   Осталось в очереди: {metrics['depth']}, в обработке: {metrics['in_flight']}, с ошибками: {metrics['failed']}")
+
+def check_indexes(args):
+    """Создает недостающие индексы и проверяет планы горячих запросов"""
+    from migrate_database import create_missing_indexes, check_index_usage
+
+    created = create_missing_indexes()
+    print(f"✅ Создано индексов: {created}")
+    if not check_index_usage():
+        raise RuntimeError('часть запросов не использует индексы')
+
+def cleanup_exports(args):
+    """Удаляет устаревшие файлы фоновых Excel-отчетов"""
+    from app import get_export_directory, cleanup_export_artifacts
+
+    removed = cleanup_export_artifacts(get_export_directory())
+    print(f"✅ Удалено файлов отчетов: {removed}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Служебные команды BG Survey Platform')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    rebuild = subparsers.add_parser('rebuild-aggregates', help='Пересчитать агрегаты по вопросам')
+    rebuild.add_argument('--survey', type=int, help='ID опроса (по умолчанию все опросы)')
+    rebuild.set_defaults(handler=rebuild_aggregates)
+
+    options = subparsers.add_parser('sync-options', help='Синхронизировать словарь вариантов ответов с вопросами')
+    options.add_argument('--survey', type=int, help='ID опроса (по умолчанию все опросы)')
+    options.set_defaults(handler=sync_options)
+
+    selections = subparsers.add_parser('rebuild-selections', help='Пересчитать выбранные варианты и ячейки сеток')
+    selections.add_argument('--survey', type=int, help='ID опроса (по умолчанию все опросы)')
+    selections.set_defaults(handler=rebuild_selections)
+
+    typed = subparsers.add_parser('rebuild-typed-values', help='Пересчитать числовые значения и даты ответов')
+    typed.add_argument('--survey', type=int, help='ID опроса (по умолчанию все опросы)')
+    typed.set_defaults(handler=rebuild_typed_values)
+
+    recount = subparsers.add_parser('recount-surveys', help='Пересчитать счетчики ответов опросов')
+    recount.add_argument('--survey', type=int, help='ID опроса (по умолчанию все опросы)')
+    recount.set_defaults(handler=recount_surveys)
+
+    rollup = subparsers.add_parser('rebuild-rollup', help='Пересчитать почасовую сводку отправок')
+    rollup.add_argument('--survey', type=int, help='ID опроса (по умолчанию все опросы)')
+    rollup.set_defaults(handler=rebuild_rollup)
+
+    networks = subparsers.add_parser('rebuild-networks', help='Пересчитать сетевые префиксы IP адресов ответов')
+    networks.set_defaults(handler=rebuild_networks)
+
+    search = subparsers.add_parser('rebuild-search', help='Перестроить полнотекстовый индекс ответов')
+    search.set_defaults(handler=rebuild_search)
+
+    sweep = subparsers.add_parser('sweep-cache', help='Удалить просроченные записи кеша аналитики')
+    sweep.set_defaults(handler=sweep_cache)
+
+    flush = subparsers.add_parser('flush-queue', help='Записать в БД отправки из очереди отложенной записи')
+    flush.add_argument('--recover-claims', action='store_true',
+                       help='Вернуть в очередь все захваченные пачки (только при остановленном приложении)')
+    flush.set_defaults(handler=flush_queue)
+
+    indexes = subparsers.add_parser('check-indexes', help='Создать недостающие индексы и проверить планы запросов')
+    indexes.set_defaults(handler=check_indexes)
+
+    exports = subparsers.add_parser('cleanup-exports', help='Удалить устаревшие файлы Excel-отчетов')
+    exports.set_defaults(handler=cleanup_exports)
+
+    args = parser.parse_args()
+
+    with app.app_context():
+        db.create_all()
+        try:
+            args.handler(args)
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Ошибка: {e}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
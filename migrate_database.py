@@ -13,6 +13,116 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from app import app, db
 from sqlalchemy import text
 
+def create_missing_indexes():
+    """Создает индексы моделей, которых нет в существующей БД (идемпотентно).
+    
+    db.create_all() не добавляет индексы в уже существующие таблицы, поэтому
+    создаем их отдельно. В PostgreSQL используется CREATE INDEX CONCURRENTLY,
+    чтобы не блокировать запись в таблицы во время построения индекса.
+    """
+    from sqlalchemy import inspect
+    
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    concurrently = 'CONCURRENTLY ' if db.engine.dialect.name == 'postgresql' else ''
+    created = 0
+    
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in existing:
+                print(f"✅ Индекс '{index.name}' уже существует")
+                continue
+            print(f"➕ Создаем индекс '{index.name}'")
+            columns = ', '.join(column.name for column in index.columns)
+            unique = 'UNIQUE ' if index.unique else ''
+            # CONCURRENTLY нельзя выполнять внутри транзакции
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                connection.execute(text(
+                    f'CREATE {unique}INDEX {concurrently}IF NOT EXISTS {index.name} ON "{table.name}" ({columns})'
+                ))
+            created += 1
+    
+    return created
+
+# Типовые запросы горячих путей и индексы, которые они должны использовать
+def _hot_queries():
+    from app import Survey, Question, SurveyResponse, Answer, AnswerSelection, AnswerGridCell, QuestionTerm
+    
+    return [
+        ('Результаты опроса по дате',
+         SurveyResponse.query.filter_by(survey_id=1).order_by(SurveyResponse.created_at.desc()),
+         ['ix_survey_response_survey_created']),
+        ('Ответы пользователя',
+         SurveyResponse.query.filter_by(user_id=1),
+         ['ix_survey_response_user_created']),
+        ('География опроса',
+         db.session.query(SurveyResponse.network_prefix, db.func.count(SurveyResponse.id)).filter(
+             SurveyResponse.survey_id == 1
+         ).group_by(SurveyResponse.network_prefix),
+         ['ix_survey_response_survey_network', 'ix_survey_response_survey_created']),
+        ('Ответы за период',
+         SurveyResponse.query.filter(SurveyResponse.created_at >= datetime(2024, 1, 1)),
+         ['ix_survey_response_created_at']),
+        ('Ответы на вопрос',
+         db.session.query(Answer.value).filter(Answer.question_id == 1),
+         ['ix_answer_question_response']),
+        ('Ответ в отправке',
+         Answer.query.filter_by(response_id=1, question_id=1),
+         ['ix_answer_response_question', 'ix_answer_question_response']),
+        ('Ответы отправки',
+         Answer.query.filter_by(response_id=1),
+         ['ix_answer_response_question']),
+        ('Вопросы опроса',
+         Question.query.filter_by(survey_id=1).order_by(Question.question_order),
+         ['ix_question_survey_order']),
+        ('Опросы автора',
+         Survey.query.filter_by(creator_id=1),
+         ['ix_survey_creator_id']),
+        ('Частые слова вопроса',
+         QuestionTerm.query.filter_by(question_id=1).order_by(QuestionTerm.count.desc()).limit(10),
+         ['ix_question_term_count']),
+        ('Выборы вариантов вопроса',
+         db.session.query(AnswerSelection.option_id, db.func.count(AnswerSelection.id)).filter(
+             AnswerSelection.question_id == 1
+         ).group_by(AnswerSelection.option_id),
+         ['ix_answer_selection_question_option']),
+        ('Тепловая карта сетки',
+         db.session.query(AnswerGridCell.row_id, AnswerGridCell.col_id, db.func.count(AnswerGridCell.id)).filter(
+             AnswerGridCell.question_id == 1
+         ).group_by(AnswerGridCell.row_id, AnswerGridCell.col_id),
+         ['ix_answer_grid_cell_question_cell']),
+    ]
+
+def check_index_usage():
+    """Проверяет по плану запроса (EXPLAIN), что горячие запросы используют индексы"""
+    dialect = db.engine.dialect
+    all_used = True
+    
+    print("🔍 Проверка планов запросов...")
+    with db.engine.connect() as connection:
+        if dialect.name == 'postgresql':
+            # На маленьких таблицах планировщик предпочитает seq scan - запрещаем его для проверки
+            connection.execute(text('SET enable_seqscan = off'))
+            explain = 'EXPLAIN '
+        else:
+            explain = 'EXPLAIN QUERY PLAN '
+        
+        for title, query, expected in _hot_queries():
+            sql = str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+            plan = '\n'.join(' '.join(str(value) for value in row) for row in connection.execute(text(explain + sql)))
+            used = next((name for name in expected if name in plan), None)
+            if used:
+                print(f"✅ {title}: {used}")
+            else:
+                all_used = False
+                print(f"❌ {title}: индекс не используется")
+                print(f"   {plan}")
+    
+    return all_used
+
 def migrate_database():
     """Выполняет миграцию базы данных"""
     print("🔄 Начинаем миграцию базы данных...")
@@ -28,13 +138,24 @@ def migrate_database():
             # Добавляем новые поля в таблицу Survey
             print("📝 Добавляем новые поля в таблицу Survey...")
             
-            # Проверяем, существует ли поле require_name
-            try:
-                db.session.execute(text("SELECT require_name FROM survey LIMIT 1"))
-                print("✅ Поле 'require_name' уже существует")
-            except:
-                print("➕ Добавляем поле 'require_name'")
-                db.session.execute(text("ALTER TABLE survey ADD COLUMN require_name BOOLEAN DEFAULT 0"))
+            new_survey_fields = [
+                ("require_name", "BOOLEAN DEFAULT 0"),
+                ("version", "INTEGER NOT NULL DEFAULT 1"),
+                ("response_count", "INTEGER NOT NULL DEFAULT 0"),
+                ("answer_count", "INTEGER NOT NULL DEFAULT 0"),
+                ("last_response_at", "TIMESTAMP"),
+                ("updated_at", "TIMESTAMP")
+            ]
+            
+            added_survey_fields = []
+            for field_name, field_type in new_survey_fields:
+                try:
+                    db.session.execute(text(f"SELECT {field_name} FROM survey LIMIT 1"))
+                    print(f"✅ Поле '{field_name}' уже существует")
+                except:
+                    print(f"➕ Добавляем поле '{field_name}'")
+                    db.session.execute(text(f"ALTER TABLE survey ADD COLUMN {field_name} {field_type}"))
+                    added_survey_fields.append(field_name)
             
             # Добавляем новые поля в таблицу Question
             print("📝 Добавляем новые поля в таблицу Question...")
@@ -73,9 +194,11 @@ def migrate_database():
             new_response_fields = [
                 ("respondent_name", "VARCHAR(200)"),
                 ("user_agent", "TEXT"),
-                ("completion_time", "INTEGER")
+                ("completion_time", "INTEGER"),
+                ("network_prefix", "VARCHAR(45)")
             ]
             
+            added_response_fields = []
             for field_name, field_type in new_response_fields:
                 try:
                     db.session.execute(text(f"SELECT {field_name} FROM survey_response LIMIT 1"))
@@ -83,6 +206,7 @@ def migrate_database():
                 except:
                     print(f"➕ Добавляем поле '{field_name}'")
                     db.session.execute(text(f"ALTER TABLE survey_response ADD COLUMN {field_name} {field_type}"))
+                    added_response_fields.append(field_name)
             
             # Добавляем поле is_other в таблицу Answer
             print("📝 Добавляем поле 'is_other' в таблицу Answer...")
@@ -93,6 +217,22 @@ def migrate_database():
                 print("➕ Добавляем поле 'is_other'")
                 db.session.execute(text("ALTER TABLE answer ADD COLUMN is_other BOOLEAN DEFAULT 0"))
             
+            # Типизированные копии ответов (оценки, даты, время) для агрегатов в SQL
+            new_answer_fields = [
+                ("value_num", "INTEGER"),
+                ("value_date", "DATE")
+            ]
+            
+            added_answer_fields = []
+            for field_name, field_type in new_answer_fields:
+                try:
+                    db.session.execute(text(f"SELECT {field_name} FROM answer LIMIT 1"))
+                    print(f"✅ Поле '{field_name}' уже существует")
+                except:
+                    print(f"➕ Добавляем поле '{field_name}'")
+                    db.session.execute(text(f"ALTER TABLE answer ADD COLUMN {field_name} {field_type}"))
+                    added_answer_fields.append(field_name)
+            
             # Создаем новые таблицы для аналитики
             print("📝 Создаем новые таблицы для аналитики...")
             
@@ -131,6 +271,95 @@ def migrate_database():
             
             # Сохраняем изменения
             db.session.commit()
+            
+            # Выборы и счетчики вариантов и ячеек сетки теперь ссылаются на id (QuestionOption), а не на
+            # индекс или текст; это производные таблицы, поэтому они пересоздаются и заполняются заново
+            from sqlalchemy import inspect
+            inspector = inspect(db.engine)
+            for table_name, column_name in (('answer_selection', 'option_id'), ('question_option_count', 'option_id'),
+                                            ('question_grid_count', 'row_id')):
+                if inspector.has_table(table_name) and column_name not in {column['name'] for column in inspector.get_columns(table_name)}:
+                    print(f"🔄 Пересоздаем таблицу '{table_name}' (ссылки на варианты по id)")
+                    db.session.execute(text(f"DROP TABLE {table_name}"))
+            db.session.commit()
+            
+            # Создаем недостающие таблицы (агрегаты по вопросам и т.д.)
+            print("📝 Создаем недостающие таблицы...")
+            db.create_all()
+            
+            # Индексы для горячих запросов в уже существующих таблицах
+            print("📝 Создаем индексы...")
+            create_missing_indexes()
+            check_index_usage()
+            
+            # Прежние подписи переименованных вариантов (строки-псевдонимы)
+            if 'alias_of_id' not in {column['name'] for column in inspect(db.engine).get_columns('question_option')}:
+                print("➕ Добавляем поле 'alias_of_id' в таблицу QuestionOption")
+                db.session.execute(text("ALTER TABLE question_option ADD COLUMN alias_of_id INTEGER REFERENCES question_option(id)"))
+                db.session.commit()
+            
+            # Словарь вариантов ответов, строк и столбцов сетки для существующих и измененных скриптами вопросов
+            from app import Question, sync_drifted_question_options
+            synced = sync_drifted_question_options()
+            if synced:
+                print(f"➕ Синхронизирован словарь вариантов ответов: {synced} вопросов")
+            
+            # Выбранные варианты и ячейки сетки для ответов, сохраненных до появления таблиц
+            # AnswerSelection и AnswerGridCell
+            from app import (Answer, AnswerSelection, AnswerGridCell, CHOICE_QUESTION_TYPES, GRID_QUESTION_TYPES,
+                             rebuild_answer_selections)
+            def has_answers(question_types):
+                return Answer.query.join(Question, Answer.question_id == Question.id).filter(
+                    Question.type.in_(question_types)
+                ).first() is not None
+            if ((not AnswerSelection.query.first() and has_answers(CHOICE_QUESTION_TYPES))
+                    or (not AnswerGridCell.query.first() and has_answers(GRID_QUESTION_TYPES))):
+                print("➕ Заполняем таблицы выбранных вариантов и ячеек сетки")
+                print(f"✅ Добавлено выборов: {rebuild_answer_selections()}")
+            
+            # Типизированные значения для ответов, сохраненных до появления полей value_num/value_date
+            if added_answer_fields:
+                from app import rebuild_typed_answer_values
+                print("➕ Заполняем типизированные значения ответов")
+                print(f"✅ Обновлено ответов: {rebuild_typed_answer_values()}")
+            
+            # Заполняем агрегаты для уже существующих ответов
+            from app import QuestionStats, QuestionTerm, QuestionOptionCount, QuestionGridCount, rebuild_question_aggregates
+            if not QuestionStats.query.first():
+                print("➕ Пересчитываем агрегаты по вопросам")
+                rebuild_question_aggregates()
+            elif ((not QuestionOptionCount.query.first() and AnswerSelection.query.first())
+                    or (not QuestionGridCount.query.first() and AnswerGridCell.query.first())):
+                print("➕ Пересчитываем агрегаты по вопросам (счетчики вариантов и ячеек сетки по id)")
+                rebuild_question_aggregates()
+            elif not QuestionTerm.query.first() and QuestionStats.query.filter(QuestionStats.text_count > 0).first():
+                print("➕ Пересчитываем агрегаты по вопросам (частотный словарь текстовых ответов)")
+                rebuild_question_aggregates()
+            
+            # Сетевые префиксы для ответов, сохраненных до появления поля network_prefix
+            if 'network_prefix' in added_response_fields:
+                from app import rebuild_network_prefixes
+                print("➕ Заполняем сетевые префиксы ответов")
+                print(f"✅ Обработано IP адресов: {rebuild_network_prefixes()}")
+            
+            # Почасовая сводка отправок для уже существующих ответов
+            from app import SurveyHourlyRollup, SurveyResponse, rebuild_hourly_rollup
+            if not SurveyHourlyRollup.query.first() and SurveyResponse.query.first():
+                print("➕ Заполняем почасовую сводку отправок")
+                print(f"✅ Записано часов: {rebuild_hourly_rollup()}")
+            
+            # Полнотекстовый индекс текстовых ответов (FTS5 / tsvector), заполняется при создании
+            from app import ensure_answer_search_index
+            print("📝 Проверяем поисковый индекс ответов...")
+            if ensure_answer_search_index():
+                print("✅ Поисковый индекс ответов готов")
+            
+            # Заполняем счетчики ответов опросов, если поля только что добавлены
+            if {'response_count', 'answer_count', 'last_response_at'} & set(added_survey_fields):
+                from app import recount_survey_counters
+                print("➕ Пересчитываем счетчики ответов опросов")
+                recount_survey_counters()
+            
             print("✅ Миграция базы данных завершена успешно!")
             
             # Показываем статистику
@@ -169,7 +398,7 @@ def create_sample_data():
     
     with app.app_context():
         try:
-            from app import User, Survey, Question
+            from app import User, Survey, Question, sync_question_options
             from werkzeug.security import generate_password_hash
             
             # Проверяем, есть ли уже тестовые данные
@@ -230,6 +459,7 @@ def create_sample_data():
                 }
             ]
             
+            questions = []
             for i, q_data in enumerate(questions_data):
                 question = Question(
                     text=q_data['text'],
@@ -245,7 +475,12 @@ def create_sample_data():
                     survey_id=test_survey.id
                 )
                 db.session.add(question)
+                questions.append(question)
             
+            # Словарь вариантов ответов новых вопросов
+            db.session.flush()
+            for question in questions:
+                sync_question_options(question, [])
             db.session.commit()
             print("✅ Созданы тестовые данные")
             
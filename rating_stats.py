@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Статистика оценок для вопросов rating/scale BG Survey Platform
+
+Оценки хранятся гистограммой {оценка: количество} (агрегат QuestionRatingBucket),
+поэтому все показатели считаются векторно по массиву значений шкалы, а не по
+списку всех ответов: плотная гистограмма - numpy.bincount, среднее и дисперсия -
+взвешенными суммами, медиана и процентили - по накопленным частотам. Процентили
+совпадают с numpy.percentile (линейная интерполяция) по развернутому массиву оценок.
+"""
+
+import numpy as np
+
+DEFAULT_PERCENTILES = (25, 50, 75, 90)
+
+def rating_statistics(histogram, scale_min=None, scale_max=None, percentiles=DEFAULT_PERCENTILES):
+    """Показатели оценок по гистограмме; None, если оценок нет
+
+    Возвращает словарь: count, min, max, mean, median (элемент sorted(values)[count // 2],
+    как и прежний расчет по списку), std (по генеральной совокупности),
+    coefficient_of_variation (в процентах), percentiles {q: значение} и
+    distribution {оценка: количество} по всей шкале scale_min..scale_max.
+    """
+    items = [(int(value), int(count)) for value, count in histogram.items() if count]
+    if not items:
+        return None
+    values = np.array([value for value, _ in items], dtype=np.int64)
+    counts = np.array([count for _, count in items], dtype=np.int64)
+
+    low = int(values.min())
+    high = int(values.max())
+    base = min(low, scale_min) if scale_min is not None else low
+    top = max(high, scale_max) if scale_max is not None else high
+
+    # Плотная гистограмма по шкале: индекс - оценка минус base
+    dense = np.bincount(values - base, weights=counts, minlength=top - base + 1).astype(np.int64)
+    scale = np.arange(base, top + 1, dtype=np.int64)
+
+    total = int(dense.sum())
+    mean = float(np.dot(scale, dense)) / total
+    variance = float(np.dot((scale - mean) ** 2, dense)) / total
+    std = variance ** 0.5
+
+    # k-й элемент отсортированного массива оценок - первая позиция, где накопленная частота > k
+    cumulative = np.cumsum(dense)
+
+    def nth(positions):
+        return scale[np.searchsorted(cumulative, positions, side='right')]
+
+    quantiles = np.asarray(percentiles, dtype=np.float64)
+    positions = quantiles / 100.0 * (total - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.ceil(positions).astype(np.int64)
+    lower_values = nth(lower)
+    percentile_values = lower_values + (nth(upper) - lower_values) * (positions - lower)
+
+    distribution_start = scale_min if scale_min is not None else base
+    distribution_end = scale_max if scale_max is not None else top
+    return {
+        'count': total,
+        'min': low,
+        'max': high,
+        'mean': mean,
+        'median': int(nth(total // 2)),
+        'std': std,
+        'coefficient_of_variation': (std / mean) * 100 if mean > 0 else 0,
+        'percentiles': {int(q): float(value) for q, value in zip(percentiles, percentile_values)},
+        'distribution': {int(value): int(dense[value - base]) if base <= value <= top else 0
+                         for value in range(distribution_start, distribution_end + 1)}
+    }
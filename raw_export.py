@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Потоковая выгрузка сырых данных опроса (одна строка на ответ, один столбец на вопрос)
+
+Форматы: CSV, NDJSON и компактный колоночный формат BGCOL. Все кодировщики
+принимают итератор строк и отдают байты частями, поэтому память не зависит
+от размера опроса. gzip_stream сжимает поток на лету.
+
+Формат BGCOL (все числа little-endian):
+    b'BGCOL1'                          - сигнатура
+    uint32 + JSON                      - схема: {"columns": [{"name", "type"}]}
+    далее группы строк:
+        uint32 число строк (> 0)
+        для каждого столбца: uint32 длина + данные столбца
+    uint32 0                           - конец данных
+
+Данные столбца:
+    int        - int64 на строку, NULL = INT64_MIN
+    timestamp  - int64 микросекунд от эпохи UTC, NULL = INT64_MIN
+    string     - словарь группы (uint32 число строк словаря, затем
+                 uint32 длина + UTF-8 для каждой) и uint32 индекс на строку,
+                 NULL = 0xFFFFFFFF
+"""
+
+import csv
+import io
+import json
+import struct
+import zlib
+from datetime import datetime, timedelta
+
+CHUNK_SIZE = 64 * 1024
+COLUMNAR_MAGIC = b'BGCOL1'
+COLUMNAR_ROW_GROUP = 10000
+INT_NULL = -2 ** 63
+STRING_NULL = 0xFFFFFFFF
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+def _text(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def iter_csv(columns, rows):
+    """CSV с заголовком из имен столбцов"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column['name'] for column in columns])
+    for row in rows:
+        writer.writerow(['' if value is None else _text(value) for value in row])
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+def iter_ndjson(columns, rows):
+    """Один JSON-объект на строку"""
+    names = [column['name'] for column in columns]
+    parts = []
+    size = 0
+    for row in rows:
+        line = json.dumps({name: _text(value) for name, value in zip(names, row)}, ensure_ascii=False) + '\n'
+        parts.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(parts).encode('utf-8')
+            parts, size = [], 0
+    yield ''.join(parts).encode('utf-8')
+
+def _encode_column(column_type, values):
+    if column_type == 'int':
+        return struct.pack(f'<{len(values)}q', *(INT_NULL if value is None else value for value in values))
+    if column_type == 'timestamp':
+        return struct.pack(f'<{len(values)}q', *(
+            INT_NULL if value is None else (value - EPOCH) // MICROSECOND for value in values
+        ))
+
+    dictionary = {}
+    indices = []
+    for value in values:
+        if value is None:
+            indices.append(STRING_NULL)
+        else:
+            indices.append(dictionary.setdefault(value, len(dictionary)))
+    parts = [struct.pack('<I', len(dictionary))]
+    for value in dictionary:
+        encoded = value.encode('utf-8')
+        parts.append(struct.pack('<I', len(encoded)))
+        parts.append(encoded)
+    parts.append(struct.pack(f'<{len(indices)}I', *indices))
+    return b''.join(parts)
+
+def _encode_row_group(columns, rows):
+    parts = [struct.pack('<I', len(rows))]
+    for index, column in enumerate(columns):
+        data = _encode_column(column['type'], [row[index] for row in rows])
+        parts.append(struct.pack('<I', len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+def iter_columnar(columns, rows, row_group_size=COLUMNAR_ROW_GROUP):
+    """Колоночный формат BGCOL: строки копятся группами по row_group_size"""
+    schema = json.dumps({'columns': columns}, ensure_ascii=False).encode('utf-8')
+    yield COLUMNAR_MAGIC + struct.pack('<I', len(schema)) + schema
+
+    group = []
+    for row in rows:
+        group.append(row)
+        if len(group) >= row_group_size:
+            yield _encode_row_group(columns, group)
+            group = []
+    if group:
+        yield _encode_row_group(columns, group)
+    yield struct.pack('<I', 0)
+
+def read_columnar(stream):
+    """Читает файл BGCOL: возвращает (columns, итератор строк)"""
+    def read_exact(size):
+        data = stream.read(size)
+        if len(data) != size:
+            raise ValueError('Неожиданный конец файла BGCOL')
+        return data
+
+    if read_exact(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError('Файл не в формате BGCOL')
+    schema_size, = struct.unpack('<I', read_exact(4))
+    columns = json.loads(read_exact(schema_size))['columns']
+
+    def decode_column(column_type, data, count):
+        if column_type in ('int', 'timestamp'):
+            values = struct.unpack(f'<{count}q', data)
+            if column_type == 'int':
+                return [None if value == INT_NULL else value for value in values]
+            return [None if value == INT_NULL else EPOCH + value * MICROSECOND for value in values]
+        dictionary_size, = struct.unpack_from('<I', data)
+        offset = 4
+        dictionary = []
+        for _ in range(dictionary_size):
+            length, = struct.unpack_from('<I', data, offset)
+            offset += 4
+            dictionary.append(data[offset:offset + length].decode('utf-8'))
+            offset += length
+        indices = struct.unpack_from(f'<{count}I', data, offset)
+        return [None if index == STRING_NULL else dictionary[index] for index in indices]
+
+    def rows():
+        while True:
+            count, = struct.unpack('<I', read_exact(4))
+            if count == 0:
+                return
+            values = []
+            for column in columns:
+                size, = struct.unpack('<I', read_exact(4))
+                values.append(decode_column(column['type'], read_exact(size), count))
+            yield from zip(*values)
+
+    return columns, rows()
+
+def gzip_stream(chunks, level=6):
+    """Сжимает поток байтов в gzip на лету"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+EXPORT_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+    'bgcol': (iter_columnar, 'application/octet-stream'),
+}
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Колоночное представление ответов опроса для кросс-табуляции BG Survey Platform
+
+Каждой отправке опроса соответствует порядковый номер (ordinal), каждому
+вопросу - один компактный целочисленный массив длиной в число отправок:
+
+    ChoiceColumn  - int64 битовая маска выбранных вариантов (0 - нет ответа),
+                    поэтому вопросы с несколькими выборами тоже занимают
+                    одну ячейку на отправку;
+    RatingColumn  - int32 оценка, MISSING - нет ответа.
+
+Если в каждой отправке выбрано не больше одного значения, таблица
+сопряженности и средние по группам считаются np.bincount по кодам ячеек
+(строка * число столбцов + столбец) без матриц размера вариант x отправка.
+Для множественного выбора матрицы индикаторов строятся и перемножаются
+блоками по CHUNK_SIZE отправок, поэтому память не растет с числом ответов.
+"""
+
+import numpy as np
+
+MISSING = np.iinfo(np.int32).min
+MAX_CHOICE_LABELS = 63
+OTHER_LABEL = 'Другой вариант'
+CHUNK_SIZE = 16384
+
+def _chunks(size, chunk_size):
+    for start in range(0, size, chunk_size):
+        yield start, min(start + chunk_size, size)
+
+class ChoiceColumn:
+    """Вопрос с вариантами ответа: битовая маска выборов на отправку"""
+
+    kind = 'choice'
+
+    def __init__(self, question_id, options, size):
+        options = list(options)
+        if len(options) > MAX_CHOICE_LABELS - 1:
+            raise ValueError(f'в вопросе {len(options)} вариантов, кросс-табуляция поддерживает '
+                             f'не больше {MAX_CHOICE_LABELS - 1}')
+        self.question_id = question_id
+        self.labels = options + [OTHER_LABEL]
+        self._other_bit = 1 << (len(self.labels) - 1)
+        self.values = np.zeros(size, dtype=np.int64)
+
+    def add_indices(self, ordinals, indices):
+        """Учитывает выборы по номерам вариантов в вопросе (отрицательный номер - другой вариант)"""
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        indices = np.asarray(indices, dtype=np.int64)
+        known = (indices >= 0) & (indices < len(self.labels) - 1)
+        bits = np.where(indices < 0, self._other_bit, np.left_shift(1, np.where(known, indices, 0)))
+        keep = known | (indices < 0)
+        np.bitwise_or.at(self.values, ordinals[keep], bits[keep])
+
+    def codes(self):
+        """Номер выбранного варианта на отправку (-1 - нет ответа) или None, если есть отправки с несколькими выборами"""
+        values = self.values
+        if ((values & (values - 1)) != 0).any():
+            return None
+        # Для степени двойки frexp точно дает показатель: 2**k = 0.5 * 2**(k + 1)
+        codes = np.frexp(values.astype(np.float64))[1].astype(np.int64) - 1
+        codes[values == 0] = -1
+        return codes
+
+    def indicators(self, start=0, stop=None):
+        """Матрица (вариант x отправка) для отправок [start, stop): выбран ли вариант в отправке"""
+        shifts = np.arange(len(self.labels), dtype=np.int64)[:, None]
+        return ((self.values[None, start:stop] >> shifts) & 1).astype(bool)
+
+    def answered(self):
+        return self.values != 0
+
+class RatingColumn:
+    """Вопрос-оценка: значение шкалы на отправку"""
+
+    kind = 'rating'
+
+    def __init__(self, question_id, scale_min, scale_max, size):
+        self.question_id = question_id
+        self.scale = np.arange(scale_min, scale_max + 1, dtype=np.int32)
+        self.labels = [str(value) for value in self.scale]
+        self.values = np.full(size, MISSING, dtype=np.int32)
+
+    def add(self, ordinal, rating):
+        self.values[ordinal] = rating
+
+    def codes(self):
+        """Номер значения шкалы на отправку (-1 - нет ответа или оценка вне шкалы)"""
+        in_scale = (self.values >= self.scale[0]) & (self.values <= self.scale[-1])
+        return np.where(in_scale, self.values.astype(np.int64) - int(self.scale[0]), -1)
+
+    def indicators(self, start=0, stop=None):
+        return self.values[None, start:stop] == self.scale[:, None]
+
+    def answered(self):
+        return self.values != MISSING
+
+class ResponseMatrix:
+    """Столбцы вопросов опроса над общим порядком отправок"""
+
+    def __init__(self, survey_id, response_ids):
+        self.survey_id = survey_id
+        self.response_ids = np.asarray(response_ids, dtype=np.int64)
+        self.ordinals = {int(response_id): ordinal for ordinal, response_id in enumerate(response_ids)}
+        self.columns = {}
+        self.unsupported = {}  # id вопроса -> причина, по которой столбец не построен
+
+    @property
+    def size(self):
+        return len(self.response_ids)
+
+    def add_choice_column(self, question_id, options):
+        """Столбец вопроса с вариантами; None, если вариантов больше, чем помещается в битовую маску"""
+        try:
+            self.columns[question_id] = ChoiceColumn(question_id, options, self.size)
+        except ValueError as e:
+            self.unsupported[question_id] = str(e)
+            return None
+        return self.columns[question_id]
+
+    def add_rating_column(self, question_id, scale_min, scale_max):
+        self.columns[question_id] = RatingColumn(question_id, scale_min, scale_max, self.size)
+        return self.columns[question_id]
+
+    def nbytes(self):
+        return self.response_ids.nbytes + sum(column.values.nbytes for column in self.columns.values())
+
+def crosstab(row_column, col_column, chunk_size=CHUNK_SIZE):
+    """Таблица сопряженности двух вопросов
+
+    Отправка с несколькими выбранными вариантами учитывается в каждой своей
+    ячейке, поэтому для вопросов с множественным выбором сумма ячеек может
+    превышать число отправок (respondents).
+    """
+    n_rows, n_cols = len(row_column.labels), len(col_column.labels)
+    row_codes = row_column.codes()
+    col_codes = col_column.codes() if row_codes is not None else None
+    if col_codes is not None:
+        keep = (row_codes >= 0) & (col_codes >= 0)
+        table = np.bincount(row_codes[keep] * n_cols + col_codes[keep],
+                            minlength=n_rows * n_cols).reshape(n_rows, n_cols)
+    else:
+        table = np.zeros((n_rows, n_cols), dtype=np.int64)
+        for start, stop in _chunks(len(row_column.values), chunk_size):
+            row_indicators = row_column.indicators(start, stop).astype(np.float64)
+            col_indicators = col_column.indicators(start, stop).astype(np.float64)
+            # float64 - умножение через BLAS; в блоке счетчики заведомо точны
+            table += (row_indicators @ col_indicators.T).astype(np.int64)
+    both = row_column.answered() & col_column.answered()
+    return {
+        'rows': row_column.labels,
+        'columns': col_column.labels,
+        'table': table.tolist(),
+        'row_totals': table.sum(axis=1).tolist(),
+        'col_totals': table.sum(axis=0).tolist(),
+        'total': int(table.sum()),
+        'respondents': int(both.sum())
+    }
+
+def group_means(group_column, rating_column, chunk_size=CHUNK_SIZE):
+    """Средняя оценка, отклонение и число оценок в каждой группе вопроса group_column"""
+    n_groups = len(group_column.labels)
+    valid = rating_column.answered()
+    ratings = rating_column.values.astype(np.float64)
+    codes = group_column.codes()
+    if codes is not None:
+        keep = valid & (codes >= 0)
+        counts = np.bincount(codes[keep], minlength=n_groups).astype(np.float64)
+        sums = np.bincount(codes[keep], weights=ratings[keep], minlength=n_groups)
+        squares = np.bincount(codes[keep], weights=ratings[keep] ** 2, minlength=n_groups)
+    else:
+        counts, sums, squares = np.zeros(n_groups), np.zeros(n_groups), np.zeros(n_groups)
+        for start, stop in _chunks(len(valid), chunk_size):
+            block_valid = valid[start:stop]
+            groups = group_column.indicators(start, stop)[:, block_valid].astype(np.float64)
+            block_ratings = ratings[start:stop][block_valid]
+            counts += groups.sum(axis=1)
+            sums += groups @ block_ratings
+            squares += groups @ (block_ratings * block_ratings)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(counts > 0, sums / counts, np.nan)
+        variances = np.where(counts > 0, squares / counts - means * means, np.nan)
+    stds = np.sqrt(np.clip(variances, 0, None))
+
+    return [{
+        'group': label,
+        'count': int(count),
+        'mean': None if np.isnan(mean) else round(float(mean), 3),
+        'std': None if np.isnan(std) else round(float(std), 3)
+    } for label, count, mean, std in zip(group_column.labels, counts, means, stds)]
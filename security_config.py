@@ -42,6 +42,48 @@ class SecurityConfig:
             'RATELIMIT_STORAGE_URL': 'memory://',
             'RATELIMIT_DEFAULT': '1000 per hour',
             
+            # Кеш аналитики (секунды)
+            'ANALYTICS_CACHE_TTL': int(os.environ.get('ANALYTICS_CACHE_TTL', 300)),
+            'ANALYTICS_CACHE_SWEEP_INTERVAL': int(os.environ.get('ANALYTICS_CACHE_SWEEP_INTERVAL', 600)),
+            # Глобальная аналитика и кросс-анализ не сбрасываются при каждой отправке, а устаревают по времени
+            'GLOBAL_ANALYTICS_CACHE_TTL': int(os.environ.get('GLOBAL_ANALYTICS_CACHE_TTL', 60)),
+            
+            # Очередь отложенной записи ответов (для пиковой нагрузки)
+            'SUBMISSION_QUEUE_ENABLED': os.environ.get('SUBMISSION_QUEUE_ENABLED', 'false').lower() == 'true',
+            'SUBMISSION_QUEUE_PATH': os.environ.get('SUBMISSION_QUEUE_PATH', 'submission_queue.db'),
+            'SUBMISSION_QUEUE_BATCH_SIZE': int(os.environ.get('SUBMISSION_QUEUE_BATCH_SIZE', 200)),
+            'SUBMISSION_QUEUE_MAX_LATENCY': float(os.environ.get('SUBMISSION_QUEUE_MAX_LATENCY', 2.0)),  # секунды
+            
+            # Excel-экспорт: с этого числа ответов книга пишется потоково (write-only)
+            'EXCEL_STREAMING_THRESHOLD': int(os.environ.get('EXCEL_STREAMING_THRESHOLD', 2000)),
+            
+            # Фоновые задания Excel-отчетов
+            'EXPORT_JOB_WORKERS': int(os.environ.get('EXPORT_JOB_WORKERS', 2)),
+            'EXPORT_ARTIFACT_DIR': os.environ.get('EXPORT_ARTIFACT_DIR', 'exports'),
+            'EXPORT_ARTIFACT_TTL': int(os.environ.get('EXPORT_ARTIFACT_TTL', 86400)),  # секунды
+            'EXPORT_JOB_TIMEOUT': int(os.environ.get('EXPORT_JOB_TIMEOUT', 1800)),  # секунды
+            
+            # Постраничный вывод результатов опроса
+            'RESULTS_PAGE_SIZE': int(os.environ.get('RESULTS_PAGE_SIZE', 50)),
+            'TEXT_ANSWERS_PAGE_SIZE': int(os.environ.get('TEXT_ANSWERS_PAGE_SIZE', 20)),
+            
+            # Полнотекстовый поиск по ответам (конфигурация tsvector используется только в PostgreSQL)
+            'SEARCH_PAGE_SIZE': int(os.environ.get('SEARCH_PAGE_SIZE', 20)),
+            'SEARCH_PG_CONFIG': os.environ.get('SEARCH_PG_CONFIG', 'russian'),
+            
+            # Сколько колоночных матриц ответов (кросс-табуляция) держать в памяти процесса
+            'RESPONSE_MATRIX_CACHE_SIZE': int(os.environ.get('RESPONSE_MATRIX_CACHE_SIZE', 16)),
+            
+            # Сколько скомпилированных схем опросов (разобранные вопросы для показа и отправки) держать в памяти процесса
+            'SURVEY_SCHEMA_CACHE_SIZE': int(os.environ.get('SURVEY_SCHEMA_CACHE_SIZE', 256)),
+            
+            # Сколько готовых страниц опросов для анонимных посетителей держать в памяти процесса
+            'SURVEY_PAGE_CACHE_SIZE': int(os.environ.get('SURVEY_PAGE_CACHE_SIZE', 512)),
+            
+            # Офлайн-геолокация: CSV-база сетевых префиксов и размер LRU-кеша поиска по префиксу
+            'GEO_DATABASE_PATH': os.environ.get('GEO_DATABASE_PATH', 'geo_prefixes.csv'),
+            'GEO_LOOKUP_CACHE_SIZE': int(os.environ.get('GEO_LOOKUP_CACHE_SIZE', 4096)),
+            
             # Настройки файлов
             'MAX_CONTENT_LENGTH': 16 * 1024 * 1024,  # 16MB максимум
             'UPLOAD_FOLDER': 'uploads',
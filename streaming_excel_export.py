@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Потоковый экспорт Excel для больших опросов
+
+Книга создается в режиме write_only: строки листа ответов записываются по мере
+чтения из курсора БД и сразу уходят во временный файл, поэтому расход памяти
+не зависит от количества ответов. Листы резюме, аналитики и графиков
+оформлены так же, как в enhanced_excel_export.
+"""
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.chart import BarChart, PieChart, Reference
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from enhanced_excel_export import (
+    get_report_styles, generate_key_insights, generate_recommendations,
+    get_question_type_name, format_answer_for_excel
+)
+
+class SheetBuffer:
+    """Ячейки небольшого листа по координатам; записываются в write-only лист построчно"""
+
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.rows = {}
+
+    def cell(self, row, column, value=None, **style):
+        entry = self.rows.setdefault(row, {}).setdefault(column, {})
+        if value is not None:
+            entry['value'] = value
+        entry.update(style)
+
+    def merge(self, cell_range):
+        self.worksheet.merged_cells.add(cell_range)
+
+    def flush(self):
+        if not self.rows:
+            return
+        for row in range(1, max(self.rows) + 1):
+            columns = self.rows.get(row, {})
+            cells = []
+            for column in range(1, max(columns, default=0) + 1):
+                entry = dict(columns.get(column, {}))
+                cell = WriteOnlyCell(self.worksheet, entry.pop('value', None))
+                for attribute, value in entry.items():
+                    setattr(cell, attribute, value)
+                cells.append(cell)
+            self.worksheet.append(cells)
+
+def write_streaming_excel_report(path, survey, questions, summary, question_analytics, response_records):
+    """Записывает отчет в файл path.
+
+    summary - метрики резюме, посчитанные в БД (response_count, avg_completion_time,
+    completion_rate, unique_ips); response_records - итератор кортежей
+    (ответ, имя пользователя, {question_id: ответ на вопрос}) в порядке выдачи курсора.
+    """
+    wb = Workbook(write_only=True)
+    styles = get_report_styles()
+
+    write_summary_sheet(wb, survey, questions, summary, question_analytics, styles)
+    write_analytics_sheet(wb, questions, summary, question_analytics, styles)
+    write_charts_sheet(wb, questions, question_analytics, styles)
+    rows_written = write_responses_sheet(wb, survey, questions, response_records, styles)
+
+    wb.save(path)
+    return rows_written
+
+def _sheet_title(buffer, cell_range, title, styles):
+    buffer.merge(cell_range)
+    buffer.cell(1, 1, title, font=styles['header_font'], fill=styles['header_fill'],
+                alignment=styles['header_alignment'])
+    buffer.worksheet.row_dimensions[1].height = 35
+
+def write_summary_sheet(wb, survey, questions, summary, question_analytics, styles):
+    """Лист 1: исполнительное резюме"""
+    ws = wb.create_sheet('Исполнительное резюме')
+    buffer = SheetBuffer(ws)
+    subheader = {'font': styles['subheader_font'], 'fill': styles['subheader_fill'], 'border': styles['border']}
+
+    _sheet_title(buffer, 'A1:H1', f'ИСПОЛНИТЕЛЬНОЕ РЕЗЮМЕ: {survey.title}', styles)
+
+    # Ключевые метрики
+    row = 3
+    metrics = [
+        ('Общее количество ответов', summary['response_count']),
+        ('Количество вопросов', len(questions)),
+        ('Дата создания', survey.created_at.strftime('%d.%m.%Y')),
+        ('Статус', 'Активен' if survey.is_active else 'Неактивен'),
+        ('Тип опроса', 'Анонимный' if survey.is_anonymous else 'Авторизованный'),
+        ('Среднее время прохождения', summary['avg_completion_time']),
+        ('Процент завершения', summary['completion_rate']),
+        ('Уникальные IP адреса', summary['unique_ips'])
+    ]
+
+    for i, (label, value) in enumerate(metrics):
+        col = (i % 4) * 2 + 1
+        current_row = row + (i // 4) * 2
+        buffer.cell(current_row, col, label, **subheader)
+        buffer.cell(current_row, col + 1, value, font=styles['data_font'],
+                    alignment=styles['number_alignment'], border=styles['border'])
+
+    # Ключевые инсайты и рекомендации
+    row += 8
+    sections = [
+        ('КЛЮЧЕВЫЕ ИНСАЙТЫ', generate_key_insights(survey, summary['response_count'], question_analytics)),
+        ('РЕКОМЕНДАЦИИ', generate_recommendations(survey, summary['response_count'], question_analytics))
+    ]
+    for index, (title, items) in enumerate(sections):
+        if index:
+            row += 1
+        buffer.merge(f'A{row}:H{row}')
+        buffer.cell(row, 1, title, **subheader)
+        row += 1
+        for item in items:
+            buffer.merge(f'A{row}:H{row}')
+            buffer.cell(row, 1, f"• {item}", font=styles['data_font'], border=styles['border'])
+            row += 1
+
+    # Ширина колонок задается до записи строк
+    for col in range(1, 9):
+        ws.column_dimensions[chr(64+col)].width = 15
+    buffer.flush()
+
+def write_analytics_sheet(wb, questions, summary, question_analytics, styles):
+    """Лист 2: детальная аналитика по вопросам"""
+    ws = wb.create_sheet('Детальная аналитика')
+    buffer = SheetBuffer(ws)
+    data_cell = {'font': styles['data_font'], 'border': styles['border']}
+    number_cell = dict(data_cell, alignment=styles['number_alignment'])
+    response_count = summary['response_count']
+
+    _sheet_title(buffer, 'A1:J1', 'ДЕТАЛЬНАЯ АНАЛИТИКА ПО ВОПРОСАМ', styles)
+
+    headers = ['Вопрос', 'Тип', 'Ответов', 'Процент ответов', 'Популярный ответ',
+               'Процент популярного', 'Инсайты', 'Рекомендации', 'Средняя длина', 'Вариативность']
+    for i, header in enumerate(headers, 1):
+        buffer.cell(3, i, header, font=styles['subheader_font'], fill=styles['subheader_fill'],
+                    border=styles['border'], alignment=styles['header_alignment'])
+
+    row = 4
+    for question in questions:
+        analytics = question_analytics.get(question.id, {})
+        data = analytics.get('data', {})
+        insights = analytics.get('insights', [])
+        recommendations = analytics.get('recommendations', [])
+
+        buffer.cell(row, 1, question.text[:50] + ('...' if len(question.text) > 50 else ''), **data_cell)
+        buffer.cell(row, 2, get_question_type_name(question.type), **data_cell)
+        buffer.cell(row, 3, analytics.get('total_answers', 0), **number_cell)
+        buffer.cell(row, 4, f"{analytics.get('response_rate', 0):.1f}%", **number_cell)
+
+        # Популярный ответ
+        if question.type in ['single_choice', 'multiple_choice', 'dropdown']:
+            most_popular = data.get('most_popular', ('Нет данных', 0))
+            popular = most_popular[0]
+            share = f"{most_popular[1]} ({most_popular[1]/response_count*100:.1f}%)" if response_count > 0 else "0%"
+        elif question.type in ['rating', 'scale']:
+            popular = f"Средняя оценка: {data.get('avg', 0)}"
+            share = f"±{data.get('std_deviation', 0):.1f}"
+        else:
+            popular = "Текстовый ответ"
+            share = f"Средняя длина: {data.get('avg_length', 0):.0f} симв."
+        buffer.cell(row, 5, popular, **data_cell)
+        buffer.cell(row, 6, share, **data_cell)
+
+        # Инсайты и рекомендации
+        buffer.cell(row, 7, '; '.join(insights[:2]) if insights else 'Нет данных', **data_cell)
+        buffer.cell(row, 8, '; '.join(recommendations[:2]) if recommendations else 'Нет данных', **data_cell)
+
+        # Дополнительные метрики
+        if question.type in ['text', 'text_paragraph']:
+            extra = (f"{data.get('avg_length', 0):.0f}",
+                     f"{data.get('max_length', 0) - data.get('min_length', 0):.0f}")
+        elif question.type in ['rating', 'scale']:
+            extra = (f"{data.get('avg', 0):.1f}", f"{data.get('coefficient_of_variation', 0):.1f}%")
+        else:
+            extra = ("-", "-")
+        buffer.cell(row, 9, extra[0], **number_cell)
+        buffer.cell(row, 10, extra[1], **number_cell)
+
+        row += 1
+
+    column_widths = [30, 15, 10, 12, 20, 15, 25, 25, 12, 12]
+    for i, width in enumerate(column_widths, 1):
+        ws.column_dimensions[chr(64+i)].width = width
+    buffer.flush()
+
+def write_charts_sheet(wb, questions, question_analytics, styles):
+    """Лист 3: графики (те же диаграммы и диапазоны данных, что в обычном экспорте)"""
+    ws = wb.create_sheet('Графики и визуализация')
+    buffer = SheetBuffer(ws)
+
+    _sheet_title(buffer, 'A1:H1', 'ГРАФИКИ И ВИЗУАЛИЗАЦИЯ ДАННЫХ', styles)
+
+    chart_row = 3
+    for question in questions:
+        data = question_analytics.get(question.id, {}).get('data', {})
+
+        if question.type in ['single_choice', 'multiple_choice', 'dropdown']:
+            _buffer_top_chart(buffer, BarChart, question, data, chart_row, 10,
+                              'Распределение ответов', 'Ответы на вопрос')
+            chart_row += 20
+        elif question.type in ['rating', 'scale']:
+            _buffer_rating_chart(buffer, question, data, chart_row)
+            chart_row += 20
+        elif question.type == 'checkbox':
+            _buffer_top_chart(buffer, PieChart, question, data, chart_row, 8,
+                              'Распределение выборов', 'Выборы')
+            chart_row += 20
+
+    buffer.flush()
+
+def _add_chart(buffer, chart, start_row, items_count):
+    ws = buffer.worksheet
+    data_range = Reference(ws, min_col=2, min_row=start_row + 2, max_row=start_row + 2 + items_count)
+    categories = Reference(ws, min_col=1, min_row=start_row + 3, max_row=start_row + 2 + items_count)
+    chart.add_data(data_range)
+    chart.set_categories(categories)
+    ws.add_chart(chart, f'D{start_row}')
+
+def _buffer_top_chart(buffer, chart_class, question, data, start_row, limit, caption, chart_caption):
+    """Аналог create_bar_chart/create_pie_chart: топ вариантов и диаграмма"""
+    if not data.get('counts'):
+        return
+
+    sorted_data = sorted(data['counts'].items(), key=lambda x: x[1], reverse=True)[:limit]
+
+    buffer.cell(start_row, 1, f'{caption}: {question.text[:40]}...', font=Font(bold=True, size=12))
+    for i, (option, count) in enumerate(sorted_data):
+        buffer.cell(start_row + 2 + i, 1, option[:30])
+        buffer.cell(start_row + 2 + i, 2, count)
+
+    chart = chart_class()
+    chart.title = f'{chart_caption}: {question.text[:30]}...'
+    if chart_class is BarChart:
+        chart.style = 10
+    _add_chart(buffer, chart, start_row, len(sorted_data))
+
+def _buffer_rating_chart(buffer, question, data, start_row):
+    """Аналог create_rating_chart"""
+    if not data.get('distribution'):
+        return
+
+    distribution = data['distribution']
+
+    buffer.cell(start_row, 1, f'Распределение оценок: {question.text[:40]}...', font=Font(bold=True, size=12))
+    for rating, count in distribution.items():
+        buffer.cell(start_row + 2 + int(rating), 1, f'Оценка {rating}')
+        buffer.cell(start_row + 2 + int(rating), 2, count)
+
+    chart = BarChart()
+    chart.title = f'Распределение оценок: {question.text[:30]}...'
+    chart.style = 10
+    _add_chart(buffer, chart, start_row, len(distribution))
+
+def write_responses_sheet(wb, survey, questions, response_records, styles):
+    """Лист 4: ответы пользователей - строки пишутся сразу по мере чтения"""
+    ws = wb.create_sheet('Ответы пользователей')
+
+    headers = ['ID ответа', 'Дата', 'Пользователь', 'IP адрес', 'Время прохождения']
+    for i, question in enumerate(questions):
+        headers.append(f'Q{i+1}: {question.text[:30]}...')
+
+    # Ширина колонок и высота заголовка задаются до первой строки
+    ws.column_dimensions['A'].width = 8
+    ws.column_dimensions['B'].width = 15
+    ws.column_dimensions['C'].width = 15
+    ws.column_dimensions['D'].width = 15
+    ws.column_dimensions['E'].width = 12
+    for col in range(6, len(headers) + 1):
+        ws.column_dimensions[get_column_letter(col)].width = 20
+    ws.row_dimensions[1].height = 35
+
+    ws.merged_cells.add('A1:Z1')
+    title = WriteOnlyCell(ws, 'ДЕТАЛЬНЫЕ ОТВЕТЫ ПОЛЬЗОВАТЕЛЕЙ')
+    title.font = styles['header_font']
+    title.fill = styles['header_fill']
+    title.alignment = styles['header_alignment']
+    ws.append([title])
+    ws.append([])
+
+    header_cells = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, header)
+        cell.font = styles['subheader_font']
+        cell.fill = styles['subheader_fill']
+        cell.border = styles['border']
+        cell.alignment = styles['header_alignment']
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    def styled(value, column):
+        cell = WriteOnlyCell(ws, value)
+        cell.font = styles['data_font']
+        cell.border = styles['border']
+        if column <= 5:  # Основные колонки
+            cell.alignment = styles['number_alignment']
+        return cell
+
+    rows_written = 0
+    for response, username, answers in response_records:
+        # Определяем имя пользователя
+        if survey.is_anonymous:
+            user_name = 'Аноним'
+        elif survey.require_name:
+            user_name = response.respondent_name or 'Не указано'
+        elif response.user_id and username:
+            user_name = username
+        else:
+            user_name = 'Неизвестно'
+
+        values = [
+            response.id,
+            response.created_at.strftime('%d.%m.%Y %H:%M'),
+            user_name,
+            response.ip_address or 'Не указан',
+            f"{response.completion_time or 0:.1f} мин"
+        ]
+        for question in questions:
+            answer = answers.get(question.id)
+            if answer and answer.value:
+                values.append(format_answer_for_excel(answer, question))
+            else:
+                values.append('Нет ответа')
+
+        ws.append([styled(value, column) for column, value in enumerate(values, 1)])
+        rows_written += 1
+
+    return rows_written
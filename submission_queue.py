@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Очередь отложенной записи ответов BG Survey Platform
+
+Отправки сохраняются в локальную staging-базу SQLite (режим WAL) и сразу
+подтверждаются пользователю. Фоновый поток забирает их пачками и передает
+обработчику записи (store_submissions в app.py). Записи, оставшиеся в
+staging-базе после падения процесса, повторно обрабатываются при старте.
+
+Гарантия доставки - "как минимум один раз": если процесс упал после записи
+пачки в основную БД, но до удаления ее из очереди, пачка будет записана
+повторно.
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+
+class SubmissionQueue:
+    """Долговременная очередь отправок на staging-таблице SQLite"""
+
+    # Сколько раз пытаемся записать отправку, прежде чем отложить ее для ручного разбора
+    MAX_ATTEMPTS = 5
+    FAILED_MARK = 'failed'
+
+    def __init__(self, path, flush_handler, batch_size=200, max_latency=2.0, claim_timeout=300):
+        self.path = path
+        self.flush_handler = flush_handler
+        self.batch_size = max(1, int(batch_size))
+        self.max_latency = max(0.05, float(max_latency))
+        self.claim_timeout = claim_timeout
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.stats = {
+            'enqueued': 0,
+            'flushed': 0,
+            'batches': 0,
+            'errors': 0,
+            'failed': 0,
+            'recovered': 0,
+            'last_batch_size': 0,
+            'last_flush_at': None
+        }
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._pending = 0
+        self._thread = None
+        self._stopping = False
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._init_schema()
+
+    def _connection(self):
+        """Отдельное соединение на поток (sqlite3 не разделяет соединения между потоками)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS staged (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                payload TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                claimed_by TEXT,
+                claimed_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS ix_staged_claimed_by ON staged (claimed_by, id)')
+
+    def enqueue(self, submission):
+        """Сохраняет отправку в staging-таблицу; после возврата она переживет падение процесса"""
+        payload = json.dumps(submission, ensure_ascii=False)
+        cursor = self._connection().execute(
+            'INSERT INTO staged (payload, enqueued_at) VALUES (?, ?)', (payload, time.time())
+        )
+        self.stats['enqueued'] += 1
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self._wakeup.set()
+        return cursor.lastrowid
+
+    def recover(self):
+        """Возвращает в очередь пачки, захваченные упавшими или зависшими обработчиками"""
+        conn = self._connection()
+        cursor = conn.execute(
+            'UPDATE staged SET claimed_by = NULL, claimed_at = NULL '
+            'WHERE claimed_by IS NOT NULL AND claimed_by != ? AND (claimed_by LIKE ? OR claimed_at < ?)',
+            (self.FAILED_MARK, f'{self.worker_id}:%', time.time() - self.claim_timeout)
+        )
+        self.stats['recovered'] += cursor.rowcount
+        return cursor.rowcount
+
+    def _claim_batch(self):
+        """Атомарно помечает пачку незахваченных отправок токеном этого обработчика"""
+        token = f"{self.worker_id}:{uuid.uuid4().hex}"
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'UPDATE staged SET claimed_by = ?, claimed_at = ? WHERE id IN ('
+                'SELECT id FROM staged WHERE claimed_by IS NULL ORDER BY id LIMIT ?)',
+                (token, time.time(), self.batch_size)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        rows = conn.execute(
+            'SELECT id, payload FROM staged WHERE claimed_by = ? ORDER BY id', (token,)
+        ).fetchall()
+        return rows
+
+    def _release(self, row_ids, error):
+        """Возвращает отправки в очередь; после MAX_ATTEMPTS откладывает их с пометкой failed"""
+        conn = self._connection()
+        for row_id in row_ids:
+            conn.execute(
+                'UPDATE staged SET attempts = attempts + 1, last_error = ?, claimed_at = NULL, '
+                'claimed_by = CASE WHEN attempts + 1 >= ? THEN ? ELSE NULL END WHERE id = ?',
+                (str(error)[:500], self.MAX_ATTEMPTS, self.FAILED_MARK, row_id)
+            )
+        self.stats['failed'] = self.failed_count()
+
+    def _flush_rows(self, rows):
+        conn = self._connection()
+        submissions = [json.loads(payload) for _, payload in rows]
+        try:
+            self.flush_handler(submissions)
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"⚠️  Ошибка записи пачки из очереди ({len(rows)} отправок): {e}")
+            if len(rows) == 1:
+                self._release([rows[0][0]], e)
+                return 0
+            # Пишем по одной, чтобы одна некорректная отправка не блокировала всю пачку
+            written = 0
+            for row in rows:
+                written += self._flush_rows([row])
+            return written
+
+        conn.execute(
+            f"DELETE FROM staged WHERE id IN ({','.join('?' * len(rows))})",
+            [row_id for row_id, _ in rows]
+        )
+        self.stats['flushed'] += len(rows)
+        return len(rows)
+
+    def flush(self):
+        """Записывает все незахваченные отправки пачками; возвращает число записанных"""
+        total = 0
+        with self._flush_lock:
+            while True:
+                rows = self._claim_batch()
+                if not rows:
+                    break
+                self._pending = max(0, self._pending - len(rows))
+                written = self._flush_rows(rows)
+                total += written
+                self.stats['batches'] += 1
+                self.stats['last_batch_size'] = len(rows)
+                self.stats['last_flush_at'] = time.time()
+                if written == 0:
+                    break
+        return total
+
+    def _oldest_age(self):
+        row = self._connection().execute(
+            'SELECT MIN(enqueued_at) FROM staged WHERE claimed_by IS NULL'
+        ).fetchone()
+        return time.time() - row[0] if row and row[0] is not None else 0
+
+    def _run(self):
+        self.recover()
+        while not self._stopping:
+            try:
+                # Пишем, когда набралась пачка или самая старая отправка ждет дольше max_latency
+                if self._pending >= self.batch_size or self._oldest_age() >= self.max_latency:
+                    self.flush()
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"⚠️  Ошибка обработчика очереди ответов: {e}")
+            self._wakeup.wait(self.max_latency / 2)
+            self._wakeup.clear()
+
+    def start(self):
+        """Запускает фоновый поток записи (повторно обрабатывает оставшиеся после падения записи)"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name='submission-queue-flusher')
+        self._thread.start()
+
+    def stop(self, flush=True):
+        """Останавливает поток записи и, по умолчанию, дописывает остаток очереди"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.max_latency * 4)
+            self._thread = None
+        if flush:
+            self.flush()
+
+    def failed_count(self):
+        return self._connection().execute(
+            'SELECT COUNT(*) FROM staged WHERE claimed_by = ?', (self.FAILED_MARK,)
+        ).fetchone()[0]
+
+    def metrics(self):
+        """Глубина очереди и счетчики обработчика этого процесса"""
+        conn = self._connection()
+        depth, in_flight, failed = conn.execute(
+            'SELECT '
+            'COALESCE(SUM(CASE WHEN claimed_by IS NULL THEN 1 ELSE 0 END), 0), '
+            'COALESCE(SUM(CASE WHEN claimed_by IS NOT NULL AND claimed_by != ? THEN 1 ELSE 0 END), 0), '
+            'COALESCE(SUM(CASE WHEN claimed_by = ? THEN 1 ELSE 0 END), 0) '
+            'FROM staged',
+            (self.FAILED_MARK, self.FAILED_MARK)
+        ).fetchone()
+        return {
+            'depth': depth,
+            'in_flight': in_flight,
+            'failed': failed,
+            'oldest_age_seconds': round(self._oldest_age(), 3),
+            'batch_size': self.batch_size,
+            'max_latency': self.max_latency,
+            'worker': self.worker_id,
+            'process': dict(self.stats)
+        }
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Скомпилированная схема опроса BG Survey Platform
+
+Вопросы опроса с уже разобранными JSON полями (варианты, подписи оценок,
+строки и столбцы сетки), именами полей формы и функцией чтения ответа из
+формы для каждого типа вопроса. Схема строится один раз на версию опроса
+и используется при показе и отправке опроса без повторного разбора JSON.
+"""
+
+from datetime import datetime
+
+DEFAULT_OTHER_TEXT = 'Другой вариант'
+
+# ==================== ЧТЕНИЕ ОТВЕТОВ ИЗ ФОРМЫ ====================
+
+def _read_plain(question, form):
+    return form.get(question.field_name)
+
+def _read_dropdown(question, form):
+    """Выпадающий список: для "Другого варианта" ответом становится введенный текст"""
+    value = form.get(question.field_name)
+    if value == 'other':
+        return form.get(question.other_text_field) or 'other'
+    return value
+
+def _valid_rating(question, value):
+    """Оценка - целое число в пределах шкалы вопроса"""
+    try:
+        rating = int(value)
+    except ValueError:
+        return False
+    return question.rating_min <= rating <= question.rating_max
+
+def _valid_date(question, value):
+    try:
+        datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        return False
+    return True
+
+def _valid_time(question, value):
+    for time_format in ('%H:%M', '%H:%M:%S'):
+        try:
+            datetime.strptime(value, time_format)
+        except ValueError:
+            continue
+        return True
+    return False
+
+ANSWER_READERS = {'dropdown': _read_dropdown}
+ANSWER_VALIDATORS = {
+    'rating': _valid_rating,
+    'scale': _valid_rating,
+    'date': _valid_date,
+    'time': _valid_time,
+}
+
+# ==================== СХЕМА ОПРОСА ====================
+
+class CompiledQuestion:
+    """Вопрос с разобранными вариантами и именами полей формы"""
+
+    def __init__(self, question, options=(), rating_labels=(), grid_rows=(), grid_columns=()):
+        self.id = question.id
+        self.text = question.text
+        self.type = question.type
+        self.is_required = question.is_required
+        self.allow_other = question.allow_other
+        self.other_text = question.other_text or DEFAULT_OTHER_TEXT
+        self.rating_min = question.rating_min or 1
+        self.rating_max = question.rating_max or 10
+        self.rating_step = question.rating_step or 1
+        self.question_order = question.question_order
+        self.options = tuple(options)
+        self.rating_labels = tuple(rating_labels)
+        self.grid_rows = tuple(grid_rows)
+        self.grid_columns = tuple(grid_columns)
+
+        self.field_name = f'question_{self.id}'
+        self.other_flag_field = f'question_{self.id}_other'
+        self.other_text_field = f'question_{self.id}_other_text'
+        self._read = ANSWER_READERS.get(self.type, _read_plain)
+        self._validate = ANSWER_VALIDATORS.get(self.type)
+
+    def answer_from_form(self, form):
+        """Ответ на вопрос из данных формы ({'question_id', 'value', 'is_other'}) или None
+
+        None - вопрос пропущен или значение не подходит для типа вопроса
+        (оценка вне шкалы, некорректная дата или время).
+        """
+        value = self._read(self, form)
+        if not value:
+            return None
+        if self._validate is not None and not self._validate(self, value):
+            return None
+        return {
+            'question_id': self.id,
+            'value': value,
+            'is_other': form.get(self.other_flag_field) == 'true' or value == 'other'
+        }
+
+class CompiledSurvey:
+    """Схема опроса одной версии: вопросы по порядку и интернированные варианты"""
+
+    def __init__(self, survey_id, version, questions, option_ids_by_question=None):
+        self.survey_id = survey_id
+        self.version = version
+        self.questions = tuple(questions)
+        self.questions_by_id = {question.id: question for question in self.questions}
+        self.option_ids_by_question = option_ids_by_question or {}
+
+    def answers_from_form(self, form):
+        """Ответы на вопросы опроса из данных формы (пропущенные вопросы не включаются)"""
+        answers = []
+        for question in self.questions:
+            answer = question.answer_from_form(form)
+            if answer is not None:
+                answers.append(answer)
+        return answers
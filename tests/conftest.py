@@ -0,0 +1,119 @@
+"""
+Общие фикстуры тестов BG Survey Platform: временная SQLite база и счетчик SQL-запросов
+"""
+
+import json
+import os
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+
+# База данных задается до импорта приложения: конфигурация читается при импорте app
+_database_dir = tempfile.mkdtemp(prefix='bg_survey_tests_')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_database_dir, 'test.db')
+os.environ.setdefault('SECRET_KEY', 'test-secret-key')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+
+import app as app_module
+from app import db, User, Survey, Question, store_submissions, sync_question_options
+
+@pytest.fixture
+def app():
+    """Приложение с пустой базой данных на время теста"""
+    flask_app = app_module.app
+    flask_app.config['TESTING'] = True
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+    app_module.security_middleware.rate_limits.clear()
+
+@pytest.fixture
+def count_queries(app):
+    """Контекстный менеджер: считает SQL-запросы, выполненные внутри блока"""
+    @contextmanager
+    def counter():
+        queries = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            queries.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield queries
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return counter
+
+@pytest.fixture
+def admin(app):
+    user = User(username='admin', email='admin@example.com', password_hash='-',
+                is_admin=True, can_create_surveys=True)
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+@pytest.fixture
+def admin_client(app, admin):
+    """Тестовый клиент с сессией администратора"""
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(admin.id)
+        session['_fresh'] = True
+    return client
+
+QUESTION_TEMPLATES = [
+    dict(type='single_choice', options=json.dumps(['Да', 'Нет', 'Может быть'])),
+    dict(type='multiple_choice', options=json.dumps(['A', 'B', 'C']), allow_other=True),
+    dict(type='rating', rating_min=1, rating_max=5),
+    dict(type='grid', grid_rows=json.dumps(['r1', 'r2']), grid_columns=json.dumps(['c1', 'c2'])),
+    dict(type='text'),
+    dict(type='date'),
+]
+
+ANSWER_VALUES = {
+    'single_choice': lambda i: ['Да', 'Нет', 'Может быть'][i % 3],
+    'multiple_choice': lambda i: json.dumps(['A', 'C'] if i % 2 else ['B']),
+    'rating': lambda i: str(i % 5 + 1),
+    'grid': lambda i: json.dumps(['r1|c1', 'r2|c2'] if i % 2 else ['r1|c2']),
+    'text': lambda i: f'ответ номер {i}',
+    'date': lambda i: f'2024-0{i % 9 + 1}-15',
+}
+
+def create_survey(creator, question_count, title='Опрос'):
+    """Опрос с question_count вопросами разных типов"""
+    survey = Survey(title=title, description='', creator_id=creator.id)
+    db.session.add(survey)
+    db.session.flush()
+    questions = []
+    for order in range(question_count):
+        template = QUESTION_TEMPLATES[order % len(QUESTION_TEMPLATES)]
+        questions.append(Question(survey_id=survey.id, text=f'Вопрос {order + 1}', question_order=order, **template))
+    db.session.add_all(questions)
+    db.session.flush()
+    for question in questions:
+        sync_question_options(question, [])
+    db.session.commit()
+    return survey
+
+def add_responses(survey, count, start=datetime(2024, 3, 1), user_id=None):
+    """Сохраняет count отправок с ответами на все вопросы опроса"""
+    questions = Question.query.filter_by(survey_id=survey.id).order_by(Question.question_order).all()
+    submissions = [{
+        'survey_id': survey.id,
+        'user_id': user_id,
+        'respondent_name': None,
+        'ip_address': f'10.{i % 4}.{i % 7}.{i % 250 + 1}',
+        'user_agent': 'pytest',
+        'completion_time': 30 + i % 60,
+        'created_at': start + timedelta(hours=i * 5),
+        'answers': [{'question_id': question.id, 'value': ANSWER_VALUES[question.type](i), 'is_other': False}
+                    for question in questions]
+    } for i in range(count)]
+    return store_submissions(submissions, {question.id: question for question in questions})
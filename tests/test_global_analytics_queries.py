@@ -0,0 +1,32 @@
+"""
+Глобальная аналитика считается фиксированным числом запросов независимо от объема данных
+"""
+
+from app import db, User, _compute_global_analytics
+
+from conftest import create_survey, add_responses
+
+def _global_analytics_queries(count_queries):
+    with count_queries() as queries:
+        analytics = _compute_global_analytics()
+    return len(queries), analytics
+
+def test_global_analytics_query_count_does_not_grow(app, admin, count_queries):
+    survey = create_survey(admin, 3)
+    add_responses(survey, 2)
+    _compute_global_analytics()  # Прогрев: загрузка базы сетевых префиксов и т.п.
+    small_count, small = _global_analytics_queries(count_queries)
+    assert small['total_responses'] == 2
+
+    users = [User(username=f'user{i}', email=f'user{i}@example.com', password_hash='-',
+                  can_create_surveys=i % 2 == 0) for i in range(15)]
+    db.session.add_all(users)
+    db.session.commit()
+    for i in range(12):
+        survey = create_survey(users[i], 6, title=f'Опрос {i}')
+        add_responses(survey, 40, user_id=users[(i + 1) % len(users)].id)
+    large_count, large = _global_analytics_queries(count_queries)
+
+    assert large['total_responses'] == 2 + 12 * 40
+    assert large_count == small_count
+    assert small_count <= 10
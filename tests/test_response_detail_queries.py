@@ -0,0 +1,27 @@
+"""
+Страница и API деталей ответа выполняют одно и то же число запросов при любом числе вопросов
+"""
+
+from conftest import create_survey, add_responses
+
+def _request_queries(client, count_queries, url):
+    client.get(url)  # Прогрев: загрузка пользователя, кеши процесса
+    with count_queries() as queries:
+        response = client.get(url)
+    assert response.status_code == 200
+    return len(queries)
+
+def _detail_queries(admin, admin_client, count_queries, question_count):
+    survey = create_survey(admin, question_count)
+    response_id = add_responses(survey, 3)[1]
+    return (
+        _request_queries(admin_client, count_queries, f'/surveys/{survey.id}/response/{response_id}'),
+        _request_queries(admin_client, count_queries, f'/api/survey/{survey.id}/response/{response_id}/details'),
+    )
+
+def test_response_detail_query_count_does_not_grow_with_questions(app, admin, admin_client, count_queries):
+    page_small, api_small = _detail_queries(admin, admin_client, count_queries, 2)
+    page_large, api_large = _detail_queries(admin, admin_client, count_queries, 20)
+
+    assert page_large == page_small
+    assert api_large == api_small
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Выделение терминов из текстовых ответов BG Survey Platform
+
+Текст разбивается на слова, стоп-слова отбрасываются, остальные слова
+приводятся к основе: русские - стеммером Snowball (Портера для русского
+языка), английские - облегченным стеммером Портера (шаги 1a-1c и частые
+словообразовательные суффиксы). Основа используется как ключ частотного
+словаря вопроса, а первая встреченная словоформа - для отображения.
+"""
+
+import re
+
+MIN_WORD_LENGTH = 3
+
+WORD_PATTERN = re.compile(r"[a-zа-яё]+")
+
+RUSSIAN_STOPWORDS = frozenset("""
+и в во не что он на я с со как а то все всё она так его но да ты к у же вы за бы по только ее её мне
+было вот от меня еще ещё нет о из ему теперь когда даже ну вдруг ли если уже или ни быть был него
+до вас нибудь опять уж вам ведь там потом себя ничего ей может они тут где есть надо ней для мы
+тебя их чем была сам чтоб без будто чего раз тоже себе под будет ж тогда кто этот того потому
+этого какой совсем ним здесь этом один почти мой тем чтобы нее неё сейчас были куда зачем всех
+никогда можно при наконец два об другой хоть после над больше тот через эти нас про всего них
+какая много разве три эту моя впрочем хорошо свою этой перед иногда лучше чуть том нельзя такой
+им более всегда конечно всю между это эта эти этих этим этими также очень который которая
+которые которых которого которой которую свой своя свои своих весь вся всё всем всеми каждый
+просто было будут буду будем есть нужно наш наша наши ваш ваша ваши тех тому самый самая
+""".split())
+
+ENGLISH_STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below
+between both but by can could did do does doing down during each few for from further had has
+have having he her here hers herself him himself his how i if in into is it its itself just me
+more most my myself no nor not now of off on once only or other our ours ourselves out over own
+same she should so some such than that the their theirs them themselves then there these they
+this those through to too under until up very was we were what when where which while who whom
+why will with would you your yours yourself yourselves also get got really
+""".split())
+
+STOPWORDS = RUSSIAN_STOPWORDS | ENGLISH_STOPWORDS
+
+# ==================== СТЕММЕР РУССКОГО ЯЗЫКА (SNOWBALL) ====================
+
+RUSSIAN_VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_1 = ('вшись', 'вши', 'в')  # после а/я
+PERFECTIVE_GERUND_2 = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+ADJECTIVE = ('ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой',
+             'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею')
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')  # после а/я
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+REFLEXIVE = ('ся', 'сь')
+VERB_1 = ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют', 'ны', 'ть',
+          'й', 'л', 'н')  # после а/я
+VERB_2 = ('ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено', 'ует', 'уют',
+          'ены', 'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю')
+NOUN = ('иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей',
+        'ой', 'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья', 'а', 'е', 'и', 'й',
+        'о', 'у', 'ы', 'ь', 'ю', 'я')
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+def _russian_regions(word):
+    """Позиции областей RV и R2 алгоритма Snowball"""
+    rv = r1 = r2 = len(word)
+    for index, char in enumerate(word):
+        if char in RUSSIAN_VOWELS:
+            rv = index + 1
+            break
+    for index in range(1, len(word)):
+        if word[index - 1] in RUSSIAN_VOWELS and word[index] not in RUSSIAN_VOWELS:
+            r1 = index + 1
+            break
+    for index in range(r1 + 1, len(word)):
+        if word[index - 1] in RUSSIAN_VOWELS and word[index] not in RUSSIAN_VOWELS:
+            r2 = index + 1
+            break
+    return rv, r2
+
+def _strip_suffix(word, start, suffixes, preceded_by=None):
+    """Удаляет самое длинное окончание из списка, если оно целиком лежит в области start"""
+    region = word[start:]
+    for suffix in sorted(suffixes, key=len, reverse=True):
+        if not region.endswith(suffix):
+            continue
+        if preceded_by is not None:
+            head = region[:-len(suffix)]
+            if not head or head[-1] not in preceded_by:
+                continue
+        return word[:-len(suffix)]
+    return None
+
+def stem_russian(word):
+    """Основа русского слова по алгоритму Snowball"""
+    word = word.replace('ё', 'е')
+    rv, r2 = _russian_regions(word)
+
+    # Шаг 1: деепричастия, либо возвратные частицы и затем прилагательные/глаголы/существительные
+    stripped = (_strip_suffix(word, rv, PERFECTIVE_GERUND_1, preceded_by='ая')
+                or _strip_suffix(word, rv, PERFECTIVE_GERUND_2))
+    if stripped is not None:
+        word = stripped
+    else:
+        word = _strip_suffix(word, rv, REFLEXIVE) or word
+        adjective = _strip_suffix(word, rv, ADJECTIVE)
+        if adjective is not None:
+            word = (_strip_suffix(adjective, rv, PARTICIPLE_1, preceded_by='ая')
+                    or _strip_suffix(adjective, rv, PARTICIPLE_2)
+                    or adjective)
+        else:
+            word = (_strip_suffix(word, rv, VERB_1, preceded_by='ая')
+                    or _strip_suffix(word, rv, VERB_2)
+                    or _strip_suffix(word, rv, NOUN)
+                    or word)
+
+    # Шаг 2
+    if word[rv:].endswith('и'):
+        word = word[:-1]
+
+    # Шаг 3: словообразовательные суффиксы в R2
+    word = _strip_suffix(word, r2, DERIVATIONAL) or word
+
+    # Шаг 4: превосходная степень, двойное "н" и мягкий знак
+    if word[rv:].endswith('нн'):
+        word = word[:-1]
+    else:
+        superlative = _strip_suffix(word, rv, SUPERLATIVE)
+        if superlative is not None:
+            word = superlative
+            if word[rv:].endswith('нн'):
+                word = word[:-1]
+        elif word[rv:].endswith('ь'):
+            word = word[:-1]
+    return word
+
+# ==================== СТЕММЕР АНГЛИЙСКОГО ЯЗЫКА ====================
+
+ENGLISH_VOWELS = 'aeiouy'
+
+ENGLISH_SUFFIXES = (
+    ('ational', 'ate'), ('tional', 'tion'), ('ization', 'ize'), ('fulness', 'ful'), ('ousness', 'ous'),
+    ('iveness', 'ive'), ('biliti', 'ble'), ('ation', 'ate'), ('alism', 'al'), ('aliti', 'al'),
+    ('iviti', 'ive'), ('ement', ''), ('ness', ''), ('ment', ''), ('able', ''), ('ible', ''),
+)
+
+def _has_vowel(part):
+    return any(char in ENGLISH_VOWELS for char in part)
+
+def stem_english(word):
+    """Основа английского слова (шаги 1a-1c алгоритма Портера и частые суффиксы)"""
+    if len(word) <= 3:
+        return word
+
+    # Шаг 1a: множественное число
+    if word.endswith('sses'):
+        word = word[:-2]
+    elif word.endswith(('ied', 'ies')):
+        word = word[:-3] + ('i' if len(word) > 4 else 'ie')
+    elif word.endswith('s') and not word.endswith(('us', 'ss')) and _has_vowel(word[:-2]):
+        word = word[:-1]
+
+    # Шаг 1b: -ed, -ing, -eed
+    if word.endswith(('eedly', 'eed')):
+        word = word[:-3] + 'ee' if word.endswith('eed') else word[:-5] + 'ee'
+    else:
+        for suffix in ('ingly', 'edly', 'ing', 'ed'):
+            if word.endswith(suffix) and _has_vowel(word[:-len(suffix)]):
+                word = word[:-len(suffix)]
+                if word.endswith(('at', 'bl', 'iz')):
+                    word += 'e'
+                elif len(word) > 2 and word[-1] == word[-2] and word[-1] in 'bdfgmnprt':
+                    word = word[:-1]
+                break
+
+    # Шаг 1c: конечное y после согласной
+    if len(word) > 2 and word[-1] == 'y' and word[-2] not in ENGLISH_VOWELS:
+        word = word[:-1] + 'i'
+
+    for suffix, replacement in ENGLISH_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)] + replacement
+    return word
+
+# ==================== ВЫДЕЛЕНИЕ ТЕРМИНОВ ====================
+
+def stem(word):
+    """Основа слова: русский или английский стеммер по алфавиту слова"""
+    if word[0] in 'abcdefghijklmnopqrstuvwxyz':
+        return stem_english(word)
+    return stem_russian(word)
+
+def extract_terms(text):
+    """Возвращает пары (основа, словоформа) для значимых слов текста"""
+    if not text:
+        return []
+    terms = []
+    for word in WORD_PATTERN.findall(text.lower()):
+        word = word.replace('ё', 'е')
+        if len(word) < MIN_WORD_LENGTH or word in STOPWORDS:
+            continue
+        terms.append((stem(word), word))
+    return terms